@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Autoajuste de throughput da detecção.
+
+Uma calibração curta roda o pipeline real sobre uma amostra de janelas do
+próprio raster e mede a vazão de combinações de lote, threads intra-op,
+tamanho de janela e número de processos. A busca é por coordenadas (um
+parâmetro por vez, partindo do melhor até então) e respeita um orçamento
+de tempo. A configuração vencedora fica num JSON em disco, indexada por
+(SHA-256 do modelo, assinatura da CPU, provider), e as execuções seguintes
+já começam com ela.
+
+A vazão comparada é a área nova do raster por segundo (janelas/s vezes a
+área que cada janela acrescenta além da sobreposição), para que janelas de
+tamanhos diferentes sejam comparáveis.
+"""
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+
+DEFAULT_BATCHES = (1, 2, 4, 8)
+DEFAULT_WINDOW_SCALES = (1.0, 0.8, 0.67)
+# tempo máximo de calibração (s); candidatos restantes são ignorados
+DEFAULT_BUDGET_S = 60.0
+
+
+def cpu_signature() -> str:
+    """Modelo da CPU + núcleos lógicos + arquitetura, estável entre execuções."""
+    model = ""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8", errors="ignore") as handle:
+            for line in handle:
+                if line.lower().startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    if not model:
+        model = platform.processor() or platform.machine()
+    return f"{model} | {os.cpu_count() or 1} cpus | {platform.machine()}"
+
+
+def tune_key(model_sha256: str, provider: str, cpu: str = None) -> str:
+    cpu = cpu or cpu_signature()
+    cpu_hash = hashlib.sha1(cpu.encode("utf-8")).hexdigest()[:12]
+    return f"{model_sha256[:16]}:{cpu_hash}:{provider}"
+
+
+def default_cache_path() -> str:
+    return os.path.join(os.path.expanduser("~"), ".netflora", "autotune.json")
+
+
+class TuneCache:
+    """Configurações ajustadas em um arquivo JSON (escrita atômica)."""
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_path()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, config):
+        with self._lock:
+            data = self._load()
+            data[key] = config
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as handle:
+                json.dump(data, handle, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def thread_candidates(cores=None):
+    cores = max(1, int(cores or os.cpu_count() or 1))
+    return sorted({cores, max(1, cores // 2), max(1, cores // 4)}, reverse=True)
+
+
+def worker_candidates(cores=None):
+    """Processos a testar: só com 4+ núcleos, cada um com pelo menos 2 threads."""
+    cores = max(1, int(cores or os.cpu_count() or 1))
+    return [w for w in (2, 4, 8) if w * 2 <= cores]
+
+
+def search(measure_single, measure_sharded=None, *, cores=None, max_batch=8,
+           window_scales=DEFAULT_WINDOW_SCALES, batches=DEFAULT_BATCHES,
+           budget_s=DEFAULT_BUDGET_S, log=None):
+    """
+    Busca por coordenadas. `measure_single(scale, batch, threads)` e
+    `measure_sharded(scale, batch, workers, threads_per_worker)` devolvem
+    (janelas/s, área/s) ou None se o candidato falhar. Devolve a melhor
+    configuração (dict) ou None se nada pôde ser medido.
+    """
+    log = log or (lambda msg: None)
+    t_end = time.perf_counter() + budget_s
+    best = {"score": 0.0}
+
+    def _try(cfg):
+        if time.perf_counter() > t_end:
+            return
+        if cfg["workers"] > 1:
+            res = measure_sharded(cfg["window_scale"], cfg["batch_size"], cfg["workers"], cfg["threads_per_worker"])
+        else:
+            res = measure_single(cfg["window_scale"], cfg["batch_size"], cfg["intra_op_threads"])
+        if res is None:
+            return
+        tiles_s, area_s = res
+        log(f"[Netflora] Autoajuste: janela x{cfg['window_scale']:.2f}, lote {cfg['batch_size']}, "
+            f"threads {cfg['intra_op_threads'] or cfg['threads_per_worker']}, processos {cfg['workers']} "
+            f"-> {tiles_s:.2f} janelas/s")
+        if area_s > best["score"]:
+            best.clear()
+            best.update(cfg, score=area_s, tiles_per_s=round(tiles_s, 3))
+
+    batches = [b for b in batches if b <= max(1, max_batch)] or [1]
+    base = {"window_scale": 1.0, "batch_size": min(2, batches[-1]), "intra_op_threads": 0,
+            "workers": 1, "threads_per_worker": 0}
+
+    for threads in thread_candidates(cores):
+        _try(dict(base, intra_op_threads=threads))
+    if "window_scale" not in best:
+        return None
+    tried = best["batch_size"]
+    for batch in batches:
+        if batch != tried:
+            _try(dict(best, batch_size=batch))
+    tried = best["window_scale"]
+    for scale in window_scales:
+        if scale != tried:
+            _try(dict(best, window_scale=scale))
+    if measure_sharded is not None:
+        cores = max(1, int(cores or os.cpu_count() or 1))
+        for workers in worker_candidates(cores):
+            _try(dict(best, workers=workers, intra_op_threads=0, threads_per_worker=max(1, cores // workers)))
+
+    config = {k: best[k] for k in ("window_scale", "batch_size", "intra_op_threads",
+                                   "workers", "threads_per_worker", "tiles_per_s")}
+    config["tuned_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return config
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks das partes quentes da detecção.
+
+Cada benchmark compara a implementação atual com a versão anterior
+(mantida aqui apenas como referência) e confere que os resultados batem.
+Podem ser rodados pelo console Python do QGIS:
+
+    from Netflora.common import benchmarks
+    benchmarks.bench_resize()
+
+ou pela linha de comando, no Python do QGIS/OSGeo4W, a partir da pasta de
+plugins:
+
+    python -m Netflora.common.benchmarks
+"""
+import time
+
+import numpy as np
+
+from . import inference
+
+
+def _timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _report(name, t_ref, t_new, extra=""):
+    speedup = t_ref / t_new if t_new > 0 else float("inf")
+    line = f"[Netflora] {name}: referência {t_ref * 1000:.1f} ms, atual {t_new * 1000:.1f} ms ({speedup:.1f}x)"
+    if extra:
+        line += f" {extra}"
+    print(line)
+    return speedup
+
+
+# ----------------------------- resize ----------------------------- #
+
+def _resize_bilinear_meshgrid(img_hwc, out_w, out_h):
+    """Implementação anterior: meshgrid + 4 pesos float64 por tile."""
+    in_h, in_w, C = img_hwc.shape
+    if in_h == out_h and in_w == out_w:
+        return img_hwc.copy()
+    y = np.linspace(0, in_h - 1, out_h)
+    x = np.linspace(0, in_w - 1, out_w)
+    xg, yg = np.meshgrid(x, y)
+    x0 = np.floor(xg).astype(np.int32)
+    y0 = np.floor(yg).astype(np.int32)
+    x1 = np.clip(x0 + 1, 0, in_w - 1)
+    y1 = np.clip(y0 + 1, 0, in_h - 1)
+    wa = (x1 - xg) * (y1 - yg)
+    wb = (xg - x0) * (y1 - yg)
+    wc = (x1 - xg) * (yg - y0)
+    wd = (xg - x0) * (yg - y0)
+    out = np.empty((out_h, out_w, C), dtype=img_hwc.dtype)
+    for c in range(C):
+        out[..., c] = (img_hwc[y0, x0, c] * wa + img_hwc[y0, x1, c] * wb
+                       + img_hwc[y1, x0, c] * wc + img_hwc[y1, x1, c] * wd)
+    return out
+
+
+def _preprocess_meshgrid(img_hwc):
+    img = img_hwc.astype(np.float32) / 255.0
+    img = _resize_bilinear_meshgrid(img, 640, 640)
+    img = np.transpose(img, (2, 0, 1))
+    return img[None, ...].astype(np.float32)
+
+
+def bench_resize(window=1024, repeat=5, seed=0):
+    """
+    Tile uint8 window x window -> tensor [1,3,640,640], como no pipeline.
+    A referência zera a última linha/coluna (pesos nulos na borda), então a
+    comparação numérica usa só o interior.
+    """
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (window, window, 3), dtype=np.uint8)
+
+    ref = _preprocess_meshgrid(img)
+    new = inference._preprocess(img)
+    err = float(np.abs(ref[..., :-1, :-1] - new[..., :-1, :-1]).max())
+    assert err < 1e-4, f"resize diverge da referência (erro máx. {err})"
+
+    t_ref = _timeit(lambda: _preprocess_meshgrid(img), repeat)
+    t_new = _timeit(lambda: inference._preprocess(img), repeat)
+    return _report(f"preprocess {window}->640", t_ref, t_new, f"erro máx. {err:.1e}")
+
+
+# ------------------------------ NMS ------------------------------- #
+
+def _center_inside(a, b):
+    cx = (a[0] + a[2]) / 2.0
+    cy = (a[1] + a[3]) / 2.0
+    return b[0] <= cx <= b[2] and b[1] <= cy <= b[3]
+
+
+def _iou(a, b):
+    xA = max(a[0], b[0]); yA = max(a[1], b[1])
+    xB = min(a[2], b[2]); yB = min(a[3], b[3])
+    inter = max(0, xB - xA) * max(0, yB - yA)
+    if inter <= 0:
+        return 0.0
+    areaA = (a[2] - a[0]) * (a[3] - a[1])
+    areaB = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(areaA + areaB - inter)
+
+
+def _nms_reference(dets, iou_threshold=0.64, per_class=False):
+    """Implementação anterior (O(n²), pop(0) e lista reconstruída a cada caixa)."""
+    if not dets:
+        return []
+    dets = sorted(dets, key=lambda x: x[5], reverse=True)
+    keep = []
+    while dets:
+        best = dets.pop(0)
+        keep.append(best)
+        dets = [d for d in dets
+                if not ((not per_class or d[4] == best[4])
+                        and (_iou(d, best) >= iou_threshold or _center_inside(d, best)))]
+    return keep
+
+
+def synthetic_detections(n, *, n_windows_overlap=4, n_classes=3, seed=0,
+                         extent_m=None, crown_m=(2.0, 12.0)):
+    """
+    Detecções sintéticas parecidas com as de um povoamento denso: copas
+    espalhadas, cada uma vista por até `n_windows_overlap` janelas com
+    caixas levemente deslocadas e confianças diferentes.
+    """
+    rng = np.random.default_rng(seed)
+    n_obj = max(1, n // n_windows_overlap)
+    if extent_m is None:
+        extent_m = float(np.sqrt(n_obj) * 10.0)
+    cx = rng.uniform(0, extent_m, n_obj) + 500000.0
+    cy = rng.uniform(0, extent_m, n_obj) + 9000000.0
+    size = rng.uniform(crown_m[0], crown_m[1], n_obj)
+    cls = rng.integers(0, n_classes, n_obj)
+    idx = rng.integers(0, n_obj, n)
+    jitter = rng.normal(0.0, 0.08, (n, 4)) * size[idx, None]
+    half = size[idx] / 2.0
+    boxes = np.empty((n, 6), dtype=np.float64)
+    boxes[:, 0] = cx[idx] - half + jitter[:, 0]
+    boxes[:, 1] = cy[idx] - half + jitter[:, 1]
+    boxes[:, 2] = cx[idx] + half + jitter[:, 2]
+    boxes[:, 3] = cy[idx] + half + jitter[:, 3]
+    boxes[:, 4] = cls[idx]
+    boxes[:, 5] = np.round(rng.uniform(0.05, 1.0, n), 3)  # gera empates de confiança
+    return boxes
+
+
+def check_nms_equivalence(sizes=(0, 1, 2, 50, 500, 3000), thresholds=(0.85, 0.64, 0.3, 0.0), seed=0):
+    """Confere que o NMS atual devolve exatamente as caixas da referência."""
+    for n in sizes:
+        dets = [tuple(r) for r in synthetic_detections(n, seed=seed + n).tolist()] if n else []
+        for thr in thresholds:
+            for per_class in (False, True):
+                ref = _nms_reference(dets, thr, per_class=per_class)
+                new = inference.apply_iou_nms_with_center_overlap(dets, thr, per_class=per_class)
+                assert new == ref, f"NMS diverge (n={n}, iou={thr}, per_class={per_class})"
+    print(f"[Netflora] NMS equivalente à referência para n={list(sizes)}")
+    return True
+
+
+def bench_nms(n=5000, iou_threshold=0.85, repeat=3, seed=0, big_n=200_000):
+    """
+    Compara com a referência em `n` caixas e mede só a versão atual em
+    `big_n` caixas (a referência levaria minutos).
+    """
+    dets = [tuple(r) for r in synthetic_detections(n, seed=seed).tolist()]
+    t_ref = _timeit(lambda: _nms_reference(dets, iou_threshold), 1)
+    t_new = _timeit(lambda: inference.apply_iou_nms_with_center_overlap(dets, iou_threshold), repeat)
+    speedup = _report(f"NMS n={n}", t_ref, t_new)
+    if big_n:
+        from .nms import nms_center_overlap
+        big = synthetic_detections(big_n, seed=seed)
+        t_big = _timeit(lambda: nms_center_overlap(big, iou_threshold), 1)
+        print(f"[Netflora] NMS n={big_n}: atual {t_big:.2f} s")
+    return speedup
+
+
+# ---- relatório ----
+
+_REPORT_NAMES = ("Açaí", "Castanheira", "Murumuru", "Palmeira", "Ucuuba")
+
+
+def synthetic_report_columns(n, *, seed=0):
+    """Colunas no formato de report_columns() (class_id, conf, width, height, nomes)."""
+    boxes = synthetic_detections(n, n_classes=len(_REPORT_NAMES), seed=seed)
+    class_id = boxes[:, 4].astype(np.int64)
+    names = np.array(_REPORT_NAMES, dtype=object)
+    return {
+        "class_id": class_id, "conf": boxes[:, 5],
+        "width": np.round(boxes[:, 2] - boxes[:, 0], 2), "height": np.round(boxes[:, 3] - boxes[:, 1], 2),
+        "common_name": names[class_id], "sci_name": names[class_id],
+    }
+
+
+def _report_frame_reference(columns):
+    """Montagem anterior: um dict por feição, depois o DataFrame."""
+    import pandas as pd
+
+    rows = zip(*(columns[k].tolist() for k in ("class_id", "conf", "width", "height", "common_name", "sci_name")))
+    records = []
+    for cid, conf, w, h, common, sci in rows:
+        records.append({
+            "class_id": cid,
+            "conf": float(conf) if conf is not None else None,
+            "width": float(w) if w is not None else None,
+            "height": float(h) if h is not None else None,
+            "common_name": common,
+            "sci_name": sci,
+        })
+    return pd.DataFrame(records)
+
+
+def bench_report(sizes=(10_000, 100_000, 1_000_000), repeat=3, seed=0, pdf=True, hist_max_n=None):
+    """
+    Monta o DataFrame do relatório a partir das colunas (atual) e por
+    registros (referência) e, com `pdf`, gera o PDF completo a partir dos
+    arrays (com histograma + KDE até `hist_max_n` detecções, None = sempre).
+    """
+    import os
+    import tempfile
+
+    import pandas as pd
+
+    generate_report = None
+    if pdf:
+        try:
+            from .report import generate_report
+        except ImportError as exc:
+            print(f"[Netflora] PDF do relatório não medido ({exc})")
+    for n in sizes:
+        columns = synthetic_report_columns(n, seed=seed)
+        t_ref = _timeit(lambda: _report_frame_reference(columns), 1)
+        t_new = _timeit(lambda: pd.DataFrame(columns), repeat)
+        _report(f"DataFrame do relatório n={n}", t_ref, t_new)
+        if generate_report is not None:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.pdf")
+                show_hist = hist_max_n is None or n <= hist_max_n
+                t_pdf = _timeit(lambda: generate_report(None, None, "Bench", "Bench", path,
+                                                        detections=columns, show_hist=show_hist), 1)
+            print(f"[Netflora] relatório PDF n={n}: {t_pdf:.2f} s" + ("" if show_hist else " (sem histograma)"))
+
+
+def _kde_gaussian_dense(x_grid, samples, bw=None):
+    """KDE anterior do relatório: matriz densa len(x_grid) x n."""
+    from .report import _silverman_bandwidth
+
+    x = np.asarray(samples); x = x[np.isfinite(x)]
+    if x.size == 0: return np.zeros_like(x_grid, dtype=float)
+    if not bw or bw <= 0: bw = _silverman_bandwidth(x)
+    u = (x_grid[:, None] - x[None, :]) / bw
+    dens = np.exp(-0.5 * u * u).sum(axis=1) / (x.size * bw * np.sqrt(2.0 * np.pi))
+    return dens
+
+
+def _kde_samples(kind, n, rng):
+    if kind == "uniform":
+        return rng.uniform(2.0, 12.0, n)
+    if kind == "lognormal":
+        return rng.lognormal(1.5, 0.5, n)
+    if kind == "clusters":
+        return np.concatenate([rng.normal(4.0, 0.3, n - n // 3), rng.normal(15.0, 2.0, n // 3)])
+    # diâmetros arredondados a 2 casas (como na camada), com muitos empates
+    return np.round(rng.gamma(4.0, 1.5, n), 2)
+
+
+def _kde_grid(x):
+    """Mesma malha de _plot_hist_with_density."""
+    x_min, x_max = float(np.min(x)), float(np.max(x))
+    pad = 0.05 * (x_max - x_min) if x_max > x_min else 0.5
+    return np.linspace(x_min - pad, x_max + pad, 400)
+
+
+def check_kde_equivalence(sizes=(2, 10, 200, 5000), kinds=("uniform", "lognormal", "clusters", "rounded"),
+                          rtol=1e-3, seed=0):
+    """
+    Confere que a KDE binada (FFT) acompanha a densa: erro máximo até
+    `rtol` x o pico da curva, na malha usada pelo relatório.
+    """
+    from .report import _kde_gaussian, _silverman_bandwidth
+
+    rng = np.random.default_rng(seed)
+    worst = 0.0
+    for kind in kinds:
+        for n in sizes:
+            x = _kde_samples(kind, n, rng)
+            grid = _kde_grid(x)
+            bw = _silverman_bandwidth(x)
+            ref = _kde_gaussian_dense(grid, x, bw=bw)
+            new = _kde_gaussian(grid, x, bw=bw)
+            err = float(np.max(np.abs(new - ref)) / np.max(ref))
+            assert err <= rtol, f"KDE diverge ({kind}, n={n}): erro relativo {err:.1e}"
+            worst = max(worst, err)
+    print(f"[Netflora] KDE binada equivalente à densa (erro relativo máx. {worst:.1e})")
+    return True
+
+
+def bench_kde(n=20_000, repeat=3, seed=0, big_n=1_000_000):
+    """Compara com a KDE densa em `n` amostras e mede só a atual em `big_n`."""
+    from .report import _kde_gaussian, _silverman_bandwidth
+
+    rng = np.random.default_rng(seed)
+    x = _kde_samples("lognormal", n, rng)
+    grid, bw = _kde_grid(x), _silverman_bandwidth(x)
+    t_ref = _timeit(lambda: _kde_gaussian_dense(grid, x, bw=bw), 1)
+    t_new = _timeit(lambda: _kde_gaussian(grid, x, bw=bw), repeat)
+    speedup = _report(f"KDE n={n}", t_ref, t_new)
+    if big_n:
+        big = _kde_samples("lognormal", big_n, rng)
+        grid, bw = _kde_grid(big), _silverman_bandwidth(big)
+        t_big = _timeit(lambda: _kde_gaussian(grid, big, bw=bw), repeat)
+        print(f"[Netflora] KDE n={big_n}: atual {t_big * 1000:.1f} ms")
+    return speedup
+
+
+def run_all():
+    bench_resize()
+    check_nms_equivalence()
+    bench_nms()
+    check_kde_equivalence()
+    bench_kde()
+    bench_report()
+
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint de execução da detecção em SQLite.
+
+Cada janela concluída grava suas detecções brutas (antes do NMS final) num
+arquivo ao lado da saída. Se o QGIS cair ou o usuário cancelar, uma nova
+execução com o mesmo raster, modelo, tiling e filtros pula as janelas já
+gravadas e só roda as que faltam; o NMS final é feito sobre tudo.
+
+A assinatura da execução fica na tabela `meta`: se ela não bater (raster
+regravado, outro modelo, outro tiling), o checkpoint é descartado.
+Processos de trabalho (modo multiprocesso) escrevem no mesmo arquivo; o
+modo WAL do SQLite serializa as escritas.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS windows (idx INTEGER PRIMARY KEY, n INTEGER, boxes BLOB);
+"""
+# intervalo máximo entre commits (s): limita o trabalho perdido numa queda
+_COMMIT_EVERY_S = 2.0
+
+
+def raster_fingerprint(path, ds=None):
+    """Identidade do raster: caminho, tamanho/mtime do arquivo, dimensões e geotransform."""
+    info = {"path": os.path.realpath(path)}
+    try:
+        st = os.stat(path)
+        info.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+    except OSError:
+        pass
+    if ds is not None:
+        info.update(width=ds.RasterXSize, height=ds.RasterYSize,
+                    geotransform=list(ds.GetGeoTransform() or ()))
+    return info
+
+
+def run_signature(**parts) -> str:
+    """SHA-256 estável das partes que definem o resultado de cada janela."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def stored_signature(path):
+    """Assinatura gravada em `path` (None se não houver checkpoint), sem alterá-lo."""
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(path, timeout=60.0)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def _encode(boxes):
+    boxes = np.ascontiguousarray(boxes, dtype=np.float64).reshape(-1, 6)
+    return len(boxes), sqlite3.Binary(boxes.tobytes())
+
+
+def _decode(n, blob):
+    if not n:
+        return np.zeros((0, 6), dtype=np.float64)
+    return np.frombuffer(blob, dtype=np.float64).reshape(int(n), 6).copy()
+
+
+class DetectionCheckpoint:
+    """Detecções por janela de uma execução, persistidas em `path`."""
+
+    def __init__(self, path, signature, commit_every_s=_COMMIT_EVERY_S):
+        self.path = path
+        self.signature = signature
+        self.commit_every_s = commit_every_s
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._check_signature()
+
+    def _check_signature(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+            if row is None or row[0] != self.signature:
+                self._conn.execute("DELETE FROM windows")
+                self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('signature', ?)",
+                                   (self.signature,))
+                self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM windows").fetchone()[0]
+
+    def completed(self, indices=None):
+        """{idx: caixas (M, 6)} das janelas já gravadas (só `indices`, se dado)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT idx, n, boxes FROM windows").fetchall()
+        wanted = None if indices is None else set(indices)
+        return {idx: _decode(n, blob) for idx, n, blob in rows if wanted is None or idx in wanted}
+
+    def add(self, idx, boxes):
+        n, blob = _encode(boxes)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO windows(idx, n, boxes) VALUES(?, ?, ?)",
+                               (int(idx), n, blob))
+            self._pending += 1
+            if time.monotonic() - self._last_commit >= self.commit_every_s:
+                self._commit()
+
+    def _commit(self):
+        if self._pending:
+            self._conn.commit()
+            self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._commit()
+            self._conn.close()
+            self._conn = None
+
+    def discard(self):
+        """Fecha e apaga o checkpoint (execução concluída)."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento compacto das detecções.
+
+Cada caixa é um registro de 26 bytes num array estruturado do NumPy:
+x0, y0, x1, y1 em float32, classe em uint16, confiança em float32 e o índice
+da janela de origem em int32 (-1 quando desconhecido). Um (N, 6) em float64
+ocupa 48 bytes por caixa e uma tupla Python de seis floats, perto de 150.
+
+As coordenadas são guardadas como deslocamentos em relação a uma origem
+(o canto superior esquerdo do raster), não em coordenadas absolutas do
+mapa. Um float32 tem 24 bits de mantissa: em UTM (valores ~1e6-1e7) o
+valor absoluto perderia décimos de metro, mas um deslocamento de até
+100 km fica com resolução melhor que 1 cm (e, em graus, melhor que 1e-6°
+para rasters de até alguns graus), bem abaixo do tamanho de um pixel.
+
+O array cresce em blocos de tamanho fixo: acrescentar caixas nunca copia as
+já guardadas. `records` junta os blocos uma vez (e passa a usar o array
+consolidado), e as demais operações devolvem vistas ou índices sobre ele.
+"""
+import threading
+
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ("x0", np.float32), ("y0", np.float32), ("x1", np.float32), ("y1", np.float32),
+    ("cls", np.uint16), ("conf", np.float32), ("tile", np.int32),
+])
+_CHUNK_ROWS = 65536
+
+
+class DetectionStore:
+    """
+    Detecções em array estruturado (DETECTION_DTYPE) com coordenadas
+    relativas a `origin` (x, y do mapa). Iterar devolve tuplas
+    (xmin, ymin, xmax, ymax, class_id, conf) em coordenadas do mapa, como a
+    lista que run_detection devolvia antes.
+    """
+
+    def __init__(self, origin=(0.0, 0.0), chunk_rows=_CHUNK_ROWS):
+        self.origin = (float(origin[0]), float(origin[1]))
+        self._chunk_rows = max(1, int(chunk_rows))
+        self._chunks = []  # arrays de DETECTION_DTYPE; só o último tem folga
+        self._fill = 0     # linhas ocupadas no último bloco
+        self._n = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_boxes(cls, boxes, origin=None, tile=-1):
+        """Store a partir de um (N, 6) no layout de run_detection."""
+        if isinstance(boxes, DetectionStore):
+            return boxes
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        if origin is None:
+            origin = (boxes[:, 0].min(), boxes[:, 1].min()) if len(boxes) else (0.0, 0.0)
+        store = cls(origin, chunk_rows=max(len(boxes), 1))
+        store.append(boxes, tile)
+        return store
+
+    @classmethod
+    def _wrap(cls, records, origin):
+        store = cls(origin, chunk_rows=max(len(records), 1))
+        if len(records):
+            store._chunks = [records]
+            store._fill = store._n = len(records)
+        return store
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        return iter(_boxes_to_tuples(self.boxes()))
+
+    def append(self, boxes, tile=-1):
+        """Acrescenta um (N, 6) em coordenadas do mapa, vindo da janela `tile`."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        if not len(boxes):
+            return
+        rec = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+        ox, oy = self.origin
+        rec["x0"] = boxes[:, 0] - ox
+        rec["y0"] = boxes[:, 1] - oy
+        rec["x1"] = boxes[:, 2] - ox
+        rec["y1"] = boxes[:, 3] - oy
+        rec["cls"] = boxes[:, 4]
+        rec["conf"] = boxes[:, 5]
+        rec["tile"] = tile
+        with self._lock:
+            pos = 0
+            while pos < len(rec):
+                if not self._chunks or self._fill == len(self._chunks[-1]):
+                    self._chunks.append(np.empty(self._chunk_rows, dtype=DETECTION_DTYPE))
+                    self._fill = 0
+                chunk = self._chunks[-1]
+                take = min(len(chunk) - self._fill, len(rec) - pos)
+                chunk[self._fill:self._fill + take] = rec[pos:pos + take]
+                self._fill += take
+                pos += take
+            self._n += len(rec)
+
+    @property
+    def records(self):
+        """Array estruturado (N,) com todas as caixas, sem folga."""
+        with self._lock:
+            if not self._chunks:
+                return np.empty(0, dtype=DETECTION_DTYPE)
+            if len(self._chunks) == 1:
+                return self._chunks[0][:self._n]
+            merged = np.concatenate(self._chunks[:-1] + [self._chunks[-1][:self._fill]])
+            self._chunks = [merged]
+            self._fill = len(merged)
+            return merged
+
+    def local_boxes(self, index=None):
+        """(N, 6) float64 com coordenadas relativas à origem (entrada do NMS)."""
+        rec = self.records if index is None else self.records[index]
+        out = np.empty((len(rec), 6), dtype=np.float64)
+        for i, name in enumerate(("x0", "y0", "x1", "y1", "cls", "conf")):
+            out[:, i] = rec[name]
+        return out
+
+    def boxes(self, index=None):
+        """(N, 6) float64 em coordenadas do mapa."""
+        out = self.local_boxes(index)
+        out[:, (0, 2)] += self.origin[0]
+        out[:, (1, 3)] += self.origin[1]
+        return out
+
+    def subset(self, index):
+        """Novo store com as caixas `index` (máscara ou índices), mesma origem."""
+        return DetectionStore._wrap(self.records[index], self.origin)
+
+    def ordered(self):
+        """Caixas em ordem de janela (estável: dentro da janela, a ordem de chegada)."""
+        tile = self.records["tile"]
+        if len(tile) < 2 or np.all(tile[1:] >= tile[:-1]):
+            return self
+        return self.subset(np.argsort(tile, kind="stable"))
+
+    def in_bbox(self, xmin, ymin, xmax, ymax):
+        """Índices das caixas que tocam o retângulo (coordenadas do mapa; aceita ±inf)."""
+        rec = self.records
+        ox, oy = self.origin
+        hit = (rec["x1"] >= xmin - ox) & (rec["x0"] <= xmax - ox) & \
+              (rec["y1"] >= ymin - oy) & (rec["y0"] <= ymax - oy)
+        return np.flatnonzero(hit)
+
+
+def _boxes_to_tuples(boxes):
+    return [(a, b, c, d, int(e), f) for a, b, c, d, e, f in boxes.tolist()]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação direta das detecções para formatos colunares, sem passar pelo
+QgsFeatureSink: FlatGeobuf (com índice espacial), GeoParquet e GeoPackage.
+
+As colunas de atributos e o WKB das caixas (common.wkb) são montados em
+bloco a partir dos arrays. Com pyarrow e GDAL >= 3.8, cada bloco vira um
+RecordBatch gravado com Layer.WriteArrow (a coluna de geometria é um
+binário montado direto do buffer WKB, sem um objeto Python por caixa). Sem
+eles, cai na gravação OGR em lote: ogr.Feature por caixa, dentro de
+transações por bloco quando o driver suporta.
+"""
+import os
+
+import numpy as np
+from osgeo import ogr, osr
+
+from .wkb import WKB_POLYGON_DTYPE, boxes_to_wkb, boxes_to_wkb_array
+
+try:
+    import pyarrow as pa
+    _HAS_ARROW = True
+except Exception:
+    _HAS_ARROW = False
+
+EXPORT_DRIVERS = {".fgb": "FlatGeobuf", ".parquet": "Parquet", ".gpkg": "GPKG"}
+EXPORT_FILE_FILTER = "FlatGeobuf (*.fgb);;GeoParquet (*.parquet);;GeoPackage (*.gpkg)"
+_LAYER_OPTIONS = {
+    "FlatGeobuf": ["SPATIAL_INDEX=YES"],
+    "Parquet": ["GEOMETRY_ENCODING=WKB"],
+    "GPKG": ["SPATIAL_INDEX=YES"],
+}
+_OGR_TYPES = {"str": ogr.OFTString, "int": ogr.OFTInteger, "float": ogr.OFTReal}
+# caixas por bloco gravado
+_CHUNK = 50000
+
+
+def _arrow_types():
+    return {"str": pa.string(), "int": pa.int32(), "float": pa.float64()}
+
+
+def _wkb_array(boxes):
+    """Coluna Arrow binária com o WKB das caixas, montada direto dos buffers."""
+    data = boxes_to_wkb_array(boxes)
+    offsets = np.arange(len(boxes) + 1, dtype=np.int32) * WKB_POLYGON_DTYPE.itemsize
+    buffers = [None, pa.py_buffer(offsets), pa.py_buffer(data.view(np.uint8))]
+    return pa.Array.from_buffers(pa.binary(), len(boxes), buffers)
+
+
+def _write_arrow(lyr, boxes, columns, chunk):
+    types = _arrow_types()
+    schema = pa.schema(
+        [pa.field(name, types[kind]) for name, kind, _ in columns]
+        + [pa.field("geometry", pa.binary(), metadata={b"ARROW:extension:name": b"ogc.wkb"})]
+    )
+    for start in range(0, len(boxes), chunk):
+        stop = start + chunk
+        arrays = [pa.array(values[start:stop], type=types[kind]) for _, kind, values in columns]
+        arrays.append(_wkb_array(boxes[start:stop]))
+        lyr.WriteArrow(pa.RecordBatch.from_arrays(arrays, schema=schema), options=["GEOMETRY_NAME=geometry"])
+
+
+def _write_features(lyr, boxes, columns, chunk):
+    for name, kind, _ in columns:
+        lyr.CreateField(ogr.FieldDefn(name, _OGR_TYPES[kind]))
+    defn = lyr.GetLayerDefn()
+    transactions = bool(lyr.TestCapability(ogr.OLCTransactions))
+    for start in range(0, len(boxes), chunk):
+        stop = start + chunk
+        if transactions:
+            lyr.StartTransaction()
+        values = [v[start:stop] for _, _, v in columns]
+        for row, wkb in zip(zip(*values), boxes_to_wkb(boxes[start:stop])):
+            feature = ogr.Feature(defn)
+            for i, value in enumerate(row):
+                feature.SetField(i, value)
+            feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+            lyr.CreateFeature(feature)
+        if transactions:
+            lyr.CommitTransaction()
+
+
+def export_detections(path, boxes, columns, srs_wkt, *, layer_name="detections", chunk=_CHUNK):
+    """
+    Grava as caixas (N, 6) em `path`; o formato vem da extensão (.fgb,
+    .parquet, .gpkg). `columns` é uma lista de (nome, tipo, valores), tipo
+    "str" | "int" | "float", com um valor por caixa. Devolve o método de
+    gravação usado ("arrow" ou "ogr").
+    """
+    ext = os.path.splitext(path)[1].lower()
+    driver_name = EXPORT_DRIVERS.get(ext)
+    if driver_name is None:
+        raise ValueError(f"Unsupported export format '{ext}' (use {', '.join(EXPORT_DRIVERS)})")
+    driver = ogr.GetDriverByName(driver_name)
+    if driver is None:
+        raise RuntimeError(f"GDAL/OGR driver '{driver_name}' is not available in this installation")
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    ds = driver.CreateDataSource(path)
+    if ds is None:
+        raise RuntimeError(f"Could not create {path}")
+    srs = osr.SpatialReference()
+    if srs_wkt:
+        srs.ImportFromWkt(srs_wkt)
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    lyr = ds.CreateLayer(layer_name, srs if srs_wkt else None, ogr.wkbPolygon,
+                         options=_LAYER_OPTIONS.get(driver_name, []))
+    if lyr is None:
+        raise RuntimeError(f"Could not create layer '{layer_name}' in {path}")
+    try:
+        if _HAS_ARROW and hasattr(lyr, "WriteArrow"):
+            _write_arrow(lyr, boxes, columns, chunk)
+            return "arrow"
+        _write_features(lyr, boxes, columns, chunk)
+        return "ogr"
+    finally:
+        lyr = None
+        ds = None  # fecha e grava (índice espacial do FlatGeobuf é montado aqui)
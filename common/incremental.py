@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Redetecção incremental de ortomosaicos atualizados.
+
+Depois de um revoo parcial o mosaico é reexportado, mas só uma pequena parte
+dos blocos muda. O repositório guarda, por janela, um hash do conteúdo lido
+(já com padding e área inválida zerada, exatamente o que entra no modelo) e
+as detecções brutas dessa janela. Na execução seguinte cada janela ainda é
+lida, mas só vai para a inferência se o hash mudou; as demais reaproveitam
+as caixas guardadas, e o NMS final roda sobre o conjunto emendado.
+
+Ao contrário do checkpoint, o repositório não depende do arquivo do raster
+(tamanho, data): a assinatura cobre só dimensões, georreferência, modelo,
+tiling e filtros, e o arquivo sobrevive à execução. O nome do arquivo também
+vem da assinatura: um mosaico reexportado com outro nome encontra o mesmo
+repositório. Entradas de janelas que
+não foram lidas nesta execução ficam no arquivo: só são reaproveitadas se o
+hash voltar a bater, e então as caixas continuam válidas.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from .checkpoint import _decode, _encode
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS windows (
+    idx INTEGER PRIMARY KEY, x INTEGER, y INTEGER, ww INTEGER, hh INTEGER,
+    digest BLOB, n INTEGER, boxes BLOB
+);
+"""
+
+
+def window_digest(img) -> bytes:
+    """Hash (16 bytes) dos pixels de uma janela lida."""
+    return hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16).digest()
+
+
+class IncrementalStore:
+    """Hash e detecções brutas por janela da última execução sobre um raster."""
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+        if row is None or row[0] != signature:
+            self._conn.execute("DELETE FROM windows")
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('signature', ?)", (signature,))
+            self._conn.commit()
+        self._known = {
+            idx: ((x, y, ww, hh), bytes(digest))
+            for idx, x, y, ww, hh, digest in self._conn.execute(
+                "SELECT idx, x, y, ww, hh, digest FROM windows")
+        }
+        self.reused = 0
+        self.changed = 0
+
+    def __len__(self):
+        return len(self._known)
+
+    def lookup(self, win, digest):
+        """Caixas guardadas da janela se o conteúdo não mudou; senão None."""
+        known = self._known.get(win[0])
+        if known is None or known[0] != tuple(win[1:5]) or known[1] != digest:
+            with self._lock:
+                self.changed += 1
+            return None
+        with self._lock:
+            n, blob = self._conn.execute("SELECT n, boxes FROM windows WHERE idx=?", (win[0],)).fetchone()
+            self.reused += 1
+        return _decode(n, blob)
+
+    def record(self, win, digest, boxes):
+        n, blob = _encode(boxes)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO windows(idx, x, y, ww, hh, digest, n, boxes) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(win[0]), int(win[1]), int(win[2]), int(win[3]), int(win[4]),
+                 sqlite3.Binary(digest), n, blob))
+            # commit por janela: outros processos escrevem no mesmo arquivo
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
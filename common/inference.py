@@ -1,43 +1,80 @@
 # -*- coding: utf-8 -*-
 import os
+import functools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 import numpy as np
 from osgeo import gdal
 import subprocess
 import shutil
 
+from .pipeline import TilePipeline, PipelineCanceled
+from .nms import nms_center_overlap
+from .tiling import overlap_px, plan_windows
+from .validity import build_validity_map
+from .incremental import window_digest
+from .streaming import RowStreamNMS, _NO_BOXES
+from .detections import DetectionStore
+from .session_cache import DEFAULT_BUDGET_MB, model_digest, process_rss_mb, session_cache
+
+@functools.lru_cache(maxsize=16)
+def _resize_tables(in_h: int, in_w: int, out_h: int, out_w: int, channels: int):
+    """
+    Índices e pesos (float32) do bilinear separável para uma geometria
+    (in_h, in_w, C) -> (out_h, out_w, C). Todas as janelas de uma execução têm
+    a mesma geometria, então as tabelas são calculadas uma única vez.
+    As tabelas de coluna já vêm expandidas por canal, para indexar a imagem
+    HWC achatada em (H, W*C) com um único `np.take`.
+    """
+    def _axis(n_in, n_out):
+        pos = np.linspace(0, n_in - 1, n_out)
+        i0 = np.minimum(np.floor(pos).astype(np.intp), max(n_in - 2, 0))
+        i1 = np.minimum(i0 + 1, n_in - 1)
+        w = (pos - i0).astype(np.float32)
+        return i0, i1, w
+
+    y0, y1, wy = _axis(in_h, out_h)
+    x0, x1, wx = _axis(in_w, out_w)
+    ch = np.arange(channels)
+    cx0 = (x0[:, None] * channels + ch).ravel()
+    cx1 = (x1[:, None] * channels + ch).ravel()
+    wxc = np.repeat(wx, channels)
+    wy = wy[:, None]
+    tables = (y0, y1, wy, cx0, cx1, wxc)
+    for a in tables:
+        a.setflags(write=False)
+    return tables
+
+
 def _resize_bilinear(img_hwc: np.ndarray, out_w: int, out_h: int) -> np.ndarray:
     """
-    Redimensiona HxWxC para (out_h, out_w, C) via bilinear puro NumPy.
+    Redimensiona HxWxC para (out_h, out_w, C) em float32 com bilinear
+    separável: interpola as linhas e depois as colunas usando as tabelas
+    cacheadas de `_resize_tables`.
     """
     in_h, in_w, C = img_hwc.shape
     if in_h == out_h and in_w == out_w:
-        return img_hwc.copy()
-
-    # coordenadas alvo
-    y = np.linspace(0, in_h - 1, out_h)
-    x = np.linspace(0, in_w - 1, out_w)
-    xg, yg = np.meshgrid(x, y)
-
-    x0 = np.floor(xg).astype(np.int32)
-    y0 = np.floor(yg).astype(np.int32)
-    x1 = np.clip(x0 + 1, 0, in_w - 1)
-    y1 = np.clip(y0 + 1, 0, in_h - 1)
-
-    # pesos
-    wa = (x1 - xg) * (y1 - yg)
-    wb = (xg - x0) * (y1 - yg)
-    wc = (x1 - xg) * (yg - y0)
-    wd = (xg - x0) * (yg - y0)
-
-    out = np.empty((out_h, out_w, C), dtype=img_hwc.dtype)
-    for c in range(C):
-        Ia = img_hwc[y0, x0, c]
-        Ib = img_hwc[y0, x1, c]
-        Ic = img_hwc[y1, x0, c]
-        Id = img_hwc[y1, x1, c]
-        out[..., c] = Ia * wa + Ib * wb + Ic * wc + Id * wd
+        return img_hwc.astype(np.float32)
 
-    return out
+    y0, y1, wy, cx0, cx1, wxc = _resize_tables(in_h, in_w, out_h, out_w, C)
+    flat = img_hwc.reshape(in_h, in_w * C)
+
+    # passo vertical: (out_h, in_w*C)
+    rows = flat[y0].astype(np.float32)
+    lower = flat[y1].astype(np.float32)
+    lower -= rows
+    lower *= wy
+    rows += lower
+
+    # passo horizontal: (out_h, out_w*C)
+    out = np.take(rows, cx0, axis=1)
+    right = np.take(rows, cx1, axis=1)
+    right -= out
+    right *= wxc
+    out += right
+    return out.reshape(out_h, out_w, C)
 
 
 
@@ -82,7 +119,7 @@ def _choose_tile_from_vram(provider, total_mb, free_mb):
 # 
 # -----------------------------------------------
 
-def _load_ort_session(model_path, feedback):
+def _load_ort_session(model_path, feedback, intra_op_threads=0):
     def _log(msg):
         try: feedback.pushInfo(msg)
         except Exception: pass
@@ -101,6 +138,8 @@ def _load_ort_session(model_path, feedback):
 
     so = ort.SessionOptions()
     so.log_severity_level = 1
+    if intra_op_threads and intra_op_threads > 0:
+        so.intra_op_num_threads = int(intra_op_threads)
     if hasattr(ort, "GraphOptimizationLevel"):
         so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
 
@@ -181,22 +220,290 @@ def _log(feedback, msg):
     except Exception:
         pass
 
-def _read_tile_gdal(ds, xoff, yoff, xsize, ysize, bands=(1,2,3)):
-    arrays = []
-    for b in bands:
-        band = ds.GetRasterBand(b)
-        arr = band.ReadAsArray(xoff, yoff, xsize, ysize)
-        if arr is None:
-            return None
-        arrays.append(arr)
-    img = np.stack(arrays, axis=-1)
-    return img
+def _get_ort_session(model_path, feedback, *, cache_mb=DEFAULT_BUDGET_MB, intra_op_threads=0):
+    """
+    Sessão ORT reaproveitada do cache do processo quando o mesmo conteúdo de
+    modelo (SHA-256) já foi carregado com as mesmas opções. cache_mb <= 0
+    desliga o cache.
+    """
+    if not cache_mb or cache_mb <= 0:
+        return _load_ort_session(model_path, feedback, intra_op_threads)
+
+    cache = session_cache()
+    cache.set_budget(cache_mb)
+    key = (model_digest(model_path), int(intra_op_threads or 0))
+    with cache.build_lock:
+        hit = cache.get(key)
+        if hit is not None:
+            _log(feedback, f"[Netflora] Sessão ONNX reutilizada do cache (sha256 {key[0][:12]}, {len(cache)} em cache)")
+            return hit
+
+        rss0 = process_rss_mb()
+        sess, provider = _load_ort_session(model_path, feedback, intra_op_threads)
+        if sess is None:
+            return None, None
+        rss1 = process_rss_mb()
+        size_mb = (rss1 - rss0) if rss0 is not None and rss1 is not None else 0.0
+        if size_mb <= 0:
+            # sem psutil (ou medição ruidosa): pesos + buffers otimizados ~ 2x o arquivo
+            size_mb = 2.0 * os.path.getsize(model_path) / (1024.0 * 1024.0)
+        evicted = cache.put(key, (sess, provider), size_mb)
+        _log(feedback, f"[Netflora] Sessão ONNX em cache: ~{size_mb:.0f} MB, total {cache.used_mb:.0f}/{cache_mb:.0f} MB")
+        if evicted:
+            _log(feedback, f"[Netflora] Cache de sessões: {len(evicted)} sessão(ões) descartada(s) (LRU)")
+        return sess, provider
+
+class _TileBuffers:
+    """
+    Pool de buffers HWC reaproveitados entre janelas. Um buffer sai do pool
+    na leitura e volta depois do pré-processamento; se o pool estiver vazio
+    um novo é alocado (nunca bloqueia), e no máximo `keep` ficam guardados.
+    """
+    def __init__(self, keep=16):
+        self.keep = keep
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype):
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buf):
+        if buf is None:
+            return
+        key = (buf.shape, buf.dtype.str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.keep:
+                free.append(buf)
+
+def _band_dtype(ds, band=1):
+    return ds.GetRasterBand(band).ReadAsArray(0, 0, 1, 1).dtype
+
+_RESAMPLING = {
+    "nearest": "GRIORA_NearestNeighbour",
+    "bilinear": "GRIORA_Bilinear",
+    "cubic": "GRIORA_Cubic",
+    "average": "GRIORA_Average",
+}
+
+def _resample_alg(name):
+    return getattr(gdal, _RESAMPLING.get(str(name).lower(), "GRIORA_Bilinear"), 0)
+
+def _read_tile_gdal(ds, xoff, yoff, xsize, ysize, bands=(1,2,3), out=None,
+                    buf_size=None, resample="bilinear"):
+    """
+    Lê todas as bandas numa única chamada, em layout intercalado por pixel
+    (H, W, C), de modo que cada bloco comprimido é decodificado uma vez.
+    Com `out`, escreve em out[:ysize, :xsize] e devolve essa view.
+
+    Com `buf_size` (bw, bh) o GDAL já entrega a janela reamostrada para
+    bw x bh (em out[:bh, :bw]), usando as overviews quando o pedido é mais
+    grosso que a resolução cheia.
+    """
+    bw, bh = buf_size or (xsize, ysize)
+    if out is None:
+        out = np.empty((bh, bw, len(bands)), dtype=_band_dtype(ds, bands[0]))
+    view = out[:bh, :bw]
+    extra = {}
+    if buf_size is not None:
+        extra = dict(buf_xsize=bw, buf_ysize=bh, resample_alg=_resample_alg(resample))
+    try:
+        arr = ds.ReadAsArray(xoff, yoff, xsize, ysize, buf_obj=view,
+                             band_list=list(bands), interleave="pixel", **extra)
+    except TypeError:
+        # GDAL sem `interleave`: lê banda-intercalado e reordena no buffer
+        arr = ds.ReadAsArray(xoff, yoff, xsize, ysize, band_list=list(bands), **extra)
+        if arr is not None:
+            view[...] = np.moveaxis(arr.reshape(len(bands), bh, bw), 0, -1)
+    if arr is None:
+        return None
+    return view
+
+def _read_window(ds, x, y, ww, hh, ws, buf=None):
+    """
+    Lê a janela (x, y, ww, hh) em `buf` (ws, ws, C) e zera, no próprio
+    buffer, a área além da borda do raster.
+    Retorna None para janelas vazias (sem dados ou só zeros).
+    """
+    if buf is None:
+        buf = np.empty((ws, ws, 3), dtype=_band_dtype(ds))
+    img = _read_tile_gdal(ds, x, y, ww, hh, bands=(1,2,3), out=buf)
+    if img is None or img.size == 0 or not img.any():
+        return None
+
+    # --- Garantir padding nas bordas (in-place) ---
+    if hh < ws:
+        buf[hh:] = 0
+    if ww < ws:
+        buf[:hh, ww:] = 0
+    return buf
+
+def _decimated_size(ww, hh, ws, size):
+    """Tamanho (bw, bh) no buffer size x size de uma janela ww x hh de lado nominal ws."""
+    return max(1, int(round(ww * size / float(ws)))), max(1, int(round(hh * size / float(ws))))
+
+def _read_window_decimated(ds, x, y, ww, hh, ws, size, buf=None, resample="bilinear"):
+    """
+    Lê a janela (x, y, ww, hh) já reduzida pelo GDAL para o buffer
+    (size, size, C): o lado nominal ws vira `size` pixels e o que sobra
+    além da borda do raster fica zerado. None para janelas vazias.
+    """
+    bw, bh = _decimated_size(ww, hh, ws, size)
+    if buf is None:
+        buf = np.empty((size, size, 3), dtype=_band_dtype(ds))
+    img = _read_tile_gdal(ds, x, y, ww, hh, bands=(1,2,3), out=buf,
+                          buf_size=(bw, bh), resample=resample)
+    if img is None or img.size == 0 or not img.any():
+        return None
+    if bh < size:
+        buf[bh:] = 0
+    if bw < size:
+        buf[:bh, bw:] = 0
+    return buf
+
+# orçamento (MB) de cada faixa de linhas mantida por uma thread leitora
+_STRIP_BUDGET_MB = 256
+
+def _block_height(ds):
+    """Altura do bloco nativo (linhas); 1 quando desconhecida ou grande demais para alinhar."""
+    try:
+        return max(1, int(ds.GetRasterBand(1).GetBlockSize()[1]))
+    except Exception:
+        return 1
+
+def _strip_units(windows, ws, n_splits=1, itemsize=1, block_h=1, budget_mb=_STRIP_BUDGET_MB):
+    """
+    Agrupa as janelas em unidades de leitura por faixa de linhas:
+    (x0, x1, [(y, [janelas da linha]), ...]). Cada unidade cobre um segmento
+    de colunas [x0, x1) e linhas de janelas consecutivas, de modo que uma
+    thread lê cada pixel uma vez só e recorta as janelas da faixa em memória.
+
+    O segmento de colunas é limitado para a faixa ((ws + bloco) x largura x 3)
+    caber em `budget_mb`; as linhas de cada segmento são divididas em até
+    `n_splits` unidades para as threads leitoras trabalharem em paralelo.
+    """
+    rows = {}
+    for win in windows:
+        rows.setdefault(win[2], []).append(win)
+    ys = sorted(rows)
+    if not ys:
+        return []
+
+    max_w = int(budget_mb * 1024 * 1024 // ((ws + block_h) * 3 * itemsize))
+    max_w = max(ws, max_w)
+    xs = sorted({w[1] for w in windows})
+    right = {}
+    for win in windows:
+        right[win[1]] = max(right.get(win[1], 0), win[1] + win[3])
+    segments, seg = [], []
+    for x in xs:
+        if seg and right[x] - seg[0] > max_w:
+            segments.append(seg)
+            seg = []
+        seg.append(x)
+    segments.append(seg)
+
+    n_splits = max(1, min(int(n_splits), len(ys)))
+    chunk = -(-len(ys) // n_splits)
+    units = []
+    for seg in segments:
+        x0, x1 = seg[0], max(right[x] for x in seg)
+        cols = set(seg)
+        seg_rows = [(y, [w for w in rows[y] if w[1] in cols]) for y in ys]
+        for i in range(0, len(seg_rows), chunk):
+            part = [r for r in seg_rows[i:i + chunk] if r[1]]
+            if part:
+                units.append((x0, x1, part))
+    return units
+
+def _iter_strip(ds, unit, ws, height, dtype, buffers, block_h=1):
+    """
+    Percorre as linhas de janelas de uma unidade de `_strip_units` mantendo
+    uma faixa deslizante [b0, b1) do segmento de colunas: ao descer uma
+    linha, as linhas de sobreposição já lidas são reaproveitadas e só as
+    novas são lidas, alinhadas à altura do bloco nativo quando possível.
+    Só as colunas das janelas que usam as linhas novas são lidas, então
+    janelas descartadas nas pontas da linha não são decodificadas.
+    Gera (win, img) com img num buffer do pool (ou None se vazia).
+    """
+    x0, x1, rows = unit
+    seg_w = x1 - x0
+    if block_h > ws:
+        block_h = 1
+    cap = ws + block_h
+    strip = np.empty((cap, seg_w, 3), dtype=dtype)
+    spare = np.empty_like(strip)
+    b0 = b1 = rows[0][0]
+
+    for i, (y, wins) in enumerate(rows):
+        need = y + max(w[4] for w in wins)
+        if need > b1:
+            keep = max(0, b1 - y)
+            if keep and y > b0:
+                # sobreposição vertical: copia as linhas já lidas para o topo
+                spare[:keep] = strip[y - b0:b1 - b0]
+                strip, spare = spare, strip
+            b0, b1 = y, y + keep
+            end = min(height, -(-need // block_h) * block_h, b0 + cap)
+            users = [w for ry, row_wins in rows[i:] if ry < end for w in row_wins]
+            c0 = min(w[1] for w in users)
+            c1 = max(w[1] + w[3] for w in users)
+            out = strip[b1 - b0:end - b0, c0 - x0:c1 - x0]
+            if _read_tile_gdal(ds, c0, b1, c1 - c0, end - b1, out=out) is None:
+                raise RuntimeError(f"falha ao ler linhas {b1}-{end} do raster")
+            b1 = end
+
+        for win in wins:
+            _, x, _, ww, hh, wsz = win
+            src = strip[y - b0:y - b0 + hh, x - x0:x - x0 + ww]
+            if not src.any():
+                yield win, None
+                continue
+            buf = buffers.acquire((wsz, wsz, 3), dtype)
+            buf[:hh, :ww] = src
+            if hh < wsz:
+                buf[hh:] = 0
+            if ww < wsz:
+                buf[:hh, ww:] = 0
+            yield win, buf
 
 def _preprocess(img_hwc: np.ndarray) -> np.ndarray:
-    img = img_hwc.astype(np.float32) / 255.0
-    img = _resize_bilinear(img, 640, 640)
-    img = np.transpose(img, (2, 0, 1))
-    return img[None, ...].astype(np.float32)
+    # resize direto do uint8; a normalização é aplicada já em 640x640
+    img = _resize_bilinear(img_hwc, 640, 640)
+    img *= np.float32(1.0 / 255.0)
+    img = np.ascontiguousarray(np.transpose(img, (2, 0, 1)))
+    return img[None, ...]
+
+
+def _session_batch_limit(sess, requested: int) -> int:
+    """
+    Maior lote aceito pela entrada do modelo. Modelos exportados com batch
+    fixo (ex.: [1,3,640,640]) caem para N=1; eixos dinâmicos ("batch", None)
+    aceitam o valor pedido.
+    """
+    requested = max(1, int(requested or 1))
+    try:
+        dim = sess.get_inputs()[0].shape[0]
+    except Exception:
+        return 1
+    if isinstance(dim, int) and dim > 0:
+        return 1
+    return requested
+
+
+def _split_batch_output(outputs, n):
+    """
+    Divide a saída [N, ...] de um forward em lotes em N saídas [1, ...],
+    no mesmo formato que `_parse_output` recebe de um forward unitário.
+    """
+    if n == 1:
+        return [outputs]
+    return [[o[i:i + 1] for o in outputs] for i in range(n)]
 
 
 def import_ort_and_create_cuda_session(model_path, sess_options, cuda_opts, fallback_cpu=True):
@@ -207,176 +514,1019 @@ def import_ort_and_create_cuda_session(model_path, sess_options, cuda_opts, fall
     return ort.InferenceSession(model_path, sess_options=sess_options, providers=providers)
 
 def _parse_output(outputs):
+    """
+    Saída do modelo -> array float32 (N, 6) com (x1, y1, x2, y2, conf, cls)
+    no espaço 640x640 da entrada.
+    """
     if isinstance(outputs, (list, tuple)) and len(outputs) == 1:
         out = outputs[0]
     else:
         out = outputs
-    out = np.squeeze(out)
+    out = np.squeeze(np.asarray(out))
     if out.ndim == 1:
         out = out[None, :]
-    dets = []
-    for row in out:
-        if row.shape[-1] >= 6:
-            x1, y1, x2, y2, conf, cls = row[:6]
-            dets.append((float(x1), float(y1), float(x2), float(y2), float(conf), int(cls)))
-    return dets
-
-def center_inside(a, b):
-    cx = (a[0] + a[2]) / 2.0
-    cy = (a[1] + a[3]) / 2.0
-    return b[0] <= cx <= b[2] and b[1] <= cy <= b[3]
-
-def iou(a, b):
-    xA = max(a[0], b[0]); yA = max(a[1], b[1])
-    xB = min(a[2], b[2]); yB = min(a[3], b[3])
-    inter = max(0, xB - xA) * max(0, yB - yA)
-    if inter <= 0:
-        return 0.0
-    areaA = (a[2] - a[0]) * (a[3] - a[1])
-    areaB = (b[2] - b[0]) * (b[3] - b[1])
-    return inter / float(areaA + areaB - inter)
-
-def apply_iou_nms_with_center_overlap(dets, iou_threshold=0.64):
-    if not dets:
+    if out.ndim != 2 or out.shape[-1] < 6:
+        return np.zeros((0, 6), dtype=np.float32)
+    return np.asarray(out[:, :6], dtype=np.float32)
+
+
+# Limites de tamanho (em unidades do mapa) e de razão de aspecto das caixas.
+# Algoritmos podem sobrescrever qualquer chave (BaseDetectionAlgorithm.SIZE_FILTER)
+# e também por classe (BaseDetectionAlgorithm.CLASS_SIZE_FILTERS).
+DEFAULT_SIZE_FILTER = {
+    "min_w": 1.0, "max_w": 20.0,
+    "min_h": 1.0, "max_h": 150.0,
+    "min_ar": 0.3, "max_ar": 3.0,
+}
+_SIZE_KEYS = ("min_w", "max_w", "min_h", "max_h", "min_ar", "max_ar")
+
+
+def _size_limits(size_filter=None, class_filters=None):
+    """
+    Monta a tabela de limites e devolve `lookup(cls) -> (6, N)`, com uma
+    linha por chave de `_SIZE_KEYS` para cada classe em `cls`.
+    """
+    base = dict(DEFAULT_SIZE_FILTER)
+    base.update(size_filter or {})
+    base_row = np.array([float(base[k]) for k in _SIZE_KEYS])
+
+    class_filters = {int(k): v for k, v in (class_filters or {}).items()}
+    if not class_filters:
+        return lambda cls: np.broadcast_to(base_row[:, None], (len(_SIZE_KEYS), len(cls)))
+
+    table = np.tile(base_row, (max(class_filters) + 1, 1))
+    for cid, overrides in class_filters.items():
+        for k, v in overrides.items():
+            table[cid, _SIZE_KEYS.index(k)] = float(v)
+
+    def lookup(cls):
+        idx = np.clip(cls, 0, len(table) - 1)
+        rows = np.where(((cls >= 0) & (cls < len(table)))[:, None], table[idx], base_row)
+        return rows.T
+
+    return lookup
+
+
+def _max_object_size(size_filter=None, class_filters=None, classes=None):
+    """
+    Maior largura e altura (unidades do terreno) que passam nos filtros de
+    tamanho das classes em `classes` (todas as com filtro próprio, se None),
+    considerando também os limites de razão de aspecto.
+    """
+    base = dict(DEFAULT_SIZE_FILTER)
+    base.update(size_filter or {})
+    class_filters = {int(k): v for k, v in (class_filters or {}).items()}
+    if classes is None:
+        filters = [base] + [dict(base, **f) for f in class_filters.values()]
+    else:
+        filters = [dict(base, **class_filters.get(int(c), {})) for c in classes] or [base]
+    max_w = max(min(f["max_w"], f["max_h"] * f["max_ar"]) for f in filters)
+    max_h = max(min(f["max_h"], f["max_w"] / f["min_ar"]) if f["min_ar"] > 0 else f["max_h"]
+                for f in filters)
+    return float(max_w), float(max_h)
+
+def _decode_tile(dets, x, y, ww, hh, geo, confidence_threshold, limits, owned=None, src_size=None):
+    """
+    Converte as detecções de uma janela (saída de `_parse_output`) em caixas
+    georreferenciadas (M, 6) float64: (xmin, ymin, xmax, ymax, class_id, conf).
+    Aplica o corte de confiança e os filtros de tamanho/razão de aspecto com
+    máscaras, e uma única transformação afim por janela. Com limits None só
+    caixas degeneradas são descartadas (detecções brutas, ver _filter_boxes).
+    Com `owned` (x0, y0, x1, y1) em pixels do raster, só ficam as caixas com
+    centro nessa área (a parte da janela que ela possui no plano de tiling).
+    `src_size` é o lado da janela no raster que ocupa os 640 px do modelo
+    (ws, com o padding); sem ele vale ww/hh.
+    """
+    d = dets[dets[:, 4] >= confidence_threshold].astype(np.float64)
+    if d.size == 0:
+        return np.zeros((0, 6), dtype=np.float64)
+
+    top_left_x, res_x, top_left_y, neg_pxH, res_y = geo
+    sx = (src_size or ww) / 640.0
+    sy = (src_size or hh) / 640.0
+    x_min = d[:, 0] * sx
+    x_max = d[:, 2] * sx
+    y_min = d[:, 1] * sy
+    y_max = d[:, 3] * sy
+    cls = d[:, 5].astype(np.int64)
+
+    keep = np.ones(len(d), dtype=bool)
+    if owned is not None:
+        cx = x + (x_min + x_max) / 2.0
+        cy = y + (y_min + y_max) / 2.0
+        keep &= (cx >= owned[0]) & (cx < owned[2]) & (cy >= owned[1]) & (cy < owned[3])
+    if not keep.any():
+        return np.zeros((0, 6), dtype=np.float64)
+
+    # afim da janela: pixel local -> coordenada do mapa
+    ox = top_left_x + x * res_x
+    oy = top_left_y + y * neg_pxH
+    gx0 = ox + x_min[keep] * res_x
+    gx1 = ox + x_max[keep] * res_x
+    gy0 = oy + y_max[keep] * neg_pxH
+    gy1 = oy + y_min[keep] * neg_pxH
+    out = np.empty((int(keep.sum()), 6), dtype=np.float64)
+    out[:, 0] = gx0
+    out[:, 1] = np.minimum(gy0, gy1)
+    out[:, 2] = gx1
+    out[:, 3] = np.maximum(gy0, gy1)
+    out[:, 4] = cls[keep]
+    out[:, 5] = d[keep, 4]
+
+    # filtros sobre largura/altura como o DetectionStore as guarda: decidem igual
+    # aqui e sobre as detecções brutas do cache (_filter_boxes)
+    bw, bh = _stored_wh(out, (top_left_x, top_left_y))
+    ok = (bw > 0) & (bh > 0)
+    if limits is not None:
+        ok &= _size_mask(bw, bh, cls[keep], limits)
+    return out[ok]
+
+def _stored_wh(boxes, origin):
+    """
+    Largura e altura (float64) das caixas (N, 6) a partir das coordenadas em
+    float32 relativas a `origin`, como ficam em DetectionStore.records.
+    """
+    ox, oy = origin
+    x0, x1 = (boxes[:, (0, 2)] - ox).astype(np.float32).T
+    y0, y1 = (boxes[:, (1, 3)] - oy).astype(np.float32).T
+    return x1.astype(np.float64) - x0, y1.astype(np.float64) - y0
+
+
+def _size_mask(bw, bh, cls, limits):
+    """Caixas (largura/altura em unidades do terreno) dentro dos limites da sua classe."""
+    min_w, max_w, min_h, max_h, min_ar, max_ar = limits(cls)
+    keep = (bw >= min_w) & (bh >= min_h) & (bw <= max_w) & (bh <= max_h)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ar = np.where(bh > 0, bw / bh, 0.0)
+    return keep & (ar >= min_ar) & (ar <= max_ar)
+
+def _filter_boxes(boxes, confidence_threshold, limits):
+    """
+    Corte de confiança e filtros de tamanho sobre caixas brutas
+    georreferenciadas: (N, 6) ou DetectionStore (devolve o mesmo tipo).
+    """
+    if isinstance(boxes, DetectionStore):
+        rec = boxes.records
+        bw = rec["x1"].astype(np.float64) - rec["x0"]
+        bh = rec["y1"].astype(np.float64) - rec["y0"]
+        cls, conf = rec["cls"].astype(np.int64), rec["conf"]
+    else:
+        bw = boxes[:, 2] - boxes[:, 0]
+        bh = boxes[:, 3] - boxes[:, 1]
+        cls, conf = boxes[:, 4].astype(np.int64), boxes[:, 5]
+    keep = (conf >= confidence_threshold) & (bw > 0) & (bh > 0)
+    keep &= _size_mask(bw, bh, cls, limits)
+    return boxes.subset(keep) if isinstance(boxes, DetectionStore) else boxes[keep]
+
+def apply_iou_nms_with_center_overlap(dets, iou_threshold=0.64, per_class=False):
+    """
+    Remove duplicatas: por confiança decrescente, cada caixa mantida suprime
+    as seguintes com IoU >= iou_threshold ou com centro dentro dela.
+    `dets` é uma sequência de (xmin, ymin, xmax, ymax, class_id, conf);
+    com per_class=True apenas caixas da mesma classe competem.
+    """
+    if len(dets) == 0:
         return []
-    dets = sorted(dets, key=lambda x: x[5], reverse=True)
-    keep = []
-    while dets:
-        best = dets.pop(0)
-        keep.append(best)
-        dets = [d for d in dets if not (iou(d, best) >= iou_threshold or center_inside(d, best))]
-    return keep
-
-def run_detection(raster_layer, model_path: str, confidence_threshold: float, feedback):
+    keep = nms_center_overlap(np.asarray(dets, dtype=np.float64), iou_threshold, per_class=per_class)
+    return [dets[i] for i in keep.tolist()]
+
+class _OutOfMemory(RuntimeError):
+    pass
+
+# sinais comuns de OOM: CUBLAS/CUDNN/allocator/RESOURCE_EXHAUSTED
+_OOM_MARKERS = ("RESOURCE_EXHAUSTED", "CUBLAS", "CUDNN", "OUT OF MEMORY", "CUDA ERROR")
+
+def _make_forward(sess):
+    """
+    Função infer(tensores) para o TilePipeline: empilha os tensores em um
+    lote, roda o forward e devolve a saída de cada janela. Erros de OOM
+    viram _OutOfMemory para o chamador aplicar o backoff.
+    """
+    input_name = sess.get_inputs()[0].name
+
+    def _infer(tensors):
+        batch = tensors[0] if len(tensors) == 1 else np.concatenate(tensors, axis=0)
+        try:
+            out = sess.run(None, {input_name: batch})
+        except Exception as e:
+            if any(k in str(e).upper() for k in _OOM_MARKERS):
+                raise _OutOfMemory(str(e))
+            raise
+        return _split_batch_output(out, len(tensors))
+
+    return _infer
+
+def _raster_geo(ds):
+    """(top_left_x, res_x, top_left_y, neg_pxH, res_y) a partir do geotransform."""
+    x0, pxW, _, y0, _, neg_pxH = ds.GetGeoTransform()
+    res_y = abs(neg_pxH) if neg_pxH != 0 else pxW
+    return (x0, pxW, y0, neg_pxH, res_y)
+
+def _window_reader(image_path, windows, buffers, *, read_threads=2, strip_reads=True,
+                   validity=None, read_size=None, resample="bilinear"):
+    """
+    Unidades de leitura de `windows` e open_reader() para o TilePipeline: cada
+    thread leitora abre seu próprio handle e recebe read(unit) -> (win, img),
+    com img num buffer de `buffers` (None para janelas vazias) e a área
+    inválida já zerada pelo `validity`.
+    """
+    units = [(win,) for win in windows]
+    ws = max((w[5] for w in windows), default=0)
+    height = 0
+    block_h = 1
+    if strip_reads and windows and not read_size:
+        ds = gdal.Open(image_path, gdal.GA_ReadOnly)
+        if ds is None:
+            raise RuntimeError(f"ERRO ao abrir raster: {image_path}")
+        height = ds.RasterYSize
+        block_h = _block_height(ds)
+        units = _strip_units(windows, ws, n_splits=read_threads,
+                             itemsize=np.dtype(_band_dtype(ds)).itemsize, block_h=block_h)
+        ds = None
+
+    def _open_reader():
+        # cada thread leitora abre seu próprio handle: gdal.Dataset não é thread-safe
+        rds = gdal.Open(image_path, gdal.GA_ReadOnly)
+        if rds is None:
+            raise RuntimeError(f"ERRO ao abrir raster: {image_path}")
+        dtype = _band_dtype(rds)
+
+        def _read_unit(unit):
+            if len(unit) == 3:
+                yield from _iter_strip(rds, unit, ws, height, dtype, buffers, block_h)
+                return
+            win = unit[0]
+            if read_size:
+                buf = buffers.acquire((read_size, read_size, 3), dtype)
+                img = _read_window_decimated(rds, win[1], win[2], win[3], win[4], win[5],
+                                             read_size, buf, resample)
+            else:
+                buf = buffers.acquire((win[5], win[5], 3), dtype)
+                img = _read_window(rds, win[1], win[2], win[3], win[4], win[5], buf)
+            if img is None:
+                buffers.release(buf)
+            yield win, img
+
+        def _read(unit):
+            for win, img in _read_unit(unit):
+                if img is not None and validity is not None:
+                    validity.zero_invalid(img, win, read_size)
+                yield win, img
+
+        return _read
+
+    return units, _open_reader
+
+def _detect_windows(sess, image_path, windows, geo, confidence_threshold, limits, *,
+                    batch_size=1, read_threads=2, prep_threads=2, strip_reads=True,
+                    validity=None, owned=None, read_size=None, resample="bilinear",
+                    checkpoint=None, incremental=None, stream=None, is_canceled=None, on_progress=None):
+    """
+    Roda o pipeline leitura -> pré-proc -> inferência -> decodificação sobre
+    `windows` e devolve (raw, pipeline): raw é um DetectionStore na ordem das
+    janelas, antes do NMS. Levanta PipelineCanceled ou _OutOfMemory.
+
+    Com `strip_reads`, cada thread leitora percorre faixas de linhas e
+    recorta as janelas em memória, sem reler a sobreposição entre janelas.
+    Com `validity` (ValidityMap), a área inválida das janelas parciais é
+    zerada antes do pré-processamento. Com `owned` ((N, 4), por índice de
+    janela), cada janela só mantém as caixas com centro na área que possui.
+    Com `read_size`, cada janela é lida já reduzida pelo GDAL para
+    read_size x read_size (leitura por janela; não usa as faixas).
+    Com `checkpoint` (DetectionCheckpoint), janelas já gravadas não são
+    lidas de novo e cada janela concluída é gravada. Com `incremental`
+    (IncrementalStore), janelas cujo conteúdo não mudou desde a última
+    execução reaproveitam as caixas guardadas e não passam pela inferência.
+    Com `stream` (RowStreamNMS), as caixas de cada janela vão para ele em
+    vez de se acumularem, e raw volta vazio.
+    """
+    found = DetectionStore((geo[0], geo[2]))
+    digests = {}
+
+    def _store(win, boxes):
+        if stream is not None:
+            stream.add(win, boxes)
+        else:
+            found.append(boxes, win[0])
+
+    if checkpoint is not None:
+        done = checkpoint.completed(w[0] for w in windows)
+        for win in windows:
+            if win[0] in done:
+                _store(win, done[win[0]])
+        windows = [w for w in windows if w[0] not in done]
+
+    buffers = _TileBuffers(keep=2 * (read_threads + prep_threads) + 4 * batch_size)
+    units, open_window_reader = _window_reader(
+        image_path, windows, buffers, read_threads=read_threads, strip_reads=strip_reads,
+        validity=validity, read_size=read_size, resample=resample)
+
+    def _open_reader():
+        read_unit = open_window_reader()
+
+        def _read(unit):
+            for win, img in read_unit(unit):
+                if img is None:
+                    # janela vazia: sem caixas, mas conta como concluída
+                    _store(win, _NO_BOXES)
+                    if checkpoint is not None:
+                        checkpoint.add(win[0], _NO_BOXES)
+                elif incremental is not None:
+                    digest = window_digest(img)
+                    boxes = incremental.lookup(win, digest)
+                    if boxes is None:
+                        digests[win[0]] = digest
+                    else:
+                        # janela inalterada: segue vazia pelo pipeline, só para o progresso
+                        _store(win, boxes)
+                        if checkpoint is not None:
+                            checkpoint.add(win[0], boxes)
+                        buffers.release(img)
+                        img = None
+                yield win, img
+
+        return _read
+
+    def _prep(win, img):
+        tensor = _preprocess(img)
+        buffers.release(img)
+        return tensor
+
+    def _post(win, out):
+        boxes = _decode_tile(
+            _parse_output(out), win[1], win[2], win[3], win[4],
+            geo, confidence_threshold, limits,
+            owned=None if owned is None else owned[win[0]], src_size=win[5],
+        )
+        _store(win, boxes)
+        if checkpoint is not None:
+            checkpoint.add(win[0], boxes)
+        if incremental is not None:
+            incremental.record(win, digests.pop(win[0]), boxes)
+
+    pipe = TilePipeline(
+        units, _open_reader, _prep, _make_forward(sess), _post,
+        batch_size=batch_size, read_threads=read_threads, prep_threads=prep_threads,
+        total=len(windows),
+    )
+    try:
+        pipe.run(is_canceled=is_canceled, on_progress=on_progress)
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
+    return found.ordered(), pipe
+
+def _detect_windows_multi(sessions, image_path, windows, geo, confidence_threshold, limits, *,
+                          batch_size=1, read_threads=2, prep_threads=2, strip_reads=True,
+                          validity=None, owned=None, parallel=False, is_canceled=None, on_progress=None):
+    """
+    Como _detect_windows, mas cada janela é lida e pré-processada uma vez só
+    e o mesmo tensor passa por todas as `sessions` (em sequência ou, com
+    `parallel`, uma thread por sessão). `limits[i]` são os filtros de
+    tamanho do modelo i. Devolve (raws, pipeline), raws[i] DetectionStore do modelo i.
+    """
+    buffers = _TileBuffers(keep=2 * (read_threads + prep_threads) + 4 * batch_size)
+    units, open_reader = _window_reader(image_path, windows, buffers, read_threads=read_threads,
+                                        strip_reads=strip_reads, validity=validity)
+    forwards = [_make_forward(sess) for sess in sessions]
+    pool = ThreadPoolExecutor(max_workers=len(forwards), thread_name_prefix="netflora-model") \
+        if parallel and len(forwards) > 1 else None
+
+    def _prep(win, img):
+        tensor = _preprocess(img)
+        buffers.release(img)
+        return tensor
+
+    def _infer(tensors):
+        if pool is not None:
+            outs = list(pool.map(lambda forward: forward(tensors), forwards))
+        else:
+            outs = [forward(tensors) for forward in forwards]
+        # uma tupla por janela, com a saída de cada modelo
+        return list(zip(*outs))
+
+    found = [DetectionStore((geo[0], geo[2])) for _ in sessions]
+
+    def _post(win, outs):
+        for i, out in enumerate(outs):
+            found[i].append(_decode_tile(
+                _parse_output(out), win[1], win[2], win[3], win[4],
+                geo, confidence_threshold, limits[i],
+                owned=None if owned is None else owned[win[0]], src_size=win[5],
+            ), win[0])
+
+    pipe = TilePipeline(
+        units, open_reader, _prep, _infer, _post,
+        batch_size=batch_size, read_threads=read_threads, prep_threads=prep_threads,
+        total=len(windows),
+    )
+    try:
+        pipe.run(is_canceled=is_canceled, on_progress=on_progress)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+    return [store.ordered() for store in found], pipe
+
+def _plan_tiling(width, height, geo, window_size, step_size, scale, obj_w, obj_h,
+                 read_size=None, validity=None):
+    """
+    Janelas de uma tentativa: lado `window_size * scale` (fixo na leitura
+    reduzida), sobreposição pelo maior objeto e descarte pelo mapa de
+    validade. Devolve (ws, ov_x, ov_y, windows, owned, skipped).
+    """
+    if read_size:
+        ws, ss = window_size, step_size
+    else:
+        ws = int(max(512, window_size * scale))
+        ss = max(256, int(step_size * scale))
+    ov_x = overlap_px(obj_w, geo[1], ws, max_overlap=ws - ss)
+    ov_y = overlap_px(obj_h, geo[4], ws, max_overlap=ws - ss)
+    windows, owned = plan_windows(width, height, ws, ov_x, ov_y)
+    skipped = 0
+    if validity is not None:
+        windows, skipped = validity.filter(windows)
+    return ws, ov_x, ov_y, windows, owned, skipped
+
+def _autotune(model_path, provider, image_path, geo, width, height, confidence_threshold, limits, feedback, *,
+              window_size, step_size, obj_w, obj_h, max_batch, read_threads, prep_threads,
+              strip_reads=True, validity=None, read_size=None, resample="bilinear",
+              cache_path=None, sample_size=8):
+    """
+    Configuração ajustada para (modelo, CPU, provider): do cache em disco ou
+    de uma calibração curta sobre `sample_size` janelas do próprio raster.
+    """
+    from . import autotune
+
+    key = autotune.tune_key(model_digest(model_path), provider)
+    cache = autotune.TuneCache(cache_path)
+    config = cache.get(key)
+    if config:
+        _log(feedback, f"[Netflora] Autoajuste (cache): {config}")
+        return config
+
+    def _sample(scale, n):
+        ws, ov_x, ov_y, windows, owned, _ = _plan_tiling(
+            width, height, geo, window_size, step_size, scale, obj_w, obj_h, read_size, validity)
+        if not windows:
+            return [], owned, 0
+        pick = np.unique(np.linspace(0, len(windows) - 1, min(n, len(windows))).round().astype(int))
+        return [windows[i] for i in pick], owned, (ws - ov_x) * (ws - ov_y)
+
+    def _run(sess, wins, owned, bs):
+        return _detect_windows(
+            sess, image_path, wins, geo, confidence_threshold, limits,
+            batch_size=bs, read_threads=read_threads, prep_threads=prep_threads, strip_reads=strip_reads,
+            validity=validity, owned=owned, read_size=read_size, resample=resample,
+        )
+
+    def measure_single(scale, batch, threads):
+        sess, _ = _get_ort_session(model_path, None, intra_op_threads=threads)
+        if sess is None or _session_batch_limit(sess, batch) < batch:
+            return None
+        wins, owned, area = _sample(scale, max(sample_size, batch))
+        if not wins:
+            return None
+        try:
+            _run(sess, wins[:batch], owned, batch)  # aquecimento (alocação da sessão / forma do lote)
+            t0 = time.perf_counter()
+            _run(sess, wins, owned, batch)
+            dt = max(time.perf_counter() - t0, 1e-6)
+        except Exception as e:
+            _log(feedback, f"[Netflora] Autoajuste: candidato descartado ({e})")
+            return None
+        return len(wins) / dt, len(wins) * area / dt
+
+    def measure_sharded(scale, batch, workers, threads_per_worker):
+        from .sharding import run_sharded_detection
+        wins, owned, area = _sample(scale, sample_size * workers)
+        if len(wins) < workers:
+            return None
+        stats = {}
+        try:
+            run_sharded_detection(
+                image_path, model_path, wins, geo, confidence_threshold, None,
+                workers=workers, threads_per_worker=threads_per_worker, batch_size=batch,
+                read_threads=read_threads, prep_threads=prep_threads, strip_reads=strip_reads,
+                validity=validity, owned=owned, read_size=read_size, resample=resample,
+                stats=stats,
+            )
+        except Exception as e:
+            _log(feedback, f"[Netflora] Autoajuste: candidato descartado ({e})")
+            return None
+        # tempo dos pipelines nos processos, sem a criação dos processos/sessões
+        dt = max(max(stats.get("band_walls") or [0.0]), 1e-6)
+        return len(wins) / dt, len(wins) * area / dt
+
+    _log(feedback, f"[Netflora] Autoajuste: calibrando ({autotune.cpu_signature()}, {provider})")
+    config = autotune.search(
+        measure_single,
+        measure_sharded if provider == "CPUExecutionProvider" else None,
+        max_batch=max_batch,
+        window_scales=(1.0,) if read_size else autotune.DEFAULT_WINDOW_SCALES,
+        log=lambda msg: _log(feedback, msg),
+    )
+    if config:
+        cache.put(key, config)
+        _log(feedback, f"[Netflora] Autoajuste salvo em {cache.path}: {config}")
+    return config
+
+def _window_parts(model_path, conf, *, ws, ov_x, ov_y, read_size, resample, size_filter, class_size_filters):
+    """O que, além dos pixels, define as caixas brutas de uma janela."""
+    return dict(
+        model=model_digest(model_path),
+        tiling=[ws, ov_x, ov_y, read_size, resample if read_size else None],
+        conf=float(conf), size_filter=size_filter, class_size_filters=class_size_filters,
+    )
+
+def _run_key(parts, image_path, ds, validity):
+    """Assinatura de uma execução sobre este arquivo de raster (checkpoint, cache bruto)."""
+    from .checkpoint import raster_fingerprint, run_signature
+
+    return run_signature(
+        raster=raster_fingerprint(image_path, ds),
+        validity=None if validity is None else [validity.source, validity.valid.shape,
+                                                None if validity.nodata is None else validity.nodata.tolist()],
+        **parts,
+    )
+
+def _open_checkpoint(path, feedback, signature):
+    """
+    Checkpoint da tentativa atual. A assinatura cobre tudo o que muda as
+    caixas de uma janela; se não bater com a do arquivo, ele recomeça vazio.
+    """
+    from .checkpoint import DetectionCheckpoint
+
+    try:
+        ckpt = DetectionCheckpoint(path, signature)
+    except Exception as e:
+        _log(feedback, f"[Netflora] Checkpoint indisponível ({path}): {e}")
+        return None
+    n_done = ckpt.count()
+    if n_done:
+        _log(feedback, f"[Netflora] Checkpoint encontrado: retomando com {n_done} janelas já concluídas")
+    return ckpt
+
+def _open_incremental(directory, feedback, parts, ds):
+    """
+    Repositório incremental em `directory`: a assinatura não inclui o arquivo
+    do raster (ele é reexportado, às vezes com outro nome), só dimensões,
+    georreferência, modelo e tiling, e o nome do arquivo vem dela.
+    """
+    from .checkpoint import run_signature
+    from .incremental import IncrementalStore
+
+    signature = run_signature(size=[ds.RasterXSize, ds.RasterYSize],
+                              geotransform=list(ds.GetGeoTransform() or ()), **parts)
+    path = os.path.join(directory, f"{signature[:24]}.sqlite")
+    try:
+        store = IncrementalStore(path, signature)
+    except Exception as e:
+        _log(feedback, f"[Netflora] Modo incremental indisponível ({path}): {e}")
+        return None
+    if len(store):
+        _log(feedback, f"[Netflora] Modo incremental: {len(store)} janelas da execução anterior; "
+                       f"só as que mudaram serão inferidas")
+    return store
+
+def _backoff_attempts(max_batch, backoff_chain):
+    """Tentativas (escala da janela, lote) no OOM: primeiro reduz o lote, depois o tile."""
+    attempts = []
+    bs = max_batch
+    while bs > 1:
+        attempts.append((1.0, bs))
+        bs //= 2
+    attempts.extend((scale, 1) for scale in backoff_chain)
+    return attempts
+
+def _open_raster(image_path, feedback):
+    """(dataset, ValidityMap ou None); dataset None se o raster não abrir."""
+    ds = gdal.Open(image_path, gdal.GA_ReadOnly)
+    if ds is None:
+        _log(feedback, f"[Netflora] ERRO ao abrir raster: {image_path}")
+        return None, None
+
+    # --- mapa de validade (overview / máscara): janelas sem pixel válido nem são lidas
+    validity = None
+    try:
+        validity = build_validity_map(ds)
+    except Exception as e:
+        _log(feedback, f"[Netflora] Mapa de validade indisponível: {e}")
+    if validity is not None:
+        mh, mw = validity.valid.shape
+        _log(feedback, f"[Netflora] Mapa de validade ({validity.source}, {mw}x{mh} células): "
+                       f"{100.0 * validity.valid_fraction:.0f}% válido")
+    return ds, validity
+
+def run_detection(raster_layer, model_path: str, confidence_threshold: float, feedback, *,
+                  batch_size: int = 1, read_threads: int = 2, prep_threads: int = 2,
+                  per_class_nms: bool = False, size_filter=None, class_size_filters=None,
+                  session_cache_mb: float = DEFAULT_BUDGET_MB,
+                  workers: int = 1, threads_per_worker: int = 0, strip_reads: bool = True,
+                  max_object_size=None, classes=None,
+                  decimated_reads: bool = False, target_gsd=None, resample: str = "bilinear",
+                  autotune: bool = False, autotune_cache: str = None, checkpoint_path: str = None,
+                  incremental_dir: str = None, raw_cache_dir: str = None,
+                  raw_cache_mb: float = 0, nms_iou: float = 0.85, on_detections=None,
+                  spill_path: str = None):
+    """
+    Detecção por janelas sobre `raster_layer` com o modelo ONNX em
+    `model_path`. Devolve as caixas finais num DetectionStore (iterar dá
+    tuplas (xmin, ymin, xmax, ymax, class_id, conf) em coordenadas do mapa),
+    vazio em caso de falha/cancelamento.
+
+    Com `on_detections` (modo streaming), as caixas finais são entregues em
+    lotes (N, 6) a on_detections à medida que as linhas de janelas terminam
+    (ver common.streaming) e a função devolve um DetectionStore vazio.
+
+    Com `spill_path`, as caixas brutas vão para um SQLite com índice R-tree
+    nesse caminho (ver common.spill) em vez da memória, e o NMS final roda
+    por faixas sobre o disco; o arquivo é apagado no fim.
+    """
     if not os.path.exists(model_path):
         _log(feedback, f"[Netflora] Modelo não encontrado: {model_path}")
-        return []
+        return DetectionStore()
 
-    sess, provider = _load_ort_session(model_path, feedback)
-    if sess is None:
-        return []
-    _log(feedback, f"[Netflora] onnxruntime provider: {provider}")
+    sharded = bool(workers and workers > 1)
+    if sharded and not autotune:
+        # cada processo de trabalho cria sua própria sessão (CPU, threads fixas)
+        sess, provider = None, "CPUExecutionProvider"
+        max_batch = max(1, int(batch_size or 1))
+        _log(feedback, f"[Netflora] Modo multiprocesso: {workers} processos")
+    else:
+        sess, provider = _get_ort_session(model_path, feedback, cache_mb=session_cache_mb)
+        if sess is None:
+            return DetectionStore()
+        _log(feedback, f"[Netflora] onnxruntime provider: {provider}")
+        max_batch = _session_batch_limit(sess, batch_size)
+        if max_batch < max(1, int(batch_size or 1)):
+            _log(feedback, f"[Netflora] Modelo com batch fixo; usando lote de 1 janela (pedido: {batch_size})")
 
     image_path = raster_layer.source()
-    ds = gdal.Open(image_path, gdal.GA_ReadOnly)
+    ds, validity = _open_raster(image_path, feedback)
     if ds is None:
-        _log(feedback, f"[Netflora] ERRO ao abrir raster: {image_path}")
-        return []
+        return DetectionStore()
 
     width = ds.RasterXSize
     height = ds.RasterYSize
-    gt = ds.GetGeoTransform()
-    x0, pxW, _, y0, _, neg_pxH = gt
-    res_x = pxW
-    res_y = abs(neg_pxH) if neg_pxH != 0 else pxW
-    top_left_x = x0
-    top_left_y = y0
+    geo = _raster_geo(ds)
 
     # --- tiling adaptativo por VRAM
     total_mb, free_mb = _probe_nvidia_vram_mb()
     window_size, step_size = _choose_tile_from_vram(provider, total_mb, free_mb)
     _log(feedback, f"[Netflora] Tiling inicial: window={window_size}, step={step_size} (VRAM total/free = {total_mb}/{free_mb} MB)")
 
-    input_name = sess.get_inputs()[0].name
-    raw = []
+    # loop com backoff se OOM: primeiro reduz o lote, depois o tile
+    backoff_chain = [1.0, 0.8, 0.67, 0.5]  # reduz tile gradualmente
+
+    # --- leitura reduzida: o GDAL entrega a janela já em 640x640 (overviews quando houver)
+    read_size = None
+    if target_gsd or decimated_reads:
+        read_size = 640
+        if target_gsd:
+            res = abs(geo[1]) or 1.0
+            window_size = int(max(64, round(read_size * float(target_gsd) / res)))
+            step_size = window_size // 2
+            _log(feedback, f"[Netflora] GSD do raster {res:.4g}, alvo do modelo {float(target_gsd):.4g}: "
+                           f"janela de {window_size} px lida em {read_size}x{read_size} ({resample})")
+        else:
+            _log(feedback, f"[Netflora] Leitura reduzida: janela de {window_size} px lida em {read_size}x{read_size} ({resample})")
+        backoff_chain = [1.0]  # o tensor é sempre 640x640: no OOM só o lote diminui
 
-    def _try_forward(pre):
-        # executa uma inferência e permite capturar erros de OOM para backoff
+    limits = _size_limits(size_filter, class_size_filters)
+
+    # --- sobreposição pelo maior objeto esperado (unidades do terreno)
+    if max_object_size:
+        obj_w = obj_h = float(max_object_size)
+    else:
+        obj_w, obj_h = _max_object_size(size_filter, class_size_filters, classes)
+    _log(feedback, f"[Netflora] Maior objeto esperado: {obj_w:.1f} x {obj_h:.1f} (unidades do terreno)")
+
+    # --- autoajuste: lote, threads, janela e processos medidos neste raster (cache em disco)
+    if autotune:
         try:
-            out = sess.run(None, {input_name: pre})
-            return out
+            tuned = _autotune(
+                model_path, provider, image_path, geo, width, height, confidence_threshold, limits, feedback,
+                window_size=window_size, step_size=step_size, obj_w=obj_w, obj_h=obj_h,
+                max_batch=_session_batch_limit(sess, 8), read_threads=read_threads, prep_threads=prep_threads,
+                strip_reads=strip_reads, validity=validity, read_size=read_size, resample=resample,
+                cache_path=autotune_cache,
+            )
         except Exception as e:
-            msg = str(e)
-            # sinais comuns de OOM: CUBLAS/CUDNN/allocator/RESOURCE_EXHAUSTED
-            if any(k in msg.upper() for k in ("RESOURCE_EXHAUSTED", "CUBLAS", "CUDNN", "OUT OF MEMORY", "CUDA ERROR")):
-                return "OOM"
-            return e
+            _log(feedback, f"[Netflora] Autoajuste falhou, seguindo com os parâmetros informados: {e}")
+            tuned = None
+        if tuned:
+            workers = int(tuned.get("workers", 1))
+            threads_per_worker = int(tuned.get("threads_per_worker", 0))
+            sharded = workers > 1
+            if not sharded and tuned.get("intra_op_threads"):
+                sess, provider = _get_ort_session(model_path, feedback, cache_mb=session_cache_mb,
+                                                  intra_op_threads=int(tuned["intra_op_threads"]))
+                if sess is None:
+                    return DetectionStore()
+            max_batch = max(1, int(tuned.get("batch_size", max_batch)))
+            if not read_size:
+                scale = float(tuned.get("window_scale", 1.0))
+                window_size = int(round(window_size * scale))
+                step_size = int(round(step_size * scale))
+        elif sharded:
+            _log(feedback, f"[Netflora] Modo multiprocesso: {workers} processos")
 
-    # loop com backoff se OOM
-    backoff_chain = [1.0, 0.8, 0.67, 0.5]  # reduz tile gradualmente
-    for scale in backoff_chain:
-        ws = int(max(512, window_size * scale))
-        ss = max(256, int(step_size * scale))
-        total = ((height - 1) // ss + 1) * ((width - 1) // ss + 1)
-        _log(feedback, f"[Netflora] Tiling em uso: window={ws}, step={ss} (total janelas ~ {total})")
-
-        ok = True
-        count = 0
-
-        for y in range(0, height, ss):
-            for x in range(0, width, ss):
-                if getattr(feedback, 'isCanceled', lambda: False)():
-                    _log(feedback, "[Netflora] Cancelado.")
-                    return []
-
-                ww = min(ws, width - x)
-                hh = min(ws, height - y)
-                if ww <= 0 or hh <= 0:
-                    continue
-
-                img = _read_tile_gdal(ds, x, y, ww, hh, bands=(1,2,3))
-                if img is None or img.size == 0 or np.all(img == 0):
-                    count += 1
-                    continue
-
-                # --- Garantir padding nas bordas ---
-                if img.shape[0] != ws or img.shape[1] != ws:
-                    pad_h = ws - img.shape[0]
-                    pad_w = ws - img.shape[1]
-                    img = np.pad(
-                        img,
-                        ((0, pad_h), (0, pad_w), (0, 0)),  # (H, W, C)
-                        mode="constant"
-                    )
-
-                pre = _preprocess(img)
-                out = _try_forward(pre)
-                if out == "OOM":
-                    _log(feedback, f"[Netflora] OOM com window={ws}, step={ss} na janela ({x},{y}). Tentando reduzir tile...")
-                    ok = False
-                    break  # sai do loop para diminuir o tile
-                elif isinstance(out, Exception):
-                    _log(feedback, f"[Netflora] Falha no forward: {out}")
-                    return []
-
-                dets = _parse_output(out)
-                sx = ww / 640.0
-                sy = hh / 640.0
-                for x1, y1, x2, y2, conf, cls in dets:
-                    if conf < confidence_threshold:
-                        continue
-                    x_min = x1 * sx
-                    x_max = x2 * sx
-                    y_min = y1 * sy
-                    y_max = y2 * sy
-                    bw = (x_max - x_min) * res_x
-                    bh = (y_max - y_min) * res_y
-                    if bw <= 0 or bh <= 0:
-                        continue
-                    if bw < 1 or bh < 1 or bw > 20 or bh > 150:
-                        continue
-                    ar = bw / bh if bh > 0 else 0
-                    if ar < 0.3 or ar > 3.0:
-                        continue
-                    gxmin = float(top_left_x + (x + x_min) * res_x)
-                    gxmax = float(top_left_x + (x + x_max) * res_x)
-                    gymin_pix = (y + y_max)
-                    gymax_pix = (y + y_min)
-                    gymin = float(top_left_y + gymin_pix * neg_pxH)
-                    gymax = float(top_left_y + gymax_pix * neg_pxH)
-                    if gymin > gymax:
-                        gymin, gymax = gymax, gymin
-                    raw.append((gxmin, gymin, gxmax, gymax, int(cls), float(conf)))
-
-                count += 1
-                if count % 20 == 0:
-                    _log(feedback, f"[Netflora] Janelas: {count}/{total}")
-
-            if not ok:
+    is_canceled = getattr(feedback, 'isCanceled', lambda: False)
+
+    attempts = _backoff_attempts(max_batch, backoff_chain)
+
+    # --- cache bruto: com ele, as janelas são decodificadas sem corte de confiança
+    # nem filtros de tamanho, que só são aplicados no fim (_filter_boxes)
+    raw_cache = None
+    if raw_cache_dir and raw_cache_mb and raw_cache_mb > 0:
+        if on_detections is not None or spill_path:
+            _log(feedback, "[Netflora] Cache de detecções brutas desativado no modo "
+                           f"{'spill em disco' if spill_path else 'streaming'}")
+        else:
+            from .raw_cache import RawDetectionCache
+            raw_cache = RawDetectionCache(raw_cache_dir, raw_cache_mb)
+    decode_conf, decode_limits = (0.0, None) if raw_cache is not None else (confidence_threshold, limits)
+
+    def _plan(scale):
+        ws, ov_x, ov_y, windows, owned, skipped = _plan_tiling(
+            width, height, geo, window_size, step_size, scale, obj_w, obj_h, read_size, validity)
+        parts = _window_parts(model_path, decode_conf, ws=ws, ov_x=ov_x, ov_y=ov_y,
+                              read_size=read_size, resample=resample,
+                              size_filter=None if raw_cache is not None else size_filter,
+                              class_size_filters=None if raw_cache is not None else class_size_filters)
+        return ws, ov_x, ov_y, windows, owned, skipped, parts
+
+    origin = (geo[0], geo[2])
+
+    def _finish(found):
+        if on_detections is None:
+            return found
+        if len(found):
+            on_detections(found.boxes())
+        return DetectionStore(origin)
+
+    raw = None
+    ckpt = None
+    stream = None
+    spill = None
+    if spill_path:
+        if sharded:
+            # cada processo só guarda as caixas da própria faixa
+            _log(feedback, "[Netflora] Spill em disco não se aplica ao modo multiprocesso; ignorado")
+        else:
+            from .spill import DetectionSpill
+            try:
+                spill = DetectionSpill(spill_path, geo)
+            except sqlite3.Error as e:
+                _log(feedback, f"[Netflora] Spill em disco indisponível ({e}); caixas ficam na memória")
+
+    def _drop_spill():
+        if spill is not None:
+            spill.discard()
+
+    def _spill_nms(spill, windows):
+        found = DetectionStore(origin)
+        _log(feedback, f"[Netflora] Spill em disco: {spill.count} caixas brutas "
+                       f"({spill.nbytes / 1024 ** 2:.1f} MB); NMS por faixas")
+        try:
+            kept = spill.run_nms(
+                [w[2] for w in windows], on_detections or found.append,
+                iou_threshold=nms_iou, per_class=per_class_nms, is_canceled=is_canceled)
+        finally:
+            spill.discard()
+        if is_canceled():
+            _log(feedback, "[Netflora] Cancelado.")
+            return DetectionStore(origin)
+        if ckpt is not None:
+            ckpt.discard()
+        _log(feedback, f"[Netflora] {kept} caixas após o NMS por faixas")
+        return found
+
+    if raw_cache is not None:
+        # qualquer tiling da cadeia de backoff serve (a execução anterior pode ter caído para um menor)
+        for scale in dict.fromkeys(scale for scale, _ in attempts):
+            ws, ov_x, ov_y, windows, _, _, parts = _plan(scale)
+            raw = raw_cache.get(_run_key(parts, image_path, ds, validity))
+            if raw is not None:
+                raw = DetectionStore.from_boxes(raw, origin)
+                _log(feedback, f"[Netflora] Detecções brutas em cache (window={ws}, {len(windows)} janelas, "
+                               f"{len(raw)} caixas): inferência pulada")
                 break
 
-        if ok:
-            break  # tiling atual funcionou; sai do backoff
+    if checkpoint_path and raw is None:
+        # retoma no tiling do checkpoint (a execução anterior pode ter caído para um
+        # menor): abrir o arquivo com outra assinatura apagaria as janelas gravadas
+        from .checkpoint import stored_signature
+        saved = stored_signature(checkpoint_path)
+        if saved is not None:
+            for scale in dict.fromkeys(scale for scale, _ in attempts):
+                if _run_key(_plan(scale)[-1], image_path, ds, validity) == saved:
+                    attempts = attempts[[s for s, _ in attempts].index(scale):]
+                    break
+
+    for scale, bs in ([] if raw is not None else attempts):
+        ws, ov_x, ov_y, windows, owned, skipped, parts = _plan(scale)
+        total = len(windows)
+        _log(feedback, f"[Netflora] Tiling em uso: window={ws}, sobreposição={ov_x}x{ov_y} px, lote={bs} (total janelas ~ {total})")
+        if skipped:
+            _log(feedback, f"[Netflora] {skipped} janelas sem pixels válidos puladas sem leitura")
+
+        last_logged = [0]
 
-    kept = apply_iou_nms_with_center_overlap(raw, iou_threshold=0.85)
-    return kept
+        def _progress(done, n):
+            if done // 20 > last_logged[0] // 20:
+                last_logged[0] = done
+                _log(feedback, f"[Netflora] Janelas: {done}/{n}")
+
+        if spill is not None:
+            spill.clear()
+        elif on_detections is not None and not sharded:
+            if stream is not None and stream.rows == sorted({w[2] for w in windows}):
+                # mesmo plano de janelas (só o lote mudou): continua o fluxo de onde parou
+                windows = [w for w in windows if w[0] not in stream.done]
+            elif stream is not None and stream.emitted:
+                _log(feedback, "[Netflora] OOM depois de gravar feições no modo streaming; "
+                               "rode de novo com janela ou lote menor")
+                return DetectionStore()
+            else:
+                stream = RowStreamNMS(windows, geo, on_detections, iou_threshold=nms_iou, per_class=per_class_nms)
+
+        run_key = _run_key(parts, image_path, ds, validity)
+        ckpt = _open_checkpoint(checkpoint_path, feedback, run_key) if checkpoint_path else None
+        store = _open_incremental(incremental_dir, feedback, parts, ds) if incremental_dir else None
+
+        try:
+            if sharded:
+                from .sharding import run_sharded_detection
+                boxes = run_sharded_detection(
+                    image_path, model_path, windows, geo, decode_conf, feedback,
+                    workers=workers, threads_per_worker=threads_per_worker, batch_size=bs,
+                    read_threads=read_threads, prep_threads=prep_threads, strip_reads=strip_reads,
+                    validity=validity, owned=owned, read_size=read_size, resample=resample,
+                    checkpoint=ckpt, incremental=store, raw=raw_cache is not None,
+                    size_filter=size_filter, class_size_filters=class_size_filters,
+                    per_class_nms=per_class_nms, iou_threshold=nms_iou,
+                )
+                if raw_cache is None:
+                    if ckpt is not None:
+                        ckpt.discard()
+                    return _finish(DetectionStore.from_boxes(boxes, origin))
+                raw, pipe = DetectionStore.from_boxes(boxes, origin), None
+            else:
+                raw, pipe = _detect_windows(
+                    sess, image_path, windows, geo, decode_conf, decode_limits,
+                    batch_size=bs, read_threads=read_threads, prep_threads=prep_threads,
+                    strip_reads=strip_reads, validity=validity, owned=owned,
+                    read_size=read_size, resample=resample, checkpoint=ckpt, incremental=store,
+                    stream=spill if spill is not None else stream,
+                    is_canceled=is_canceled, on_progress=_progress,
+                )
+        except PipelineCanceled:
+            _log(feedback, "[Netflora] Cancelado.")
+            if ckpt is not None:
+                _log(feedback, f"[Netflora] Checkpoint com {ckpt.count()} janelas salvo em {ckpt.path}; "
+                               f"rode de novo com os mesmos parâmetros para retomar")
+                ckpt.close()
+            _drop_spill()
+            return DetectionStore()
+        except _OutOfMemory:
+            if ckpt is not None:
+                ckpt.close()
+            _log(feedback, f"[Netflora] OOM com window={ws}, sobreposição={ov_x}x{ov_y} px, lote={bs}. Tentando reduzir lote/tile...")
+            continue  # próxima tentativa com lote/tile menor
+        except Exception as e:
+            if ckpt is not None:
+                ckpt.close()
+            _drop_spill()
+            _log(feedback, f"[Netflora] Falha na detecção: {e}")
+            return DetectionStore()
+        finally:
+            if store is not None:
+                store.close()
+
+        if store is not None:
+            _log(feedback, f"[Netflora] Modo incremental: {store.reused} janelas inalteradas reaproveitadas, "
+                           f"{store.changed} inferidas")
+        if pipe is not None:
+            _log(feedback, f"[Netflora] Pipeline: {pipe.summary()}")
+        if raw_cache is not None:
+            try:
+                raw_cache.put(run_key, raw.boxes())
+            except OSError as e:
+                _log(feedback, f"[Netflora] Não foi possível gravar o cache de detecções brutas: {e}")
+        if stream is not None:
+            stream.finish()
+            if ckpt is not None:
+                ckpt.discard()
+            _log(feedback, f"[Netflora] Streaming: {stream.emitted} caixas entregues durante a detecção")
+            return DetectionStore()
+        if spill is not None:
+            return _spill_nms(spill, windows)
+        break  # tiling atual funcionou; sai do backoff
+    else:
+        _drop_spill()
+        if raw is None:
+            return DetectionStore()
+
+    if raw_cache is not None:
+        raw = _filter_boxes(raw, confidence_threshold, limits)
+    keep = nms_center_overlap(raw, iou_threshold=nms_iou, per_class=per_class_nms)
+    if ckpt is not None:
+        ckpt.discard()
+    return _finish(raw.subset(keep))
+
+def run_multi_detection(raster_layer, models, confidence_threshold: float, feedback, *,
+                        batch_size: int = 1, read_threads: int = 2, prep_threads: int = 2,
+                        per_class_nms: bool = False, session_cache_mb: float = DEFAULT_BUDGET_MB,
+                        strip_reads: bool = True, parallel_models: bool = False, nms_iou: float = 0.85):
+    """
+    Vários modelos numa passada só pelo raster: cada janela é lida,
+    decodificada e redimensionada uma vez e o tensor vai para todas as
+    sessões. `models` é uma lista de dicts com "model_path" e, opcionais,
+    "size_filter", "class_size_filters", "max_object_size" e "classes"
+    (mesmo significado de run_detection). O plano de janelas é comum, com
+    sobreposição para o maior objeto entre todos os modelos.
+
+    Devolve um DetectionStore por modelo, na ordem de `models` (vazios se a
+    execução falhar ou for cancelada).
+    """
+    empty = [DetectionStore() for _ in models]
+    sessions, providers = [], []
+    for spec in models:
+        if not os.path.exists(spec["model_path"]):
+            _log(feedback, f"[Netflora] Modelo não encontrado: {spec['model_path']}")
+            return empty
+        sess, prov = _get_ort_session(spec["model_path"], feedback, cache_mb=session_cache_mb)
+        if sess is None:
+            return empty
+        sessions.append(sess)
+        providers.append(prov)
+    provider = providers[0] if providers else "CPUExecutionProvider"
+    _log(feedback, f"[Netflora] {len(sessions)} modelos numa passada (onnxruntime provider: {provider}, "
+                   f"{'em paralelo' if parallel_models else 'em sequência'})")
+    max_batch = min(_session_batch_limit(sess, batch_size) for sess in sessions)
+
+    image_path = raster_layer.source()
+    ds, validity = _open_raster(image_path, feedback)
+    if ds is None:
+        return empty
+    width = ds.RasterXSize
+    height = ds.RasterYSize
+    geo = _raster_geo(ds)
+
+    total_mb, free_mb = _probe_nvidia_vram_mb()
+    window_size, step_size = _choose_tile_from_vram(provider, total_mb, free_mb)
+
+    limits = [_size_limits(spec.get("size_filter"), spec.get("class_size_filters")) for spec in models]
+    obj_w = obj_h = 0.0
+    for spec in models:
+        if spec.get("max_object_size"):
+            w = h = float(spec["max_object_size"])
+        else:
+            w, h = _max_object_size(spec.get("size_filter"), spec.get("class_size_filters"), spec.get("classes"))
+        obj_w, obj_h = max(obj_w, w), max(obj_h, h)
+    _log(feedback, f"[Netflora] Maior objeto esperado entre os modelos: {obj_w:.1f} x {obj_h:.1f} (unidades do terreno)")
+
+    is_canceled = getattr(feedback, 'isCanceled', lambda: False)
+
+    for scale, bs in _backoff_attempts(max_batch, [1.0, 0.8, 0.67, 0.5]):
+        ws, ov_x, ov_y, windows, owned, skipped = _plan_tiling(
+            width, height, geo, window_size, step_size, scale, obj_w, obj_h, None, validity)
+        _log(feedback, f"[Netflora] Tiling em uso: window={ws}, sobreposição={ov_x}x{ov_y} px, lote={bs} (total janelas ~ {len(windows)})")
+        if skipped:
+            _log(feedback, f"[Netflora] {skipped} janelas sem pixels válidos puladas sem leitura")
+
+        last_logged = [0]
+
+        def _progress(done, n):
+            if done // 20 > last_logged[0] // 20:
+                last_logged[0] = done
+                _log(feedback, f"[Netflora] Janelas: {done}/{n}")
+
+        try:
+            raws, pipe = _detect_windows_multi(
+                sessions, image_path, windows, geo, confidence_threshold, limits,
+                batch_size=bs, read_threads=read_threads, prep_threads=prep_threads,
+                strip_reads=strip_reads, validity=validity, owned=owned, parallel=parallel_models,
+                is_canceled=is_canceled, on_progress=_progress,
+            )
+        except PipelineCanceled:
+            _log(feedback, "[Netflora] Cancelado.")
+            return empty
+        except _OutOfMemory:
+            _log(feedback, f"[Netflora] OOM com window={ws}, sobreposição={ov_x}x{ov_y} px, lote={bs}. Tentando reduzir lote/tile...")
+            continue
+        except Exception as e:
+            _log(feedback, f"[Netflora] Falha na detecção: {e}")
+            return empty
+
+        _log(feedback, f"[Netflora] Pipeline: {pipe.summary()}")
+        break
+    else:
+        return empty
+
+    out = []
+    for raw in raws:
+        keep = nms_center_overlap(raw, iou_threshold=nms_iou, per_class=per_class_nms)
+        out.append(raw.subset(keep))
+    return out
@@ -332,6 +332,18 @@ def _download_model(entry: dict, asset_name: str, target_path: str, feedback):
     return target_path
 
 
+def model_target_gsd(alg_key: str, plugin_root: str) -> Optional[float]:
+    """Ground sample distance (map units per model input pixel) from the registry, if known."""
+    registry = _load_registry(plugin_root)
+    entry = dict(registry.get("defaults", {}))
+    entry.update(registry.get("models", {}).get(alg_key, {}))
+    try:
+        value = float(entry.get("gsd") or 0.0)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
 def ensure_model_path(alg_key: str, plugin_root: str, feedback=None) -> str:
     registry = _load_registry(plugin_root)
     defaults = registry.get("defaults", {})
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+NMS vetorizado para as detecções já georreferenciadas.
+
+Mesma regra de `apply_iou_nms_with_center_overlap`: percorrendo as caixas
+por confiança decrescente, uma caixa mantida suprime todas as seguintes com
+IoU >= limiar ou cujo centro caia dentro dela. Uma grade uniforme limita as
+comparações a caixas vizinhas: só pares que compartilham alguma célula são
+avaliados, em blocos de NumPy, e a resolução gulosa final percorre apenas
+os pares que de fato suprimem.
+
+As caixas vêm como array (N, 6) no layout de `run_detection`:
+(xmin, ymin, xmax, ymax, class_id, conf), ou como DetectionStore (o NMS
+roda nas coordenadas relativas à origem do store).
+"""
+import numpy as np
+
+from .detections import DetectionStore
+
+# limite de pares candidatos avaliados por bloco (controla o pico de memória)
+_PAIR_CHUNK = 4_000_000
+# média máxima de células por caixa antes de aumentar o tamanho da célula
+_MAX_CELLS_PER_BOX = 8
+
+
+def _grid_cell_size(w, h):
+    size = np.maximum(w, h)
+    size = size[size > 0]
+    if size.size == 0:
+        return 1.0
+    return float(2.0 * np.median(size))
+
+
+def _grid_entries(b, cell):
+    """Expande cada caixa nas células (cx, cy) que ela cobre."""
+    ox = b[:, 0].min()
+    oy = b[:, 1].min()
+    while True:
+        cx0 = np.floor((b[:, 0] - ox) / cell).astype(np.int64)
+        cy0 = np.floor((b[:, 1] - oy) / cell).astype(np.int64)
+        cx1 = np.floor((b[:, 2] - ox) / cell).astype(np.int64)
+        cy1 = np.floor((b[:, 3] - oy) / cell).astype(np.int64)
+        sx = cx1 - cx0 + 1
+        sy = cy1 - cy0 + 1
+        n_cells = sx * sy
+        if n_cells.sum() <= _MAX_CELLS_PER_BOX * len(b):
+            break
+        cell *= 2.0
+
+    box = np.repeat(np.arange(len(b), dtype=np.int64), n_cells)
+    first = np.cumsum(n_cells) - n_cells
+    k = np.arange(box.size, dtype=np.int64) - np.repeat(first, n_cells)
+    cx = cx0[box] + k % sx[box]
+    cy = cy0[box] + k // sx[box]
+    nx = int(cx1.max()) + 1
+    key = cy * nx + cx
+    order = np.lexsort((box, key))
+    return key[order], box[order], cx[order], cy[order], cx0, cy0
+
+
+def _candidate_pairs(key, box, cx, cy, cx0, cy0):
+    """
+    Gera, em blocos, os pares (a, b) com a < b que compartilham uma célula.
+    Cada par é emitido uma vez só, na primeira célula da interseção das
+    duas faixas de células.
+    """
+    n = key.size
+    if n < 2:
+        return
+    seg_start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    seg_len = np.diff(np.r_[seg_start, n])
+    seg_end = np.repeat(seg_start + seg_len, seg_len)
+    n_after = seg_end - np.arange(n) - 1
+
+    seg_pairs = seg_len * (seg_len - 1) // 2
+    cum = np.cumsum(seg_pairs)
+    s = 0
+    while s < seg_start.size:
+        base = cum[s - 1] if s > 0 else 0
+        e = int(np.searchsorted(cum, base + _PAIR_CHUNK, side="right"))
+        e = max(e, s + 1)
+        p0 = seg_start[s]
+        p1 = seg_start[e] if e < seg_start.size else n
+        s = e
+
+        na = n_after[p0:p1]
+        total = int(na.sum())
+        if total == 0:
+            continue
+        left = np.repeat(np.arange(p0, p1, dtype=np.int64), na)
+        start = np.cumsum(na) - na
+        right = left + 1 + (np.arange(total, dtype=np.int64) - np.repeat(start, na))
+
+        a = box[left]
+        b = box[right]
+        first = (cx[left] == np.maximum(cx0[a], cx0[b])) & (cy[left] == np.maximum(cy0[a], cy0[b]))
+        yield a[first], b[first]
+
+
+def _suppresses(boxes, a, b, iou_threshold):
+    """b (pior confiança) é suprimida por a? IoU >= limiar ou centro de b dentro de a."""
+    A = boxes[a]
+    B = boxes[b]
+    xA = np.maximum(B[:, 0], A[:, 0]); yA = np.maximum(B[:, 1], A[:, 1])
+    xB = np.minimum(B[:, 2], A[:, 2]); yB = np.minimum(B[:, 3], A[:, 3])
+    inter = np.maximum(0, xB - xA) * np.maximum(0, yB - yA)
+    area_b = (B[:, 2] - B[:, 0]) * (B[:, 3] - B[:, 1])
+    area_a = (A[:, 2] - A[:, 0]) * (A[:, 3] - A[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(inter > 0, inter / (area_b + area_a - inter), 0.0)
+    cx = (B[:, 0] + B[:, 2]) / 2.0
+    cy = (B[:, 1] + B[:, 3]) / 2.0
+    inside = (A[:, 0] <= cx) & (cx <= A[:, 2]) & (A[:, 1] <= cy) & (cy <= A[:, 3])
+    return (iou >= iou_threshold) | inside
+
+
+def nms_center_overlap(boxes, iou_threshold=0.64, per_class=False):
+    """
+    Índices das caixas mantidas, em ordem de confiança decrescente
+    (empates mantêm a ordem de entrada, como o `sorted` estável).
+    Com `per_class=True` só caixas da mesma classe se suprimem.
+    """
+    if isinstance(boxes, DetectionStore):
+        boxes = boxes.local_boxes()
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(-boxes[:, 5], kind="stable")
+    b = boxes[order]
+    cls = b[:, 4]
+
+    if iou_threshold <= 0:
+        # IoU >= 0 vale para qualquer par: sobra a melhor caixa (de cada classe)
+        if not per_class:
+            return order[:1]
+        _, first = np.unique(cls, return_index=True)
+        return order[np.sort(first)]
+
+    cell = _grid_cell_size(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1])
+    src, dst = [], []
+    for a, c in _candidate_pairs(*_grid_entries(b, cell)):
+        if per_class:
+            same = cls[a] == cls[c]
+            a, c = a[same], c[same]
+        hit = _suppresses(b, a, c, iou_threshold)
+        src.append(a[hit])
+        dst.append(c[hit])
+
+    alive = np.ones(n, dtype=bool)
+    if src:
+        src = np.concatenate(src)
+        dst = np.concatenate(dst)
+        by_src = np.argsort(src, kind="stable")
+        src = src[by_src]
+        dst = dst[by_src]
+        heads, starts = np.unique(src, return_index=True)
+        ends = np.r_[starts[1:], src.size]
+        for head, s, e in zip(heads.tolist(), starts.tolist(), ends.tolist()):
+            if alive[head]:
+                alive[dst[s:e]] = False
+    return order[np.flatnonzero(alive)]
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline em estágios para a detecção por janelas.
+
+    leitura (N threads, cada uma com seu próprio gdal.Dataset)
+      -> pré-processamento (pool de threads)
+      -> inferência (thread chamadora, em lotes)
+      -> pós-processamento (thread consumidora)
+
+Os estágios são ligados por filas limitadas, de modo que a decodificação do
+raster, o resize e o forward do ONNX Runtime se sobrepõem sem acumular tiles
+na memória. GDAL, NumPy e ORT liberam o GIL nas partes pesadas.
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+_POLL_S = 0.1
+
+
+class PipelineCanceled(Exception):
+    pass
+
+
+class StageStats:
+    """Tempo ocupado (s) e itens processados por um estágio."""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.busy = 0.0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, items=1):
+        with self._lock:
+            self.busy += seconds
+            self.items += items
+
+    def utilization(self, wall):
+        if wall <= 0:
+            return 0.0
+        return min(1.0, self.busy / (wall * self.workers))
+
+
+class TilePipeline:
+    """
+    Executa as unidades de leitura `units` pelos quatro estágios.
+
+    open_reader()         -> função read(unit) -> iterável de (win, img | None)
+                             (uma por thread leitora)
+    preprocess(win, img)  -> tensor [1,3,H,W]
+    infer(tensors)        -> lista com a saída de cada tensor (pode levantar exceção)
+    postprocess(win, out) -> None
+
+    Uma unidade pode ser uma janela só ou uma sequência de janelas lidas
+    juntas (ex.: uma faixa de linhas). Janelas com img None (vazias)
+    atravessam o pipeline sem inferência, apenas para contar progresso.
+    `total` é o número de janelas (padrão: uma por unidade).
+    """
+
+    def __init__(self, units, open_reader, preprocess, infer, postprocess, *,
+                 batch_size=1, read_threads=2, prep_threads=2, queue_depth=None, total=None):
+        self.units = list(units)
+        self.total = len(self.units) if total is None else int(total)
+        self.open_reader = open_reader
+        self.preprocess = preprocess
+        self.infer = infer
+        self.postprocess = postprocess
+        self.batch_size = max(1, int(batch_size))
+        self.read_threads = max(1, int(read_threads))
+        self.prep_threads = max(1, int(prep_threads))
+        depth = queue_depth or max(4, 2 * self.batch_size)
+
+        self._work_q = queue.Queue()
+        self._read_q = queue.Queue(maxsize=depth)
+        self._prep_q = queue.Queue(maxsize=depth)
+        self._post_q = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+        self._readers_left = self.read_threads
+        self._preps_left = self.prep_threads
+
+        self.stats = {
+            "read": StageStats("read", self.read_threads),
+            "preprocess": StageStats("preprocess", self.prep_threads),
+            "infer": StageStats("infer", 1),
+            "postprocess": StageStats("postprocess", 1),
+        }
+        self.wall = 0.0
+
+    # ------------------------------------------------------------------ #
+    def _fail(self, exc):
+        with self._lock:
+            if self._error is None:
+                self._error = exc
+        self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    # ------------------------------------------------------------------ #
+    def _reader(self):
+        try:
+            read = self.open_reader()
+            while not self._stop.is_set():
+                try:
+                    unit = self._work_q.get_nowait()
+                except queue.Empty:
+                    break
+                items = iter(read(unit))
+                while not self._stop.is_set():
+                    t0 = time.perf_counter()
+                    item = next(items, _STOP)
+                    if item is _STOP:
+                        break
+                    self.stats["read"].add(time.perf_counter() - t0)
+                    if not self._put(self._read_q, item):
+                        break
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            with self._lock:
+                self._readers_left -= 1
+                last = self._readers_left == 0
+            if last:
+                for _ in range(self.prep_threads):
+                    self._put(self._read_q, _STOP)
+
+    def _preprocessor(self):
+        try:
+            while True:
+                item = self._get(self._read_q)
+                if item is _STOP:
+                    break
+                win, img = item
+                tensor = None
+                if img is not None:
+                    t0 = time.perf_counter()
+                    tensor = self.preprocess(win, img)
+                    self.stats["preprocess"].add(time.perf_counter() - t0)
+                if not self._put(self._prep_q, (win, tensor)):
+                    break
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            with self._lock:
+                self._preps_left -= 1
+                last = self._preps_left == 0
+            if last:
+                self._put(self._prep_q, _STOP)
+
+    def _postprocessor(self):
+        try:
+            while True:
+                item = self._get(self._post_q)
+                if item is _STOP:
+                    break
+                win, out = item
+                t0 = time.perf_counter()
+                self.postprocess(win, out)
+                self.stats["postprocess"].add(time.perf_counter() - t0)
+        except Exception as exc:
+            self._fail(exc)
+
+    # ------------------------------------------------------------------ #
+    def run(self, is_canceled=None, on_progress=None):
+        """
+        Roda o pipeline até o fim. Levanta PipelineCanceled se `is_canceled()`
+        ficar verdadeiro, ou repassa a primeira exceção de qualquer estágio
+        (incluindo a inferência, para o chamador decidir o backoff).
+        """
+        is_canceled = is_canceled or (lambda: False)
+        for unit in self.units:
+            self._work_q.put(unit)
+
+        threads = [threading.Thread(target=self._reader, name=f"netflora-read-{i}", daemon=True)
+                   for i in range(self.read_threads)]
+        threads += [threading.Thread(target=self._preprocessor, name=f"netflora-prep-{i}", daemon=True)
+                    for i in range(self.prep_threads)]
+        post = threading.Thread(target=self._postprocessor, name="netflora-post", daemon=True)
+        threads.append(post)
+
+        t_start = time.perf_counter()
+        for t in threads:
+            t.start()
+
+        done = 0
+        batch = []
+        try:
+            while True:
+                if is_canceled():
+                    raise PipelineCanceled()
+                try:
+                    item = self._prep_q.get(timeout=_POLL_S)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                finished = item is _STOP
+                if not finished:
+                    win, tensor = item
+                    if tensor is None:
+                        done += 1
+                    else:
+                        batch.append((win, tensor))
+                if batch and (finished or len(batch) >= self.batch_size):
+                    t0 = time.perf_counter()
+                    outs = self.infer([t for _, t in batch])
+                    self.stats["infer"].add(time.perf_counter() - t0, len(batch))
+                    for (win, _), out in zip(batch, outs):
+                        if not self._put(self._post_q, (win, out)):
+                            break
+                    done += len(batch)
+                    batch = []
+                if on_progress is not None and not finished:
+                    on_progress(done, self.total)
+                if finished:
+                    break
+            self._put(self._post_q, _STOP)
+            post.join()
+        except BaseException as exc:
+            self._fail(exc)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            self.wall = time.perf_counter() - t_start
+
+        if self._error is not None:
+            raise self._error
+        return done
+
+    def summary(self):
+        """Linha de log com a ocupação de cada estágio."""
+        parts = []
+        for st in self.stats.values():
+            parts.append(f"{st.name} {st.busy:.1f}s/{st.workers}t ({100.0 * st.utilization(self.wall):.0f}%)")
+        return f"wall {self.wall:.1f}s | " + ", ".join(parts)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente das detecções brutas (antes do corte de confiança, dos
+filtros de tamanho e do NMS).
+
+A inferência só depende do raster, do modelo e do plano de janelas; o corte
+de confiança, os filtros de tamanho e o IoU do NMS são aplicados depois,
+sobre as caixas já georreferenciadas. Guardando as caixas brutas por
+(impressão digital do raster, hash do modelo, tiling), uma nova execução que
+só muda esses parâmetros refaz a camada de saída sem rodar o modelo.
+
+A chave inclui a sobreposição entre janelas, que vem do maior objeto aceito
+pelos filtros de tamanho: mudar limites mínimos, razão de aspecto ou classes
+que não definem o maior objeto reaproveita o cache; aumentar ou reduzir o
+maior objeto muda o plano de janelas e exige nova inferência (o resultado
+é sempre o mesmo de uma execução sem cache).
+
+Cada entrada é um .npz colunar (x0, y0, x1, y1 em float64, classe em int16,
+confiança em float32) numa pasta com orçamento de tamanho: ao gravar, os
+arquivos menos usados recentemente (mtime, atualizado a cada acerto) saem
+até o total caber no orçamento.
+"""
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_MB = 2048
+_SUFFIX = ".npz"
+
+
+def _to_columns(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    return {
+        "x0": boxes[:, 0], "y0": boxes[:, 1], "x1": boxes[:, 2], "y1": boxes[:, 3],
+        "cls": boxes[:, 4].astype(np.int16), "conf": boxes[:, 5].astype(np.float32),
+    }
+
+
+def _from_columns(cols):
+    out = np.empty((len(cols["conf"]), 6), dtype=np.float64)
+    for i, name in enumerate(("x0", "y0", "x1", "y1", "cls", "conf")):
+        out[:, i] = cols[name]
+    return out
+
+
+class RawDetectionCache:
+    """Caixas brutas (N, 6) por chave, em `directory`, limitadas a `max_mb`."""
+
+    def __init__(self, directory, max_mb=DEFAULT_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max(0.0, float(max_mb)) * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:32] + _SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                if str(data["key"]) != key:
+                    return None
+                boxes = _from_columns(data)
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path)  # acerto: vira o mais recente para o LRU
+        except OSError:
+            pass
+        return boxes
+
+    def put(self, key, boxes):
+        if self.max_bytes <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "wb") as handle:
+                np.savez(handle, key=np.array(key), **_to_columns(boxes))
+            os.replace(tmp, path)
+            self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -22,7 +22,7 @@ from reportlab.lib import colors
 from reportlab.lib.units import cm
 from reportlab.lib.pagesizes import A4
 
-from qgis.core import QgsVectorLayer
+from qgis.core import QgsFeatureRequest, QgsVectorLayer
 
 # ========================== CONFIG ==========================
 HEADER_ICON_FILENAMES   = [ "Embrapa-Acre.png","Netflora.png", "Fundo-JBS.png"]
@@ -117,8 +117,62 @@ def _save_fig_to_tmp(fig, name):
 
 # -------------------------- content helpers -------------------------- #
 
-def _safe_get(f, name, default=None):
-    return f[name] if name in f.fields().names() else default
+# atributos usados pelo relatório (class_id cai para label/class se faltar)
+_REPORT_FIELDS = ("class_id", "label", "class", "conf", "width", "height", "common_name", "sci_name")
+
+
+def _frame_from_layer(vector_layer):
+    """
+    DataFrame do relatório lido da camada: só os atributos usados, sem
+    geometria, em colunas. width/height nulos (ou ausentes) vêm do
+    retângulo envolvente, lido numa segunda consulta só dessas feições.
+    """
+    fields = vector_layer.fields()
+    names = fields.names()
+    wanted = [n for n in _REPORT_FIELDS if n in names]
+
+    request = QgsFeatureRequest()
+    request.setSubsetOfAttributes(wanted, fields)
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+
+    index = [fields.indexOf(n) for n in wanted]
+    cols = {n: [] for n in wanted}
+    fids = []
+    for f in vector_layer.getFeatures(request):
+        attrs = f.attributes()
+        for n, i in zip(wanted, index):
+            cols[n].append(attrs[i])
+        fids.append(f.id())
+
+    df = pd.DataFrame(cols)
+    if "class_id" not in df.columns:
+        df["class_id"] = None
+    for fallback in ("label", "class"):
+        if fallback in df.columns:
+            df["class_id"] = df["class_id"].where(df["class_id"].notna(), df[fallback])
+    for n in ("conf", "width", "height"):
+        df[n] = pd.to_numeric(df[n], errors="coerce") if n in df.columns else np.nan
+
+    missing = np.flatnonzero((df["width"].isna() | df["height"].isna()).to_numpy())
+    if missing.size:
+        row_of = {fids[i]: i for i in missing}
+        bbox_request = QgsFeatureRequest()
+        bbox_request.setFilterFids(set(row_of))
+        bbox_request.setSubsetOfAttributes([])
+        width = df["width"].to_numpy(copy=True)
+        height = df["height"].to_numpy(copy=True)
+        for f in vector_layer.getFeatures(bbox_request):
+            geom = f.geometry()
+            if geom is None or geom.isNull():
+                continue
+            bbox = geom.boundingBox()
+            i = row_of[f.id()]
+            if np.isnan(width[i]):
+                width[i] = float(bbox.width())
+            if np.isnan(height[i]):
+                height[i] = float(bbox.height())
+        df["width"], df["height"] = width, height
+    return df
 
 def _fmt_int(x):
     try:
@@ -174,13 +228,40 @@ def _silverman_bandwidth(x):
     if sigma <= 0: sigma = 1e-6
     return 1.06 * sigma * n ** (-1/5)
 
+# KDE binada: passo da malha <= bw / _KDE_STEPS_PER_BW, entre _KDE_MIN_BINS e _KDE_MAX_BINS pontos
+_KDE_STEPS_PER_BW = 10
+_KDE_MIN_BINS = 512
+_KDE_MAX_BINS = 1 << 18
+_KDE_TRUNCATE = 5.0  # núcleo cortado em ±5 bw
+
 def _kde_gaussian(x_grid, samples, bw=None):
-    x = np.asarray(samples); x = x[np.isfinite(x)]
+    """
+    KDE gaussiana nos pontos de `x_grid`: amostras em binagem linear numa
+    malha regular, convolução com o núcleo por FFT e interpolação em
+    `x_grid`. A memória depende só do tamanho da malha, não de n.
+    """
+    x_grid = np.asarray(x_grid, dtype=float)
+    x = np.asarray(samples, dtype=float); x = x[np.isfinite(x)]
     if x.size == 0: return np.zeros_like(x_grid, dtype=float)
     if not bw or bw <= 0: bw = _silverman_bandwidth(x)
-    u = (x_grid[:, None] - x[None, :]) / bw
-    dens = np.exp(-0.5 * u * u).sum(axis=1) / (x.size * bw * np.sqrt(2.0 * np.pi))
-    return dens
+    if not bw or bw <= 0: bw = 1.0
+    lo = min(float(x.min()), float(x_grid.min())); hi = max(float(x.max()), float(x_grid.max()))
+    if hi <= lo: hi = lo + bw
+    m = int(np.clip(np.ceil((hi - lo) * _KDE_STEPS_PER_BW / bw) + 1, _KDE_MIN_BINS, _KDE_MAX_BINS))
+    delta = (hi - lo) / (m - 1)
+
+    # binagem linear: cada amostra divide o peso entre os dois pontos vizinhos
+    pos = (x - lo) / delta
+    left = np.clip(np.floor(pos).astype(np.int64), 0, m - 2)
+    frac = np.clip(pos - left, 0.0, 1.0)
+    counts = np.bincount(left, weights=1.0 - frac, minlength=m) + np.bincount(left + 1, weights=frac, minlength=m)
+
+    half = min(m - 1, int(np.ceil(_KDE_TRUNCATE * bw / delta)))
+    u = np.arange(-half, half + 1) * delta / bw
+    kernel = np.exp(-0.5 * u * u) / (x.size * bw * np.sqrt(2.0 * np.pi))
+    size = 1 << int(np.ceil(np.log2(m + kernel.size - 1)))
+    dens = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)[half:half + m]
+    return np.interp(x_grid, lo + delta * np.arange(m), np.maximum(dens, 0.0))
 
 def _plot_hist_with_density(ax, data, xlabel="Diameter (m)"):
     x = np.asarray(data); x = x[np.isfinite(x)]
@@ -314,13 +395,19 @@ def generate_report(
         *,
         min_conf=None,
         extra_images=None,
-        show_hist=True
+        show_hist=True,
+        detections=None
     ):
     """
     Relatório com:
       • Cabeçalho: Netflora.png, Embrapa-Acre.png, Fundo-JBS.png (de common/icons) + linha verde
       • Rodapé: linha + (site | endereço | e-mail) centralizado, com links
       • Cores por espécie, eixos adaptativos, histograma + KDE
+
+    `detections` (DataFrame ou dict de arrays com class_id, conf, width,
+    height e, opcionais, common_name e sci_name, uma posição por caixa)
+    vem direto do detector; com ele a camada não é lida e `vector_layer`
+    pode ser None.
     """
     _matplotlib_defaults()
     styles = getSampleStyleSheet()
@@ -352,56 +439,31 @@ def generate_report(
         story.append(Paragraph(f"<b>Confidence filter:</b> ≥ {min_conf:.2f}", body))
     story.append(Spacer(1, 0.35*cm))
 
-    # ---- Extract attributes safely ----
-    records = []
-    if vector_layer is None or not isinstance(vector_layer, QgsVectorLayer):
-        story.append(Paragraph("⚠ No layer or invalid vector layer provided.", warn))
+    # ---- Attributes: detector arrays, or the layer (columns only) ----
+    def _finish_with(message):
+        story.append(Paragraph(message, warn))
         onpage = _build_onpage_drawer(header_icon_paths, left_cm, right_cm)
         doc.build(story, onFirstPage=onpage, onLaterPages=onpage)
         return output_pdf
 
-    field_names = vector_layer.fields().names()
-    has_common = "common_name" in field_names
-    has_sci    = "sci_name" in field_names
-
-    for f in vector_layer.getFeatures():
-        cid = _safe_get(f, "class_id")
-        if cid is None:
-            cid = _safe_get(f, "label", _safe_get(f, "class", None))
-        conf = _safe_get(f, "conf")
-        w    = _safe_get(f, "width")
-        h    = _safe_get(f, "height")
-        if w is None or h is None:
-            bbox = f.geometry().boundingBox() if f and f.geometry() else None
-            if bbox is not None:
-                w = float(bbox.width())  if w is None else float(w)
-                h = float(bbox.height()) if h is None else float(h)
-        rec = {
-            "class_id": cid,
-            "conf": float(conf) if conf is not None else None,
-            "width": float(w) if w is not None else None,
-            "height": float(h) if h is not None else None,
-        }
-        if has_common: rec["common_name"] = _safe_get(f, "common_name")
-        if has_sci:    rec["sci_name"]    = _safe_get(f, "sci_name")
-        records.append(rec)
-
-    if not records:
-        story.append(Paragraph("⚠ No detections found.", warn))
-        onpage = _build_onpage_drawer(header_icon_paths, left_cm, right_cm)
-        doc.build(story, onFirstPage=onpage, onLaterPages=onpage)
-        return output_pdf
+    if detections is not None:
+        df = detections.copy() if isinstance(detections, pd.DataFrame) else pd.DataFrame(detections)
+    elif vector_layer is None or not isinstance(vector_layer, QgsVectorLayer):
+        return _finish_with("⚠ No layer or invalid vector layer provided.")
+    else:
+        df = _frame_from_layer(vector_layer)
+
+    has_common = "common_name" in df.columns
+    has_sci    = "sci_name" in df.columns
 
-    df = pd.DataFrame(records)
+    if df.empty:
+        return _finish_with("⚠ No detections found.")
 
     if min_conf is not None and "conf" in df.columns:
         df = df[df["conf"].fillna(0) >= min_conf].copy()
 
     if df.empty:
-        story.append(Paragraph("⚠ All detections filtered out by confidence threshold.", warn))
-        onpage = _build_onpage_drawer(header_icon_paths, left_cm, right_cm)
-        doc.build(story, onFirstPage=onpage, onLaterPages=onpage)
-        return output_pdf
+        return _finish_with("⚠ All detections filtered out by confidence threshold.")
 
     df["diameter"] = (df["width"].fillna(0) + df["height"].fillna(0)) / 2.0
 
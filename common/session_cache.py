@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de InferenceSession no processo do QGIS.
+
+As sessões são indexadas pelo SHA-256 do arquivo do modelo (e pelas opções
+da sessão), então algoritmos de biomas diferentes que usam os mesmos pesos
+compartilham uma única sessão, e rodar vários rasters em sequência não
+recria/reotimiza o grafo a cada chamada. A memória é limitada por um
+orçamento em MB com descarte LRU.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import psutil
+    _HAS_PSUTIL = True
+except Exception:
+    _HAS_PSUTIL = False
+
+DEFAULT_BUDGET_MB = 2048
+
+_DIGESTS = {}
+_DIGESTS_LOCK = threading.Lock()
+
+
+def model_digest(path: str) -> str:
+    """SHA-256 do arquivo, memorizado por (caminho, tamanho, mtime)."""
+    st = os.stat(path)
+    stamp = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    with _DIGESTS_LOCK:
+        cached = _DIGESTS.get(stamp)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _DIGESTS_LOCK:
+        _DIGESTS[stamp] = value
+    return value
+
+
+def process_rss_mb():
+    if not _HAS_PSUTIL:
+        return None
+    try:
+        return psutil.Process().memory_info().rss / (1024.0 * 1024.0)
+    except Exception:
+        return None
+
+
+class SessionCache:
+    """LRU de sessões com orçamento de memória (MB estimados por sessão)."""
+
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget_mb = float(budget_mb)
+        self._entries = OrderedDict()  # key -> (value, size_mb)
+        self._lock = threading.RLock()
+        # serializa a criação: duas threads pedindo o mesmo modelo não o carregam duas vezes
+        self.build_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def used_mb(self):
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_budget(self, budget_mb):
+        with self._lock:
+            self.budget_mb = float(budget_mb)
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size_mb):
+        """Guarda `value`; devolve a lista de chaves descartadas para caber no orçamento."""
+        with self._lock:
+            self._entries[key] = (value, max(0.0, float(size_mb)))
+            self._entries.move_to_end(key)
+            return self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        evicted = []
+        total = sum(size for _, size in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_mb:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)[1]
+            evicted.append(key)
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_CACHE = SessionCache()
+
+
+def session_cache() -> SessionCache:
+    return _CACHE
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Detecção multiprocesso: o raster é dividido em faixas de linhas de janelas e
+cada faixa roda em um processo próprio, com seu gdal.Dataset, sua sessão ORT
+e um número fixo de threads intra-op. Isso contorna o GIL e o overhead por
+chamada que limitam o escalonamento de uma única sessão em CPUs com muitos
+núcleos.
+
+Cada processo aplica o NMS dentro da sua faixa; no processo principal o NMS
+é refeito apenas nas caixas que tocam as costuras entre faixas (onde janelas
+de faixas vizinhas se sobrepõem).
+"""
+import multiprocessing
+import os
+import queue
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from . import inference
+from .detections import DetectionStore
+from .nms import nms_center_overlap
+from .pipeline import PipelineCanceled
+
+_PROGRESS_Q = None
+_CANCEL = None
+
+
+def _init_worker(progress_q, cancel_event):
+    global _PROGRESS_Q, _CANCEL
+    _PROGRESS_Q = progress_q
+    _CANCEL = cancel_event
+
+
+def _python_executable():
+    """
+    Interpretador para os processos filhos. Dentro do QGIS sys.executable
+    aponta para o binário do QGIS (qgis-bin.exe, QGIS.app), não para o Python.
+    """
+    exe = sys.executable or ""
+    if os.path.basename(exe).lower().startswith("python"):
+        return None
+    for cand in (
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "python3.exe"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+        os.path.join(sys.exec_prefix, "bin", "python"),
+    ):
+        if os.path.exists(cand):
+            return cand
+    return None
+
+
+def split_bands(windows, n_bands):
+    """
+    Agrupa as janelas em até `n_bands` faixas contíguas de linhas (mesmo y),
+    com número de janelas parecido. Devolve uma lista de listas de janelas.
+    """
+    rows = {}
+    for win in windows:
+        rows.setdefault(win[2], []).append(win)
+    ys = sorted(rows)
+    n_bands = max(1, min(int(n_bands), len(ys)))
+    target = len(windows) / float(n_bands)
+
+    bands, current, acc = [], [], 0
+    for i, y in enumerate(ys):
+        current.extend(rows[y])
+        acc += len(rows[y])
+        rows_left = len(ys) - i - 1
+        bands_left = n_bands - len(bands) - 1
+        if bands_left > 0 and (acc >= target * (len(bands) + 1) or rows_left == bands_left):
+            bands.append(current)
+            current = []
+    if current:
+        bands.append(current)
+    return bands
+
+
+def _band_rows(band):
+    """Faixa de linhas de pixel [y0, y1) coberta pelas janelas da faixa."""
+    return min(w[2] for w in band), max(w[2] + w[4] for w in band)
+
+
+def _band_worker(job):
+    band = job["band"]
+    sess, _ = inference._get_ort_session(job["model_path"], None, intra_op_threads=job["threads"])
+    if sess is None:
+        raise RuntimeError("não foi possível criar a sessão ONNX no processo de trabalho")
+    bs = inference._session_batch_limit(sess, job["batch_size"])
+    limits = None if job["raw"] else inference._size_limits(job["size_filter"], job["class_size_filters"])
+
+    checkpoint = None
+    if job["checkpoint"] is not None:
+        from .checkpoint import DetectionCheckpoint
+        checkpoint = DetectionCheckpoint(*job["checkpoint"])
+    store = None
+    if job["incremental"] is not None:
+        from .incremental import IncrementalStore
+        store = IncrementalStore(*job["incremental"])
+
+    last = [0]
+
+    def _progress(done, n):
+        if done - last[0] >= 10 or done == n:
+            last[0] = done
+            _PROGRESS_Q.put((band, done))
+
+    try:
+        raw, pipe = inference._detect_windows(
+            sess, job["image_path"], job["windows"], job["geo"], job["conf"], limits,
+            batch_size=bs, read_threads=job["read_threads"], prep_threads=job["prep_threads"],
+            strip_reads=job["strip_reads"], validity=job["validity"],
+            owned=job["owned"], read_size=job["read_size"], resample=job["resample"],
+            checkpoint=checkpoint, incremental=store, is_canceled=_CANCEL.is_set, on_progress=_progress,
+        )
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if store is not None:
+            store.close()
+    if not job["raw"]:
+        raw = raw.subset(nms_center_overlap(raw, job["iou"], per_class=job["per_class"]))
+    summary = pipe.summary()
+    if store is not None:
+        summary += f" | incremental: {store.reused} reaproveitadas, {store.changed} inferidas"
+    return band, raw.boxes(), summary, pipe.wall
+
+
+def merge_band_detections(band_boxes, band_rows, geo, iou_threshold=0.85, per_class=False):
+    """
+    Junta as caixas (já com NMS local) de cada faixa. Só as caixas que
+    alcançam a zona de sobreposição entre faixas vizinhas passam por um novo
+    NMS; as demais não têm como colidir com caixas de outra faixa.
+    """
+    parts = [b for b in band_boxes if len(b)]
+    if not parts:
+        return np.zeros((0, 6), dtype=np.float64)
+    boxes = np.concatenate(parts, axis=0)
+
+    # as caixas dos processos já saíram de um DetectionStore com esta origem:
+    # reempacotá-las não muda as coordenadas
+    store = DetectionStore.from_boxes(boxes, origin=(geo[0], geo[2]))
+    top_left_y, neg_pxH = geo[2], geo[3] or -1.0
+    seam = np.zeros(len(boxes), dtype=bool)
+    for (_, prev_end), (next_start, _) in zip(band_rows[:-1], band_rows[1:]):
+        ya, yb = top_left_y + next_start * neg_pxH, top_left_y + prev_end * neg_pxH
+        seam[store.in_bbox(-np.inf, min(ya, yb), np.inf, max(ya, yb))] = True
+
+    seam_boxes = boxes[seam]
+    keep = nms_center_overlap(seam_boxes, iou_threshold, per_class=per_class)
+    merged = np.concatenate([boxes[~seam], seam_boxes[keep]], axis=0)
+    order = np.argsort(-merged[:, 5], kind="stable")
+    return merged[order]
+
+
+def run_sharded_detection(image_path, model_path, windows, geo, confidence_threshold, feedback, *,
+                          workers, threads_per_worker=0, batch_size=1, read_threads=1, prep_threads=1,
+                          strip_reads=True, validity=None, owned=None, read_size=None, resample="bilinear",
+                          checkpoint=None, incremental=None, raw=False, stats=None, size_filter=None, class_size_filters=None, per_class_nms=False,
+                          iou_threshold=0.85):
+    """
+    Executa as janelas em `workers` processos e devolve as caixas finais
+    (N, 6), já deduplicadas. Levanta PipelineCanceled se o usuário cancelar
+    e repassa erros dos processos (inclusive OOM) ao chamador. Com `stats`
+    (dict), guarda em stats["band_walls"] o tempo do pipeline de cada faixa.
+    Com `checkpoint` (DetectionCheckpoint já validado), cada processo abre o
+    mesmo arquivo, pula as janelas gravadas e grava as que concluir; o
+    mesmo vale para o repositório `incremental` (IncrementalStore). Com
+    `raw`, as janelas são decodificadas sem filtros de tamanho e as caixas
+    brutas de todas as faixas voltam sem NMS, na ordem das janelas.
+    """
+    bands = split_bands(windows, workers)
+    rows = [_band_rows(b) for b in bands]
+    threads = int(threads_per_worker or 0) or max(1, (os.cpu_count() or 1) // len(bands))
+    inference._log(feedback, f"[Netflora] {len(bands)} faixas x {threads} threads intra-op por processo")
+
+    ctx = multiprocessing.get_context("spawn")
+    exe = _python_executable()
+    if exe:
+        ctx.set_executable(exe)
+    progress_q = ctx.Queue()
+    cancel = ctx.Event()
+
+    jobs = [{
+        "band": i, "windows": band, "image_path": image_path, "model_path": model_path,
+        "geo": geo, "conf": confidence_threshold, "threads": threads, "batch_size": batch_size,
+        "read_threads": read_threads, "prep_threads": prep_threads, "strip_reads": strip_reads,
+        "validity": validity, "owned": owned, "read_size": read_size, "resample": resample,
+        "size_filter": size_filter, "class_size_filters": class_size_filters,
+        "iou": iou_threshold, "per_class": per_class_nms,
+        "checkpoint": None if checkpoint is None else (checkpoint.path, checkpoint.signature),
+        "incremental": None if incremental is None else (incremental.path, incremental.signature),
+        "raw": raw,
+    } for i, band in enumerate(bands)]
+
+    is_canceled = getattr(feedback, "isCanceled", lambda: False)
+    total = len(windows)
+    done_by_band = {}
+    last_logged = 0
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=len(bands), mp_context=ctx,
+                             initializer=_init_worker, initargs=(progress_q, cancel)) as pool:
+        pending = {pool.submit(_band_worker, job) for job in jobs}
+        try:
+            while pending:
+                finished, pending = wait(pending, timeout=0.2)
+                while True:
+                    try:
+                        band, done = progress_q.get_nowait()
+                    except queue.Empty:
+                        break
+                    done_by_band[band] = done
+                n_done = sum(done_by_band.values())
+                if n_done // 50 > last_logged // 50:
+                    last_logged = n_done
+                    inference._log(feedback, f"[Netflora] Janelas: {n_done}/{total}")
+                if is_canceled():
+                    raise PipelineCanceled()
+                for fut in finished:
+                    band, boxes, summary, wall = fut.result()
+                    results[band] = boxes
+                    if stats is not None:
+                        stats.setdefault("band_walls", []).append(wall)
+                    inference._log(feedback, f"[Netflora] Faixa {band + 1}/{len(bands)}: {len(boxes)} caixas | {summary}")
+        except BaseException:
+            cancel.set()
+            for fut in pending:
+                fut.cancel()
+            raise
+
+    if raw:
+        parts = [results[i] for i in range(len(bands))]
+        return np.concatenate(parts, axis=0) if parts else np.zeros((0, 6), dtype=np.float64)
+    return merge_band_detections(
+        [results[i] for i in range(len(bands))], rows, geo,
+        iou_threshold=iou_threshold, per_class=per_class_nms,
+    )
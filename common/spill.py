@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Detecções brutas em disco, para mosaicos em que nem o DetectionStore cabe
+na memória.
+
+Cada janela concluída grava suas caixas numa tabela SQLite com índice
+espacial R-tree (coordenadas do mapa). No fim, o NMS roda faixa a faixa:
+para cada linha de janelas, uma consulta ao R-tree traz as caixas cujo
+topo cai na faixa, e elas passam pelo mesmo NMS incremental do modo
+streaming (RowStreamNMS), com a mesma aproximação de costura. A memória
+fica limitada às caixas de uma faixa mais as retidas na costura, e as
+caixas finais saem em lotes, direto do disco.
+
+O arquivo é de rascunho (apagado no fim da execução): é SQLite simples, sem
+as tabelas de metadados de um GeoPackage.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .streaming import RowStreamNMS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY, tile INTEGER, row0 REAL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL, cls INTEGER, conf REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS detections_rtree USING rtree(id, minx, maxx, miny, maxy);
+"""
+_COMMIT_EVERY_S = 2.0
+
+
+class DetectionSpill:
+    """
+    Caixas brutas (N, 6) por janela em `path`. Tem a interface de
+    `stream` de _detect_windows: add(win, boxes).
+    """
+
+    def __init__(self, path, geo):
+        self.path = path
+        self._geo = geo
+        self.count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # rascunho: uma queda perde a execução de qualquer jeito
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(_SCHEMA)
+        self._last_commit = time.monotonic()
+        self.clear()
+
+    def _rows(self, y):
+        return (np.asarray(y, dtype=np.float64) - self._geo[2]) / (self._geo[3] or -1.0)
+
+    def add(self, win, boxes):
+        """Grava as caixas da janela `win` (coordenadas do mapa)."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        if not len(boxes):
+            return
+        # linha de pixel do topo da caixa: define a faixa em que ela entra no NMS
+        row0 = np.minimum(self._rows(boxes[:, 1]), self._rows(boxes[:, 3]))
+        with self._lock:
+            first = self.count + 1
+            ids = range(first, first + len(boxes))
+            self._conn.executemany(
+                "INSERT INTO detections(id, tile, row0, x0, y0, x1, y1, cls, conf) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((i, int(win[0]), r, a, b, c, d, int(e), f)
+                 for i, r, (a, b, c, d, e, f) in zip(ids, row0.tolist(), boxes.tolist())))
+            self._conn.executemany(
+                "INSERT INTO detections_rtree(id, minx, maxx, miny, maxy) VALUES(?, ?, ?, ?, ?)",
+                ((i, a, c, b, d) for i, (a, b, c, d) in zip(ids, boxes[:, :4].tolist())))
+            self.count += len(boxes)
+            if time.monotonic() - self._last_commit >= _COMMIT_EVERY_S:
+                self._conn.commit()
+                self._last_commit = time.monotonic()
+
+    def clear(self):
+        """Apaga tudo (nova tentativa com outro tiling)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM detections")
+            self._conn.execute("DELETE FROM detections_rtree")
+            self._conn.commit()
+            self.count = 0
+
+    def band(self, row_from, row_to):
+        """(N, 6) das caixas cujo topo está nas linhas [row_from, row_to), em ordem de janela."""
+        ya, yb = (self._geo[2] + r * (self._geo[3] or -1.0) for r in (row_from, row_to))
+        lo, hi = min(ya, yb), max(ya, yb)
+        with self._lock:
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT d.x0, d.y0, d.x1, d.y1, d.cls, d.conf FROM detections_rtree r "
+                "JOIN detections d ON d.id = r.id "
+                "WHERE r.maxy >= ? AND r.miny <= ? AND d.row0 >= ? AND d.row0 < ? "
+                "ORDER BY d.tile, d.id",
+                (lo, hi, row_from, row_to)).fetchall()
+        return np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+
+    def run_nms(self, rows, emit, *, iou_threshold=0.85, per_class=False, is_canceled=None):
+        """
+        NMS por faixas (uma por linha de janelas, `rows` = y das janelas);
+        as caixas finais vão em lotes (N, 6) para `emit`. Devolve o total.
+        """
+        rows = sorted(set(rows)) or [0]
+        bands = [(i, 0, y, 0, 0) for i, y in enumerate(rows)]
+        stream = RowStreamNMS(bands, self._geo, emit, iou_threshold=iou_threshold, per_class=per_class)
+        inf = float("inf")
+        for i, band in enumerate(bands):
+            if is_canceled is not None and is_canceled():
+                return stream.emitted
+            row_from = -inf if i == 0 else band[2]
+            row_to = inf if i == len(bands) - 1 else bands[i + 1][2]
+            stream.add(band, self.band(row_from, row_to))
+        stream.finish()
+        return stream.emitted
+
+    @property
+    def nbytes(self):
+        try:
+            return sum(os.path.getsize(self.path + s) for s in ("", "-wal") if os.path.exists(self.path + s))
+        except OSError:
+            return 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def discard(self):
+        """Fecha e apaga o arquivo."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
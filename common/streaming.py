@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Detecções em fluxo: as caixas finais vão para a camada de saída à medida que
+as linhas de janelas terminam, em vez de acumular o raster inteiro e só
+gravar no fim.
+
+As janelas terminam fora de ordem (várias threads leitoras, faixas). Uma
+linha de janelas está finalizada quando ela e todas as anteriores
+terminaram. A cada avanço, as caixas das linhas finalizadas passam pelo NMS
+junto com as que ficaram retidas; as que acabam acima da primeira linha de
+pixels ainda não coberta (início da próxima linha de janelas) não podem
+encostar em caixas futuras e são gravadas; as que tocam essa costura ficam
+retidas para o próximo avanço. A memória fica limitada a cerca de uma linha
+de janelas, e o resultado segue a mesma aproximação de costura do modo
+multiprocesso (sharding.merge_band_detections).
+"""
+import queue
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from .nms import nms_center_overlap
+
+_NO_BOXES = np.zeros((0, 6), dtype=np.float64)
+
+
+class RowStreamNMS:
+    """
+    NMS incremental por linhas de janelas. `emit(boxes)` recebe lotes (N, 6)
+    de caixas finais; `prefilter(boxes)`, se dado, é aplicado às caixas de
+    cada janela antes do NMS (ex.: corte de confiança sobre caixas brutas).
+    """
+
+    def __init__(self, windows, geo, emit, *, iou_threshold=0.85, per_class=False, prefilter=None):
+        self.rows = sorted({w[2] for w in windows})
+        self._left = Counter(w[2] for w in windows)
+        self._pending = {y: [] for y in self.rows}
+        self._next = 0
+        self._carry = _NO_BOXES
+        self._geo = geo
+        self._emit = emit
+        self._iou = iou_threshold
+        self._per_class = per_class
+        self._prefilter = prefilter
+        self._lock = threading.Lock()
+        self.done = set()
+        self.emitted = 0
+
+    def add(self, win, boxes):
+        """Registra as caixas (N, 6) da janela `win` (vazia também conta)."""
+        if self._prefilter is not None and len(boxes):
+            boxes = self._prefilter(boxes)
+        with self._lock:
+            if win[0] in self.done:
+                return
+            self.done.add(win[0])
+            if len(boxes):
+                self._pending[win[2]].append(boxes)
+            self._left[win[2]] -= 1
+            self._advance()
+
+    def _advance(self):
+        new = []
+        while self._next < len(self.rows) and self._left[self.rows[self._next]] <= 0:
+            new.extend(self._pending.pop(self.rows[self._next]))
+            self._next += 1
+        if not new:
+            return
+        boxes = np.concatenate([self._carry] + new, axis=0)
+        boxes = boxes[nms_center_overlap(boxes, self._iou, per_class=self._per_class)]
+        if self._next >= len(self.rows):
+            self._carry = _NO_BOXES
+            self._flush(boxes)
+            return
+        seam = self.rows[self._next]
+        top_left_y, neg_pxH = self._geo[2], self._geo[3] or -1.0
+        r_a = (boxes[:, 3] - top_left_y) / neg_pxH
+        r_b = (boxes[:, 1] - top_left_y) / neg_pxH
+        safe = np.maximum(r_a, r_b) < seam
+        self._carry = boxes[~safe]
+        self._flush(boxes[safe])
+
+    def _flush(self, boxes):
+        if len(boxes):
+            self.emitted += len(boxes)
+            self._emit(boxes)
+
+    def finish(self):
+        """Grava o que restou (linhas com janelas que nunca chegaram, se houver)."""
+        with self._lock:
+            rest = [b for parts in self._pending.values() for b in parts]
+            self._pending = {}
+            self._left.clear()
+            self._next = len(self.rows)
+            if rest or len(self._carry):
+                boxes = np.concatenate([self._carry] + rest, axis=0)
+                self._carry = _NO_BOXES
+                self._flush(boxes[nms_center_overlap(boxes, self._iou, per_class=self._per_class)])
+
+
+class BatchWriter:
+    """
+    Thread que grava os lotes com `write(boxes)` fora do pipeline. A fila é
+    limitada: se a gravação atrasar, quem chama put() espera.
+    """
+
+    def __init__(self, write, max_pending=8):
+        self._write = write
+        self._q = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._error = None
+        self.count = 0
+        self.seconds = 0.0  # tempo gasto em write()
+        self._thread = threading.Thread(target=self._run, name="netflora-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            boxes = self._q.get()
+            if boxes is None:
+                break
+            if self._error is not None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                self._write(boxes)
+                self.count += len(boxes)
+            except Exception as exc:
+                self._error = exc
+            self.seconds += time.perf_counter() - t0
+
+    def put(self, boxes):
+        if self._error is not None:
+            raise self._error
+        self._q.put(boxes)
+
+    def close(self):
+        """Espera a gravação de tudo e repassa o erro da thread, se houve."""
+        self._q.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Planejamento das janelas de detecção.
+
+A sobreposição entre janelas vizinhas só precisa caber o maior objeto
+esperado (em pixels, a partir do tamanho em unidades do terreno e da
+resolução do raster): qualquer objeto desse tamanho aparece inteiro em
+alguma janela. Em cada eixo as janelas são distribuídas de maneira
+uniforme entre 0 e o fim do raster, então a última linha/coluna encosta na
+borda em vez de sair dela com padding.
+
+Cada janela "possui" a faixa central entre os meios das sobreposições com
+as vizinhas (até a borda do raster nas janelas da ponta). Uma detecção só
+é mantida pela janela que possui o seu centro; como a sobreposição cobre o
+maior objeto, essa janela vê o objeto inteiro.
+"""
+import math
+
+import numpy as np
+
+# folga somada à sobreposição (caixas do modelo não são exatas)
+_OVERLAP_MARGIN_PX = 16
+_MIN_OVERLAP_PX = 32
+
+
+def overlap_px(object_size, res, ws, max_overlap=None):
+    """Sobreposição (px) para objetos de até `object_size` (unidades do terreno)."""
+    max_overlap = ws // 2 if max_overlap is None else int(max_overlap)
+    res = abs(float(res or 0.0))
+    if not object_size or res <= 0:
+        return max_overlap
+    need = int(math.ceil(float(object_size) / res)) + _OVERLAP_MARGIN_PX
+    return max(min(_MIN_OVERLAP_PX, max_overlap), min(need, max_overlap))
+
+
+def axis_positions(length, ws, overlap):
+    """
+    Início das janelas num eixo de `length` pixels: a primeira em 0, a
+    última terminando em `length`, o mínimo de janelas para que vizinhas se
+    sobreponham em pelo menos `overlap` pixels.
+    """
+    if length <= ws:
+        return [0]
+    step = max(1, ws - int(overlap))
+    n = int(math.ceil((length - ws) / float(step))) + 1
+    span = length - ws
+    return [int(round(k * span / float(n - 1))) for k in range(n)]
+
+
+def _owned_ranges(pos, ws, length):
+    """Faixa [lo, hi) possuída por cada janela: até o meio de cada sobreposição."""
+    lo = [0] + [(prev + ws + p) // 2 for prev, p in zip(pos[:-1], pos[1:])]
+    hi = lo[1:] + [length]
+    return lo, hi
+
+
+def plan_windows(width, height, ws, overlap_x, overlap_y=None):
+    """
+    Devolve (windows, owned): windows na ordem linha a linha, no formato
+    (idx, x, y, ww, hh, ws); owned (N, 4) int64 com (x0, y0, x1, y1), a área
+    do raster (px) possuída por cada janela.
+    """
+    overlap_y = overlap_x if overlap_y is None else overlap_y
+    if width <= 0 or height <= 0:
+        return [], np.zeros((0, 4), dtype=np.int64)
+    xs = axis_positions(width, ws, overlap_x)
+    ys = axis_positions(height, ws, overlap_y)
+    x_lo, x_hi = _owned_ranges(xs, ws, width)
+    y_lo, y_hi = _owned_ranges(ys, ws, height)
+
+    windows = []
+    owned = np.empty((len(xs) * len(ys), 4), dtype=np.int64)
+    for j, y in enumerate(ys):
+        hh = min(ws, height - y)
+        for i, x in enumerate(xs):
+            idx = len(windows)
+            windows.append((idx, x, y, min(ws, width - x), hh, ws))
+            owned[idx] = (x_lo[i], y_lo[j], x_hi[i], y_hi[j])
+    return windows, owned
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Mapa de validade em baixa resolução, montado antes do tiling.
+
+Em voos de contorno irregular boa parte do retângulo do raster é nodata.
+Em vez de decodificar cada janela em resolução cheia para só então
+descobrir que ela é toda zero, o mapa é lido de uma overview (ou da banda
+de máscara) e responde, por janela: vazia (nem é lida), parcialmente
+válida (a área inválida é zerada depois da leitura) ou toda válida.
+
+Fonte da validade, na ordem em que o GDAL expõe a máscara da banda 1:
+    banda alfa        -> alfa > 0
+    valor nodata      -> algum canal diferente do nodata
+    máscara do dataset-> máscara > 0
+    sem máscara       -> algum canal diferente de zero (mesma regra do
+                         descarte de janelas vazias)
+"""
+import math
+
+import numpy as np
+from osgeo import gdal
+
+# maior fator de redução aceito para a overview usada no mapa
+_MAX_FACTOR = 32
+
+
+def _dilate(mask):
+    """Dilatação 3x3: uma célula vizinha de célula válida também conta como válida."""
+    padded = np.pad(mask, 1)
+    h, w = mask.shape
+    out = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            out |= padded[dy:dy + h, dx:dx + w]
+    return out
+
+
+def _coarse_read(band, width, max_factor, allow_full=False):
+    """
+    Lê `band` pela overview mais grossa com fator <= max_factor (ou a mais
+    fina, se todas forem mais grossas). Sem overviews, só lê se `allow_full`
+    (máscaras de 1 bit, baratas de decodificar); senão devolve None.
+    """
+    try:
+        n_ov = band.GetOverviewCount()
+    except Exception:
+        n_ov = 0
+    cands = []
+    for i in range(n_ov):
+        ov = band.GetOverview(i)
+        if ov is not None and ov.XSize > 0:
+            cands.append((width / float(ov.XSize), i, ov))
+    if cands:
+        fine = [c for c in cands if c[0] <= max_factor]
+        best = max(fine, key=lambda c: c[0]) if fine else min(cands, key=lambda c: c[0])
+        return best[2].ReadAsArray()
+    if not allow_full:
+        return None
+    bw = max(1, int(math.ceil(band.XSize / float(max_factor))))
+    bh = max(1, int(math.ceil(band.YSize / float(max_factor))))
+    return band.ReadAsArray(0, 0, band.XSize, band.YSize, buf_xsize=bw, buf_ysize=bh)
+
+
+class ValidityMap:
+    """
+    `valid` (mh, mw) bool cobrindo o raster (width x height). Para não
+    descartar pixels válidos por causa da baixa resolução, a decisão de
+    janela vazia usa o mapa dilatado e a de janela toda válida usa o mapa
+    erodido.
+
+    Em janelas parciais, `zero_cells` zera as células inválidas (fontes que
+    são máscaras de verdade: alfa ou banda de máscara) e `nodata` zera, pixel
+    a pixel, os pixels iguais ao nodata.
+    """
+
+    EMPTY, PARTIAL, FULL = 0, 1, 2
+
+    def __init__(self, valid, width, height, source="", nodata=None, zero_cells=False):
+        self.valid = np.asarray(valid, dtype=bool)
+        self.any = _dilate(self.valid)
+        self.all = ~_dilate(~self.valid)
+        self.width = int(width)
+        self.height = int(height)
+        self.sx = self.width / float(self.valid.shape[1])
+        self.sy = self.height / float(self.valid.shape[0])
+        self.source = source
+        self.nodata = nodata
+        self.zero_cells = zero_cells
+
+    @property
+    def valid_fraction(self):
+        return float(self.valid.mean()) if self.valid.size else 0.0
+
+    def _cells(self, x, y, ww, hh):
+        mh, mw = self.valid.shape
+        c0 = min(mw - 1, int(x / self.sx))
+        r0 = min(mh - 1, int(y / self.sy))
+        c1 = max(c0 + 1, min(mw, int(math.ceil((x + ww) / self.sx))))
+        r1 = max(r0 + 1, min(mh, int(math.ceil((y + hh) / self.sy))))
+        return r0, r1, c0, c1
+
+    def classify(self, win):
+        r0, r1, c0, c1 = self._cells(win[1], win[2], win[3], win[4])
+        if not self.any[r0:r1, c0:c1].any():
+            return self.EMPTY
+        if self.all[r0:r1, c0:c1].all():
+            return self.FULL
+        return self.PARTIAL
+
+    def filter(self, windows):
+        """(janelas com algum pixel válido, quantidade de janelas vazias descartadas)."""
+        kept = [win for win in windows if self.classify(win) != self.EMPTY]
+        return kept, len(windows) - len(kept)
+
+    def zero_invalid(self, img, win, size=None):
+        """
+        Zera, in-place em img (ws, ws, C), a área inválida de uma janela
+        parcial. Com `size`, img é a janela lida já reduzida para size x size.
+        """
+        if not (self.zero_cells or self.nodata is not None) or self.classify(win) != self.PARTIAL:
+            return img
+        _, x, y, ww, hh, ws = win
+        r0, r1, c0, c1 = self._cells(x, y, ww, hh)
+        sub = self.any[r0:r1, c0:c1]
+        scale = 1.0
+        bw, bh = ww, hh
+        if size:
+            scale = ws / float(size)
+            bw = max(1, int(round(ww / scale)))
+            bh = max(1, int(round(hh / scale)))
+        view = img[:bh, :bw]
+        if self.zero_cells and not sub.all():
+            py = y + (np.arange(bh) + 0.5) * scale
+            px = x + (np.arange(bw) + 0.5) * scale
+            ry = np.clip((py / self.sy).astype(np.int64) - r0, 0, r1 - r0 - 1)
+            cx = np.clip((px / self.sx).astype(np.int64) - c0, 0, c1 - c0 - 1)
+            view[~sub[ry][:, cx]] = 0
+        if self.nodata is not None:
+            # nodata é exato em resolução cheia e barato de comparar
+            view[(view == self.nodata).all(axis=-1)] = 0
+        return img
+
+
+def build_validity_map(ds, bands=(1, 2, 3), max_factor=_MAX_FACTOR):
+    """
+    Monta o ValidityMap de `ds` ou devolve None quando não há fonte barata
+    (sem overviews e sem máscara própria), caso em que vale só o descarte
+    de janelas vazias depois da leitura.
+    """
+    width, height = ds.RasterXSize, ds.RasterYSize
+    first = ds.GetRasterBand(bands[0])
+    try:
+        flags = first.GetMaskFlags()
+    except Exception:
+        return None
+
+    nodata = None
+    if flags & gdal.GMF_ALPHA:
+        alpha = None
+        for i in range(1, ds.RasterCount + 1):
+            band = ds.GetRasterBand(i)
+            if band.GetColorInterpretation() == gdal.GCI_AlphaBand:
+                alpha = band
+                break
+        if alpha is None:
+            return None
+        arr = _coarse_read(alpha, width, max_factor)
+        source = "banda alfa"
+        valid = None if arr is None else arr > 0
+    elif flags & gdal.GMF_NODATA:
+        values = [ds.GetRasterBand(b).GetNoDataValue() for b in bands]
+        if any(v is None for v in values):
+            return None
+        nodata = np.asarray(values)
+        arrs = [_coarse_read(ds.GetRasterBand(b), width, max_factor) for b in bands]
+        source = "nodata"
+        valid = None if any(a is None for a in arrs) else np.any(
+            [a != v for a, v in zip(arrs, values)], axis=0)
+    elif flags & gdal.GMF_ALL_VALID:
+        arrs = [_coarse_read(ds.GetRasterBand(b), width, max_factor) for b in bands]
+        source = "pixels não nulos"
+        valid = None if any(a is None for a in arrs) else np.any([a != 0 for a in arrs], axis=0)
+    else:
+        arr = _coarse_read(first.GetMaskBand(), width, max_factor, allow_full=True)
+        source = "banda de máscara"
+        valid = None if arr is None else arr > 0
+
+    if valid is None or valid.ndim != 2 or valid.size == 0:
+        return None
+    return ValidityMap(valid, width, height, source=source, nodata=nodata,
+                       zero_cells=source in ("banda alfa", "banda de máscara"))
+
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Geometrias das caixas em WKB, montadas em bloco com NumPy.
+
+Cada caixa vira um Polygon WKB little-endian de 93 bytes (1 anel, 5
+vértices), na mesma ordem de vértices de QgsGeometry.fromRect. O array
+estruturado é preenchido de uma vez a partir das colunas de coordenadas e
+fatiado em bytes por caixa, sem QgsRectangle nem laços por vértice.
+"""
+import numpy as np
+
+_WKB_POLYGON = 3
+WKB_POLYGON_DTYPE = np.dtype([
+    ("order", "u1"), ("type", "<u4"), ("rings", "<u4"), ("points", "<u4"), ("xy", "<f8", (5, 2)),
+])
+
+
+def boxes_to_wkb_array(boxes):
+    """Array estruturado (N,) WKB_POLYGON_DTYPE das caixas (N, >=4) (xmin, ymin, xmax, ymax)."""
+    boxes = np.asarray(boxes, dtype=np.float64)
+    out = np.empty(len(boxes), dtype=WKB_POLYGON_DTYPE)
+    out["order"] = 1
+    out["type"] = _WKB_POLYGON
+    out["rings"] = 1
+    out["points"] = 5
+    x0, y0, x1, y1 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    xy = out["xy"]
+    xy[:, (0, 3, 4), 0] = x0[:, None]
+    xy[:, (1, 2), 0] = x1[:, None]
+    xy[:, (0, 1, 4), 1] = y0[:, None]
+    xy[:, (2, 3), 1] = y1[:, None]
+    return out
+
+
+def boxes_to_wkb(boxes):
+    """Lista de bytes WKB, um Polygon por caixa."""
+    buf = boxes_to_wkb_array(boxes).tobytes()
+    size = WKB_POLYGON_DTYPE.itemsize
+    return [buf[i:i + size] for i in range(0, len(buf), size)]
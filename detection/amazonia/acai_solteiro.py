@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Amazonia_Acai_Solteiro(BaseDetectionAlgorithm):
+class DET_Amazonia_Acai_Solteiro(PalmDetectionAlgorithm):
     BIOME = "Amazonia"
     CATEGORY = "Açaí-solteiro"
     ALG_ID = "netflora:amazonia_acai_solteiro"
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Amazonia_Acai_Touceira(BaseDetectionAlgorithm):
+class DET_Amazonia_Acai_Touceira(PalmDetectionAlgorithm):
     BIOME = "Amazonia"
     CATEGORY = "Açaí-touceira"
     ALG_ID = "netflora:amazonia_acai_touceira"
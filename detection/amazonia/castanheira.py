@@ -5,3 +5,6 @@ class DET_Amazonia_Castanheira(BaseDetectionAlgorithm):
     BIOME = "Amazonia"
     CATEGORY = "Castanha-do-brasil"
     ALG_ID = "netflora:amazonia_castanheira"
+
+    # Copas emergentes de castanheira passam facilmente de 20 m.
+    SIZE_FILTER = {"max_w": 60.0, "max_h": 60.0}
@@ -71,5 +71,11 @@ class DET_Amazonia_Geral(BaseDetectionAlgorithm):
     # Opcional: mantenha apenas se precisar remapear IDs do seu modelo.
     CLASS_MAP = {i: i for i in range(59)}
 
+    # Castanheiras (11, 12) têm copas emergentes maiores que o limite padrão de 20 m.
+    CLASS_SIZE_FILTERS = {
+        11: {"max_w": 60.0, "max_h": 60.0},
+        12: {"max_w": 60.0, "max_h": 60.0},
+    }
+
 
 
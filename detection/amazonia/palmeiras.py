@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Amazonia_Palmeiras(BaseDetectionAlgorithm):
+class DET_Amazonia_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Amazonia"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:amazonia_palmeiras"
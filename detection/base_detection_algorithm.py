@@ -1,28 +1,42 @@
 # -*- coding: utf-8 -*-
 import base64
+import hashlib
 import os
 import re
+import time
 import unicodedata
 
+import numpy as np
+
 from qgis.core import (
     QgsProcessingAlgorithm, QgsProcessingParameterRasterLayer,
     QgsProcessingParameterFeatureSink, QgsProcessingParameterNumber, QgsProcessingParameterBoolean,
-    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterFileDestination, QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum, QgsApplication,
     QgsProcessingContext, QgsProcessingException, QgsFeature, QgsFields, QgsField,
     QgsWkbTypes, QgsFeatureSink, QgsProcessing, QgsCoordinateReferenceSystem,
     QgsProcessingOutputVectorLayer, QgsProject, QgsRasterLayer, QgsProcessingUtils,
     QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer,
     QgsSimpleFillSymbolLayer, QgsVectorLayerSimpleLabeling,
-    QgsPalLayerSettings, QgsTextFormat, QgsTextBufferSettings, QgsFillSymbol
+    QgsPalLayerSettings, QgsTextFormat, QgsTextBufferSettings, QgsFillSymbol, QgsGeometry,
+    QgsRuleBasedRenderer,
 )
 from qgis.PyQt.QtCore import QVariant
 from qgis.PyQt.QtGui import QColor
 
-from ..common.model_manager import ensure_model_path
+from ..common.model_manager import ensure_model_path, model_target_gsd
 from ..common.preprocessing import run_preprocessing
 from ..common.inference import run_detection
+from ..common.session_cache import DEFAULT_BUDGET_MB
+from ..common.raw_cache import DEFAULT_MAX_MB as RAW_CACHE_MB
+from ..common.streaming import BatchWriter
+from ..common.wkb import boxes_to_wkb
+from ..common.detections import DetectionStore
+from ..common.export import EXPORT_FILE_FILTER, export_detections
 
 DOCS_URL = "https://github.com/karasinski-mauro/Netflora"
+# feições por chamada de addFeatures
+_WRITE_CHUNK = 10000
 
 
 def _logo_data_uri(filename: str) -> str:
@@ -48,25 +62,14 @@ def _norm_group_id(text: str) -> str:
     return s
 
 
-def _apply_detection_style(vlayer, prefer_field: str = "common_name"):
-    """
-    Categorization by common_name (fallback class_id), polygons without fill
-    and labels with white halo for better readability in QGIS 3.x.
-    """
-    if vlayer is None or not vlayer.isValid():
-        return
+# escala a partir da qual (mais perto) o estilo completo aparece no modo
+# dependente de escala; mais longe, só um contorno único, sem rótulos
+_DETAIL_MAX_SCALE = 5000
+_RENDERER_CACHE = {}
+_RENDERER_CACHE_SIZE = 32
 
-    field_names = vlayer.fields().names()
-    cat_field = prefer_field if prefer_field in field_names else "class_id"
-
-    seen = {}
-    for feature in vlayer.getFeatures():
-        value = feature[cat_field]
-        key = "" if value is None else str(value)
-        if key not in seen:
-            seen[key] = value
-    values = list(seen.values()) or [""]
 
+def _categorized_renderer(cat_field, values):
     categories = []
     total_values = max(1, len(values))
     for index, value in enumerate(values):
@@ -84,8 +87,63 @@ def _apply_detection_style(vlayer, prefer_field: str = "common_name"):
             }
         )
         categories.append(QgsRendererCategory(value, symbol, str(value)))
+    return QgsCategorizedSymbolRenderer(cat_field, categories)
+
 
-    vlayer.setRenderer(QgsCategorizedSymbolRenderer(cat_field, categories))
+def _scale_dependent_renderer(cat_field, values):
+    """
+    Regras por escala: perto de _DETAIL_MAX_SCALE, as categorias; mais
+    longe, um contorno fino único (um símbolo só, sem avaliar a categoria).
+    """
+    root = QgsRuleBasedRenderer.Rule(None)
+    detail = QgsRuleBasedRenderer.Rule(None, 0, _DETAIL_MAX_SCALE, "", "Detections (detail)")
+    QgsRuleBasedRenderer.refineRuleCategories(detail, _categorized_renderer(cat_field, values))
+    overview_symbol = QgsFillSymbol.createSimple(
+        {"color": "255,255,255,0", "outline_color": "255,170,0,255", "outline_width": "0.2",
+         "outline_width_unit": "MM"}
+    )
+    overview = QgsRuleBasedRenderer.Rule(overview_symbol, _DETAIL_MAX_SCALE, 0, "", "Detections (overview)")
+    root.appendChild(detail)
+    root.appendChild(overview)
+    return QgsRuleBasedRenderer(root)
+
+
+def _detection_renderer(cat_field, values, scale_dependent):
+    """Renderer montado uma vez por (campo, categorias, modo) e clonado para cada camada."""
+    key = (cat_field, tuple("" if v is None else str(v) for v in values), bool(scale_dependent))
+    renderer = _RENDERER_CACHE.get(key)
+    if renderer is None:
+        if len(_RENDERER_CACHE) >= _RENDERER_CACHE_SIZE:
+            _RENDERER_CACHE.clear()
+        renderer = (_scale_dependent_renderer if scale_dependent else _categorized_renderer)(cat_field, values)
+        _RENDERER_CACHE[key] = renderer
+    return renderer.clone()
+
+
+def _apply_detection_style(vlayer, prefer_field: str = "common_name", values=None,
+                           scale_dependent: bool = False):
+    """
+    Categorization by common_name (fallback class_id), polygons without fill
+    and labels with white halo for better readability in QGIS 3.x.
+
+    `values` are the category values when the caller already knows them
+    (class ids present in the detections); otherwise they come from the
+    provider's uniqueValues(), without iterating the features. With
+    `scale_dependent`, categories and labels are drawn only when zoomed in
+    past 1:_DETAIL_MAX_SCALE and a single cheap outline is used further out.
+    """
+    if vlayer is None or not vlayer.isValid():
+        return
+
+    field_names = vlayer.fields().names()
+    cat_field = prefer_field if prefer_field in field_names else "class_id"
+
+    if values is None:
+        values = sorted(vlayer.uniqueValues(vlayer.fields().indexOf(cat_field)),
+                        key=lambda v: (v is None, str(v)))
+    values = list(values) or [""]
+
+    vlayer.setRenderer(_detection_renderer(cat_field, values, scale_dependent))
 
     label_field = prefer_field if prefer_field in field_names else "class_id"
 
@@ -102,6 +160,10 @@ def _apply_detection_style(vlayer, prefer_field: str = "common_name"):
     label_settings.enabled = True
     label_settings.fieldName = label_field
     label_settings.setFormat(text_format)
+    if scale_dependent:
+        label_settings.scaleVisibility = True
+        label_settings.minimumScale = _DETAIL_MAX_SCALE
+        label_settings.maximumScale = 0
     try:
         label_settings.placement = QgsPalLayerSettings.PolygonInterior
     except Exception:
@@ -115,6 +177,26 @@ def _apply_detection_style(vlayer, prefer_field: str = "common_name"):
     vlayer.triggerRepaint()
 
 
+# campos da saída: (nome, tipo) com tipo "str" | "int" | "float"
+_FIELD_SPEC = [
+    ("biome", "str"), ("category", "str"), ("conf", "float"),
+    ("class_id", "int"), ("width", "float"), ("height", "float"),
+]
+_NAME_FIELD_SPEC = [("common_name", "str"), ("sci_name", "str")]
+_QVARIANT_TYPES = {"str": QVariant.String, "int": QVariant.Int, "float": QVariant.Double}
+
+
+def _field_spec(add_names: bool):
+    return _FIELD_SPEC + (_NAME_FIELD_SPEC if add_names else [])
+
+
+def _detection_fields(add_names: bool) -> QgsFields:
+    fields = QgsFields()
+    for name, kind in _field_spec(add_names):
+        fields.append(QgsField(name, _QVARIANT_TYPES[kind]))
+    return fields
+
+
 def _detection_help_html(biome: str, category: str, docs_url: str = DOCS_URL) -> str:
     summary = (
         f"Netflora detection tool for <b>{category}</b> in the <b>{biome}</b> biome. "
@@ -143,11 +225,42 @@ class BaseDetectionAlgorithm(QgsProcessingAlgorithm):
     O_SINK = "OUTPUT"
     P_REPORT = "GENERATE_REPORT"
     P_REPORT_PATH = "REPORT_PATH"
+    P_EXPORT_PATH = "EXPORT_PATH"
+    P_BATCH = "BATCH_SIZE"
+    P_READ_THREADS = "READ_THREADS"
+    P_PREP_THREADS = "PREPROCESS_THREADS"
+    P_NMS_PER_CLASS = "NMS_PER_CLASS"
+    P_NMS_IOU = "NMS_IOU"
+    P_SESSION_CACHE_MB = "SESSION_CACHE_MB"
+    P_WORKERS = "WORKERS"
+    P_WORKER_THREADS = "THREADS_PER_WORKER"
+    P_STRIP_READS = "STRIP_READS"
+    P_DECIMATED_READS = "DECIMATED_READS"
+    P_TARGET_GSD = "TARGET_GSD"
+    P_RESAMPLING = "RESAMPLING"
+    RESAMPLING_OPTIONS = ["bilinear", "average", "cubic", "nearest"]
+    P_AUTOTUNE = "AUTOTUNE"
+    P_CHECKPOINT = "CHECKPOINT"
+    P_INCREMENTAL = "INCREMENTAL"
+    P_RAW_CACHE_MB = "RAW_CACHE_MB"
+    P_STREAM = "STREAM_OUTPUT"
+    P_SPILL = "SPILL_TO_DISK"
+    P_SCALE_STYLE = "SCALE_DEPENDENT_STYLE"
 
     BIOME = "Biome"
     CATEGORY = "Category"
     ALG_ID = "netflora:base"
 
+    # Filtros de tamanho (unidades do mapa) e razão de aspecto das caixas.
+    # Chaves: min_w, max_w, min_h, max_h, min_ar, max_ar; o que não for
+    # sobrescrito usa common.inference.DEFAULT_SIZE_FILTER.
+    SIZE_FILTER = {}
+    # Ajustes por class_id do modelo, ex.: {11: {"max_w": 60.0}}
+    CLASS_SIZE_FILTERS = {}
+    # Maior objeto esperado (unidades do mapa); define a sobreposição entre
+    # janelas. None = maior caixa aceita pelos filtros de tamanho acima.
+    MAX_OBJECT_SIZE = None
+
     def name(self):
         return self.ALG_ID.split(":")[1]
 
@@ -195,6 +308,285 @@ class BaseDetectionAlgorithm(QgsProcessingAlgorithm):
                 self.P_REPORT_PATH, "Save report to", fileFilter="PDF files (*.pdf)", optional=True
             )
         )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.P_EXPORT_PATH, "Export detections to (FlatGeobuf / GeoParquet / GeoPackage)",
+                fileFilter=EXPORT_FILE_FILTER, optional=True, createByDefault=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_BATCH,
+                "Inference batch size (tiles per forward pass)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=64,
+                defaultValue=4,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_READ_THREADS,
+                "Raster reader threads",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=32,
+                defaultValue=2,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_PREP_THREADS,
+                "Pre-processing threads",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=32,
+                defaultValue=2,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_NMS_PER_CLASS,
+                "Remove duplicates only within the same class",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_NMS_IOU,
+                "Duplicate removal IoU threshold",
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0.0,
+                maxValue=1.0,
+                defaultValue=0.85,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_SESSION_CACHE_MB,
+                "Model session cache budget (MB, 0 = disabled)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=DEFAULT_BUDGET_MB,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_WORKERS,
+                "Worker processes (CPU, 1 = single process)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=256,
+                defaultValue=1,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_WORKER_THREADS,
+                "Intra-op threads per worker (0 = cores / workers)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                maxValue=256,
+                defaultValue=0,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_STRIP_READS,
+                "Read the raster in row strips (no re-reading of window overlap)",
+                defaultValue=True,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_DECIMATED_READS,
+                "Let GDAL read windows directly at the model input size (uses overviews)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_TARGET_GSD,
+                "Model ground sample distance (map units/pixel, 0 = from model registry)",
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0.0,
+                defaultValue=0.0,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterEnum(
+                self.P_RESAMPLING,
+                "Resampling for reduced reads",
+                options=self.RESAMPLING_OPTIONS,
+                defaultValue=0,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_AUTOTUNE,
+                "Auto-tune batch, threads, window and workers (calibrated once per model/CPU)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_CHECKPOINT,
+                "Save progress checkpoint (resume an interrupted run with the same parameters)",
+                defaultValue=True,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_INCREMENTAL,
+                "Incremental mode (re-run inference only on windows whose pixels changed since the last run)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_RAW_CACHE_MB,
+                f"Raw detection cache budget (MB, 0 = disabled, e.g. {RAW_CACHE_MB}; re-runs changing only "
+                "threshold/filters/IoU skip inference, at the cost of decoding windows unfiltered)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=0,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_STREAM,
+                "Stream detections to the output while the raster is processed (bounded memory; disables the raw cache)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_SPILL,
+                "Spill raw detections to a temporary SQLite/R-tree file (very large mosaics; disables the raw cache)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_SCALE_STYLE,
+                "Scale-dependent style (categories and labels only when zoomed in; faster panning on dense layers)",
+                defaultValue=False,
+            )
+        )
+
+    def detection_attributes(self, xmin, ymin, xmax, ymax, class_id, conf, add_names):
+        """Atributos de uma caixa, na ordem de _detection_fields(add_names)."""
+        width = round(float(xmax - xmin), 2)
+        height = round(float(ymax - ymin), 2)
+
+        attrs = [self.BIOME, self.CATEGORY, float(conf), int(class_id), width, height]
+        if add_names:
+            mapped = getattr(self, "CLASS_MAP", {}).get(int(class_id), int(class_id))
+            info = getattr(self, "CLASS_INFO", {}).get(
+                mapped, {"common_name": "", "sci_name": ""}
+            )
+            attrs.extend([info.get("common_name", ""), info.get("sci_name", "")])
+        return attrs
+
+    def class_name_lookup(self):
+        """
+        (common_name, sci_name) em arrays indexados por class_id do modelo,
+        já passando por CLASS_MAP; a última posição ("") atende ids fora da tabela.
+        """
+        if getattr(self, "_name_lookup", None) is None:
+            class_map = getattr(self, "CLASS_MAP", {})
+            class_info = getattr(self, "CLASS_INFO", {})
+            size = max(list(class_map) + list(class_info), default=-1) + 1
+            common = np.full(size + 1, "", dtype=object)
+            sci = np.full(size + 1, "", dtype=object)
+            for class_id in range(size):
+                info = class_info.get(class_map.get(class_id, class_id), {})
+                common[class_id] = info.get("common_name", "")
+                sci[class_id] = info.get("sci_name", "")
+            self._name_lookup = (common, sci)
+        return self._name_lookup
+
+    def class_names(self, class_id):
+        """Arrays (common_name, sci_name) para um array de class_id ("" fora da tabela)."""
+        common, sci = self.class_name_lookup()
+        idx = np.where((class_id >= 0) & (class_id < len(common) - 1), class_id, len(common) - 1)
+        return common[idx], sci[idx]
+
+    def detection_columns(self, boxes, add_names):
+        """Colunas de atributos (listas, na ordem de _detection_fields) das caixas (N, 6)."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        n = len(boxes)
+        class_id = boxes[:, 4].astype(np.int64)
+        columns = [
+            [self.BIOME] * n, [self.CATEGORY] * n, boxes[:, 5].tolist(), class_id.tolist(),
+            np.round(boxes[:, 2] - boxes[:, 0], 2).tolist(), np.round(boxes[:, 3] - boxes[:, 1], 2).tolist(),
+        ]
+        if add_names:
+            common, sci = self.class_names(class_id)
+            columns.extend([common.tolist(), sci.tolist()])
+        return columns
+
+    def report_columns(self, boxes, add_names):
+        """
+        Colunas (arrays) das caixas (N, 6) para common.report.generate_report,
+        com os mesmos valores gravados na camada, sem relê-la.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        class_id = boxes[:, 4].astype(np.int64)
+        columns = {
+            "class_id": class_id, "conf": boxes[:, 5],
+            "width": np.round(boxes[:, 2] - boxes[:, 0], 2), "height": np.round(boxes[:, 3] - boxes[:, 1], 2),
+        }
+        if add_names:
+            columns["common_name"], columns["sci_name"] = self.class_names(class_id)
+        return columns
+
+    def category_values(self, class_ids, add_names):
+        """
+        Valores do campo de categoria (common_name, ou class_id sem nomes)
+        para os class_id presentes, em ordem de class_id, sem ler a camada.
+        """
+        ids = np.unique(np.asarray(list(class_ids), dtype=np.int64))
+        if not add_names:
+            return ids.tolist()
+        return list(dict.fromkeys(self.class_names(ids)[0].tolist()))
+
+    def detection_table(self, boxes, add_names):
+        """Lista de (nome, tipo, valores) das caixas (N, 6), para export_detections."""
+        columns = self.detection_columns(boxes, add_names)
+        return [(name, kind, values) for (name, kind), values in zip(_field_spec(add_names), columns)]
+
+    def export_to_file(self, path, boxes, add_names, crs, feedback):
+        """Exportação colunar direta (common.export), com log de tempo."""
+        t0 = time.perf_counter()
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        method = export_detections(path, boxes, self.detection_table(boxes, add_names), crs.toWkt())
+        feedback.pushInfo(f"[Netflora] Exported {len(boxes)} detections to {path} "
+                          f"({method}, {time.perf_counter() - t0:.2f}s)")
+
+    def write_detections(self, sink, fields, boxes, add_names, chunk=_WRITE_CHUNK):
+        """
+        Grava as caixas (N, 6) em `sink` em blocos de addFeatures(FastInsert):
+        atributos por colunas e geometrias a partir de WKB montado em bloco.
+        Devolve o número de feições gravadas.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        for start in range(0, len(boxes), chunk):
+            part = boxes[start:start + chunk]
+            features = []
+            for attrs, wkb in zip(zip(*self.detection_columns(part, add_names)), boxes_to_wkb(part)):
+                feature = QgsFeature(fields)
+                feature.setAttributes(list(attrs))
+                geometry = QgsGeometry()
+                geometry.fromWkb(wkb)
+                feature.setGeometry(geometry)
+                features.append(feature)
+            sink.addFeatures(features, QgsFeatureSink.FastInsert)
+        return len(boxes)
+
+    def _add_advanced(self, param):
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
 
     def _resolve_model_path(self, params, context, plugin_root, feedback):
         alg_key = self.ALG_ID.split(":")[1]
@@ -203,9 +595,36 @@ class BaseDetectionAlgorithm(QgsProcessingAlgorithm):
         except Exception as exc:
             raise QgsProcessingException(str(exc))
 
-    def processAlgorithm(self, params, context: QgsProcessingContext, feedback):
-        from qgis.core import QgsGeometry, QgsRectangle, QgsFeature
+    def _checkpoint_path(self, params, context, raster_source):
+        """
+        Arquivo de checkpoint: ao lado da saída quando ela é um arquivo; para
+        saídas temporárias, na pasta de configurações do QGIS, com nome
+        derivado do raster e do algoritmo (a pasta temporária muda a cada sessão).
+        """
+        dest = ""
+        try:
+            dest = self.parameterAsOutputLayer(params, self.O_SINK, context) or ""
+        except Exception:
+            pass
+        dest = dest.split("|", 1)[0]
+        if dest.lower().startswith("ogr:") or dest.lower().startswith("memory:"):
+            dest = ""
+        temp_dir = os.path.realpath(QgsProcessingUtils.tempFolder())
+        if dest and os.path.isdir(os.path.dirname(dest) or "") and \
+                not os.path.realpath(dest).startswith(temp_dir + os.sep):
+            return os.path.splitext(dest)[0] + ".netflora-ckpt.sqlite"
+        return self._state_path("checkpoints", raster_source)
+
+    def _state_dir(self, kind):
+        """Pasta de estado `kind` na pasta de configurações do QGIS."""
+        return os.path.join(QgsApplication.qgisSettingsDirPath(), "netflora", kind)
+
+    def _state_path(self, kind, raster_source):
+        """Arquivo de estado por (raster, algoritmo) na pasta de configurações do QGIS."""
+        tag = hashlib.sha1(f"{os.path.realpath(raster_source)}|{self.ALG_ID}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self._state_dir(kind), f"{tag}.sqlite")
 
+    def processAlgorithm(self, params, context: QgsProcessingContext, feedback):
         add_to_project = self.parameterAsBool(params, self.P_ADD, context)
 
         raster = self.parameterAsRasterLayer(params, self.P_RASTER, context)
@@ -224,87 +643,148 @@ class BaseDetectionAlgorithm(QgsProcessingAlgorithm):
                 QgsProject.instance().addMapLayer(raster)
 
         conf_thr = self.parameterAsDouble(params, self.P_CONF, context)
+        batch_size = self.parameterAsInt(params, self.P_BATCH, context)
+        read_threads = self.parameterAsInt(params, self.P_READ_THREADS, context)
+        prep_threads = self.parameterAsInt(params, self.P_PREP_THREADS, context)
+        per_class_nms = self.parameterAsBool(params, self.P_NMS_PER_CLASS, context)
+        nms_iou = self.parameterAsDouble(params, self.P_NMS_IOU, context)
+        session_cache_mb = self.parameterAsInt(params, self.P_SESSION_CACHE_MB, context)
+        workers = self.parameterAsInt(params, self.P_WORKERS, context)
+        threads_per_worker = self.parameterAsInt(params, self.P_WORKER_THREADS, context)
+        strip_reads = self.parameterAsBool(params, self.P_STRIP_READS, context)
+        decimated_reads = self.parameterAsBool(params, self.P_DECIMATED_READS, context)
+        target_gsd = self.parameterAsDouble(params, self.P_TARGET_GSD, context)
+        resample = self.RESAMPLING_OPTIONS[self.parameterAsEnum(params, self.P_RESAMPLING, context)]
+        autotune = self.parameterAsBool(params, self.P_AUTOTUNE, context)
+        checkpoint = self.parameterAsBool(params, self.P_CHECKPOINT, context)
+        incremental = self.parameterAsBool(params, self.P_INCREMENTAL, context)
+        raw_cache_mb = self.parameterAsInt(params, self.P_RAW_CACHE_MB, context)
+        stream_output = self.parameterAsBool(params, self.P_STREAM, context)
+        spill = self.parameterAsBool(params, self.P_SPILL, context)
+        scale_style = self.parameterAsBool(params, self.P_SCALE_STYLE, context)
+        make_report = self.parameterAsBool(params, self.P_REPORT, context)
+        report_path = self.parameterAsFileOutput(params, self.P_REPORT_PATH, context) if make_report else ""
+        if make_report and not report_path:
+            raise QgsProcessingException("Report generation selected but no file path given.")
         feedback.pushInfo(f"[Netflora] Detection: {self.BIOME} / {self.CATEGORY}")
 
         plugin_root = os.path.dirname(os.path.dirname(__file__))
         model_path = self._resolve_model_path(params, context, plugin_root, feedback)
+        if decimated_reads and not target_gsd:
+            target_gsd = model_target_gsd(self.ALG_ID.split(":")[1], plugin_root) or 0.0
         feedback.pushInfo(f"[Netflora] Using model weight: {model_path}")
 
         raster_pp = run_preprocessing(raster, feedback)
 
-        boxes = run_detection(raster_pp, model_path, conf_thr, feedback)
-
-        fields = QgsFields()
-        fields.append(QgsField("biome", QVariant.String))
-        fields.append(QgsField("category", QVariant.String))
-        fields.append(QgsField("conf", QVariant.Double))
-        fields.append(QgsField("class_id", QVariant.Int))
-        fields.append(QgsField("width", QVariant.Double))
-        fields.append(QgsField("height", QVariant.Double))
-
         add_names = hasattr(self, "CLASS_INFO")
-        if add_names:
-            fields.append(QgsField("common_name", QVariant.String))
-            fields.append(QgsField("sci_name", QVariant.String))
+        fields = _detection_fields(add_names)
 
         sink, dest_id = self.parameterAsSink(
             params, self.O_SINK, context, fields, QgsWkbTypes.Polygon, raster_pp.crs()
         )
 
-        for xmin, ymin, xmax, ymax, class_id, conf in boxes:
-            width = round(float(xmax - xmin), 2)
-            height = round(float(ymax - ymin), 2)
+        export_path = self.parameterAsFileOutput(params, self.P_EXPORT_PATH, context)
 
-            attrs = [self.BIOME, self.CATEGORY, float(conf), int(class_id), width, height]
-            if add_names:
-                mapped = getattr(self, "CLASS_MAP", {}).get(int(class_id), int(class_id))
-                info = getattr(self, "CLASS_INFO", {}).get(
-                    mapped, {"common_name": "", "sci_name": ""}
-                )
-                attrs.extend([info.get("common_name", ""), info.get("sci_name", "")])
+        # modo streaming: lotes de caixas finais vão para a saída numa thread
+        # de gravação enquanto a detecção continua; com exportação ou relatório,
+        # as caixas também ficam num DetectionStore (compacto) para eles
+        writer = None
+        streamed = None
+        present = set()  # class_id presentes, para o estilo sem varrer a camada
+        if stream_output:
+            if export_path or make_report:
+                extent = raster_pp.extent()
+                streamed = DetectionStore((extent.xMinimum(), extent.yMaximum()))
 
-            feature = QgsFeature(fields)
-            feature.setAttributes(attrs)
-            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(xmin, ymin, xmax, ymax)))
-            sink.addFeature(feature)
+            def _write(batch):
+                self.write_detections(sink, fields, batch, add_names)
+                present.update(np.unique(batch[:, 4]).astype(np.int64).tolist())
+                if streamed is not None:
+                    streamed.append(batch)
 
-        feedback.pushInfo("[Netflora] Detection pipeline complete (polygons).")
+            writer = BatchWriter(_write)
 
         try:
-            out_layer_now = QgsProcessingUtils.mapLayerFromString(dest_id, context)
-            if out_layer_now is not None and out_layer_now.isValid():
-                _apply_detection_style(out_layer_now, prefer_field="common_name")
-        except Exception as exc:
-            feedback.reportError(f"[Netflora] Styling skipped: {exc}", fatalError=False)
-
-        if self.parameterAsBool(params, self.P_REPORT, context):
-            report_path = self.parameterAsFileOutput(params, self.P_REPORT_PATH, context)
-            if not report_path:
-                raise QgsProcessingException("Report generation selected but no file path given.")
-
-            try:
-                out_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
-            except Exception:
-                out_layer = None
-            if out_layer is None or not out_layer.isValid():
-                raise QgsProcessingException("Could not reopen output layer for report generation.")
+            boxes = run_detection(
+                raster_pp, model_path, conf_thr, feedback,
+                batch_size=batch_size, read_threads=read_threads, prep_threads=prep_threads,
+                per_class_nms=per_class_nms,
+                size_filter=self.SIZE_FILTER, class_size_filters=self.CLASS_SIZE_FILTERS,
+                session_cache_mb=session_cache_mb,
+                workers=workers, threads_per_worker=threads_per_worker,
+                strip_reads=strip_reads,
+                max_object_size=self.MAX_OBJECT_SIZE,
+                classes=list(self.CLASS_INFO) if hasattr(self, "CLASS_INFO") else None,
+                decimated_reads=decimated_reads, target_gsd=target_gsd or None, resample=resample,
+                autotune=autotune,
+                autotune_cache=os.path.join(QgsApplication.qgisSettingsDirPath(), "netflora", "autotune.json"),
+                checkpoint_path=self._checkpoint_path(params, context, raster_pp.source()) if checkpoint else None,
+                incremental_dir=self._state_dir("incremental") if incremental else None,
+                raw_cache_dir=os.path.join(QgsApplication.qgisSettingsDirPath(), "netflora", "rawcache"),
+                raw_cache_mb=raw_cache_mb, nms_iou=nms_iou,
+                on_detections=writer.put if writer is not None else None,
+                spill_path=QgsProcessingUtils.generateTempFilename("netflora_spill.sqlite") if spill else None,
+            )
+        finally:
+            if writer is not None:
+                writer.close()
 
+        if writer is not None:
+            written, seconds = writer.count, writer.seconds
+            feedback.pushInfo(f"[Netflora] {written} features written while detecting (streaming)")
+        else:
+            t0 = time.perf_counter()
+            present.update(np.unique(boxes.records["cls"]).tolist())
+            written = self.write_detections(sink, fields, boxes.boxes(), add_names)
+            seconds = time.perf_counter() - t0
+        if written:
+            feedback.pushInfo(f"[Netflora] Wrote {written} features in {seconds:.2f}s "
+                              f"({written / max(seconds, 1e-6):,.0f} features/s)")
+
+        results = {self.O_SINK: dest_id}
+        final = streamed if streamed is not None else boxes
+        if export_path:
             try:
-                _apply_detection_style(out_layer, prefer_field="common_name")
+                self.export_to_file(export_path, final.boxes(), add_names, raster_pp.crs(), feedback)
+                results[self.P_EXPORT_PATH] = export_path
             except Exception as exc:
-                feedback.reportError(f"[Netflora] Styling (late) skipped: {exc}", fatalError=False)
+                feedback.reportError(f"[Netflora] Export failed: {exc}", fatalError=False)
+
+        feedback.pushInfo("[Netflora] Detection pipeline complete (polygons).")
+
+        style_values = self.category_values(present, add_names)
+        try:
+            out_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
+            if out_layer is not None and out_layer.isValid():
+                _apply_detection_style(out_layer, prefer_field="common_name",
+                                       values=style_values, scale_dependent=scale_style)
+        except Exception as exc:
+            feedback.reportError(f"[Netflora] Styling skipped: {exc}", fatalError=False)
 
+        if make_report:
+            # relatório direto dos arrays das detecções, sem reabrir a camada
             try:
                 from ..common.report import generate_report
 
-                generate_report(out_layer, raster, self.BIOME, self.CATEGORY, report_path)
-                feedback.pushInfo(f"[Netflora] Report saved to: {report_path}")
+                t0 = time.perf_counter()
+                generate_report(None, raster, self.BIOME, self.CATEGORY, report_path,
+                                detections=self.report_columns(final.boxes(), add_names))
+                feedback.pushInfo(f"[Netflora] Report saved to: {report_path} "
+                                  f"({time.perf_counter() - t0:.2f}s)")
             except Exception as exc:
                 feedback.reportError(
                     f"[Netflora] Report generation failed: {exc}", fatalError=False
                 )
 
-        return {self.O_SINK: dest_id}
+        return results
 
     def createInstance(self):
         return self.__class__()
+
+
+class PalmDetectionAlgorithm(BaseDetectionAlgorithm):
+    """Base dos algoritmos de palmeiras (inclui açaí solteiro e touceira)."""
+
+    # Copas de palmeira raramente passam de 15 m; 20 m dá folga e ainda
+    # reduz a sobreposição entre janelas.
+    MAX_OBJECT_SIZE = 20.0
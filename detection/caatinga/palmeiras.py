@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Caatinga_Palmeiras(BaseDetectionAlgorithm):
+class DET_Caatinga_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Caatinga"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:caatinga_palmeiras"
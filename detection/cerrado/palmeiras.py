@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Cerrado_Palmeiras(BaseDetectionAlgorithm):
+class DET_Cerrado_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Cerrado"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:cerrado_palmeiras"
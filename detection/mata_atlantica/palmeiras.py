@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_MA_Palmeiras(BaseDetectionAlgorithm):
+class DET_MA_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Mata Atlantica"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:mata_atlantica_palmeiras"
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import numpy as np
+from qgis.core import (
+    QgsProcessingParameterRasterLayer, QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSink, QgsProcessingParameterNumber, QgsProcessingParameterBoolean,
+    QgsProcessingOutputMultipleLayers, QgsProcessingContext, QgsProcessingException,
+    QgsProcessingParameterFileDestination,
+    QgsProcessing, QgsProcessingUtils, QgsProject, QgsRasterLayer, QgsVectorLayer, QgsWkbTypes,
+)
+
+from ..common.preprocessing import run_preprocessing
+from ..common.inference import run_multi_detection
+from ..common.session_cache import DEFAULT_BUDGET_MB
+from ..common.export import EXPORT_FILE_FILTER, export_detections
+from .base_detection_algorithm import (
+    BaseDetectionAlgorithm, _apply_detection_style, _detection_fields, _logo_data_uri, DOCS_URL,
+)
+
+
+class DET_MultiModel(BaseDetectionAlgorithm):
+    """
+    Vários algoritmos de detecção numa passada só pelo raster: cada janela é
+    lida e pré-processada uma vez e o tensor vai para o modelo de cada
+    algoritmo escolhido. Saída: uma camada por modelo ou uma camada única
+    em que o campo `category` identifica o modelo.
+    """
+
+    P_MODELS = "MODELS"
+    P_MERGE = "MERGE_OUTPUT"
+    P_PARALLEL = "PARALLEL_MODELS"
+    O_LAYERS = "OUTPUT_LAYERS"
+
+    BIOME = "Multi-model"
+    CATEGORY = "Multiple models (single pass)"
+    ALG_ID = "netflora:multi_model"
+
+    def __init__(self, detectors=()):
+        super().__init__()
+        # classes de BaseDetectionAlgorithm oferecidas no parâmetro MODELS
+        self._detectors = list(detectors)
+
+    def createInstance(self):
+        return self.__class__(self._detectors)
+
+    def group(self):
+        return "Detection - Multi-model"
+
+    def groupId(self):
+        return "netflora_detection_multi_model"
+
+    def shortHelpString(self):
+        return (
+            f'<div style="font-family:Segoe UI, Arial, sans-serif; line-height:1.45;">'
+            f'<div style="text-align:center; margin-bottom:10px;">'
+            f'<img src="{_logo_data_uri("Netflora.png")}" width="180" style="margin:0 8px 12px 8px;"></div>'
+            f"<h3>Netflora Detection - Multiple models</h3>"
+            f"<p>Runs several Netflora detection models on the same raster in a single pass: "
+            f"each window is read and pre-processed once and shared by all selected models.</p>"
+            f"<p><b>Outputs:</b> one polygon layer per model, or a merged layer where the "
+            f"<i>category</i> field tells which model produced each detection.</p>"
+            f'<p><a href="{DOCS_URL}">Complete documentation / Documentacao completa</a></p>'
+            f"</div>"
+        )
+
+    def _model_label(self, cls):
+        return f"{cls.BIOME} / {cls.CATEGORY} ({cls.ALG_ID})"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterRasterLayer(self.P_RASTER, "Raster (input)"))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.P_MODELS,
+                "Models",
+                options=[self._model_label(cls) for cls in self._detectors],
+                allowMultiple=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.P_CONF,
+                "Confidence threshold",
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0.0,
+                maxValue=1.0,
+                defaultValue=0.05,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.P_ADD, "Add input raster to project", defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.P_MERGE, "Merge all models into one layer (category field)", defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.O_SINK, "Merged detections (boxes)", type=QgsProcessing.TypeVectorPolygon,
+                optional=True, createByDefault=False,
+            )
+        )
+        self.addOutput(QgsProcessingOutputMultipleLayers(self.O_LAYERS, "Detections per model"))
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.P_EXPORT_PATH, "Export all detections to (FlatGeobuf / GeoParquet / GeoPackage)",
+                fileFilter=EXPORT_FILE_FILTER, optional=True, createByDefault=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_BATCH,
+                "Inference batch size (tiles per forward pass)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=64,
+                defaultValue=4,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_READ_THREADS,
+                "Raster reader threads",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=32,
+                defaultValue=2,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_PREP_THREADS,
+                "Pre-processing threads",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                maxValue=32,
+                defaultValue=2,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_PARALLEL,
+                "Run the models concurrently on each batch (one thread per model)",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_NMS_PER_CLASS,
+                "Remove duplicates only within the same class",
+                defaultValue=False,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_NMS_IOU,
+                "Duplicate removal IoU threshold",
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0.0,
+                maxValue=1.0,
+                defaultValue=0.85,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterNumber(
+                self.P_SESSION_CACHE_MB,
+                "Model session cache budget (MB, 0 = disabled)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=DEFAULT_BUDGET_MB,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_STRIP_READS,
+                "Read the raster in row strips (no re-reading of window overlap)",
+                defaultValue=True,
+            )
+        )
+        self._add_advanced(
+            QgsProcessingParameterBoolean(
+                self.P_SCALE_STYLE,
+                "Scale-dependent style (categories and labels only when zoomed in; faster panning on dense layers)",
+                defaultValue=False,
+            )
+        )
+
+    def _memory_layer(self, name, fields, crs):
+        layer = QgsVectorLayer("Polygon", name, "memory")
+        layer.setCrs(crs)
+        layer.dataProvider().addAttributes(fields.toList())
+        layer.updateFields()
+        return layer
+
+    def processAlgorithm(self, params, context: QgsProcessingContext, feedback):
+        add_to_project = self.parameterAsBool(params, self.P_ADD, context)
+
+        raster = self.parameterAsRasterLayer(params, self.P_RASTER, context)
+        if raster is None:
+            src = self.parameterAsString(params, self.P_RASTER, context)
+            if not src:
+                raise QgsProcessingException("Raster input is required.")
+            raster = QgsRasterLayer(src, os.path.splitext(os.path.basename(src))[0])
+            if not raster.isValid():
+                raise QgsProcessingException(f"Failed to open raster: {src}")
+            if add_to_project:
+                QgsProject.instance().addMapLayer(raster)
+        elif add_to_project and raster.id() not in QgsProject.instance().mapLayers():
+            QgsProject.instance().addMapLayer(raster)
+
+        selected = self.parameterAsEnums(params, self.P_MODELS, context)
+        if not selected:
+            raise QgsProcessingException("Select at least one model.")
+        detectors = [self._detectors[i]() for i in selected]
+        merge = self.parameterAsBool(params, self.P_MERGE, context)
+
+        plugin_root = os.path.dirname(os.path.dirname(__file__))
+        specs = []
+        for det in detectors:
+            feedback.pushInfo(f"[Netflora] Detection: {det.BIOME} / {det.CATEGORY}")
+            model_path = det._resolve_model_path(params, context, plugin_root, feedback)
+            feedback.pushInfo(f"[Netflora] Using model weight: {model_path}")
+            specs.append({
+                "model_path": model_path,
+                "size_filter": det.SIZE_FILTER,
+                "class_size_filters": det.CLASS_SIZE_FILTERS,
+                "max_object_size": det.MAX_OBJECT_SIZE,
+                "classes": list(det.CLASS_INFO) if hasattr(det, "CLASS_INFO") else None,
+            })
+
+        raster_pp = run_preprocessing(raster, feedback)
+
+        per_model = run_multi_detection(
+            raster_pp, specs, self.parameterAsDouble(params, self.P_CONF, context), feedback,
+            batch_size=self.parameterAsInt(params, self.P_BATCH, context),
+            read_threads=self.parameterAsInt(params, self.P_READ_THREADS, context),
+            prep_threads=self.parameterAsInt(params, self.P_PREP_THREADS, context),
+            per_class_nms=self.parameterAsBool(params, self.P_NMS_PER_CLASS, context),
+            session_cache_mb=self.parameterAsInt(params, self.P_SESSION_CACHE_MB, context),
+            strip_reads=self.parameterAsBool(params, self.P_STRIP_READS, context),
+            parallel_models=self.parameterAsBool(params, self.P_PARALLEL, context),
+            nms_iou=self.parameterAsDouble(params, self.P_NMS_IOU, context),
+        )
+
+        results = {}
+        t0 = time.perf_counter()
+        if merge:
+            fields = _detection_fields(True)
+            sink, dest_id = self.parameterAsSink(
+                params, self.O_SINK, context, fields, QgsWkbTypes.Polygon, raster_pp.crs()
+            )
+            if sink is None:
+                raise QgsProcessingException("Merged output selected but no destination given.")
+            for det, boxes in zip(detectors, per_model):
+                det.write_detections(sink, fields, boxes.boxes(), True)
+            results[self.O_SINK] = dest_id
+            layer_ids = []
+        else:
+            layer_ids = []
+            for det, boxes in zip(detectors, per_model):
+                add_names = hasattr(det, "CLASS_INFO")
+                fields = _detection_fields(add_names)
+                name = f"{det.BIOME} - {det.CATEGORY}"
+                layer = self._memory_layer(name, fields, raster_pp.crs())
+                det.write_detections(layer.dataProvider(), fields, boxes.boxes(), add_names)
+                layer.updateExtents()
+                context.temporaryLayerStore().addMapLayer(layer)
+                context.addLayerToLoadOnCompletion(
+                    layer.id(), QgsProcessingContext.LayerDetails(name, context.project(), self.O_LAYERS)
+                )
+                layer_ids.append(layer.id())
+                feedback.pushInfo(f"[Netflora] {name}: {len(boxes)} detections")
+        results[self.O_LAYERS] = layer_ids
+        written = sum(len(boxes) for boxes in per_model)
+        seconds = time.perf_counter() - t0
+        if written:
+            feedback.pushInfo(f"[Netflora] Wrote {written} features in {seconds:.2f}s "
+                              f"({written / max(seconds, 1e-6):,.0f} features/s)")
+
+        export_path = self.parameterAsFileOutput(params, self.P_EXPORT_PATH, context)
+        if export_path:
+            # uma tabela só, como a camada mesclada: `category` identifica o modelo
+            try:
+                t0 = time.perf_counter()
+                tables = [det.detection_table(boxes.boxes(), True) for det, boxes in zip(detectors, per_model)]
+                table = [(name, kind, [v for t in tables for v in t[i][2]])
+                         for i, (name, kind, _) in enumerate(tables[0])]
+                all_boxes = np.concatenate([boxes.boxes() for boxes in per_model], axis=0)
+                method = export_detections(export_path, all_boxes, table, raster_pp.crs().toWkt())
+                feedback.pushInfo(f"[Netflora] Exported {len(all_boxes)} detections to {export_path} "
+                                  f"({method}, {time.perf_counter() - t0:.2f}s)")
+                results[self.P_EXPORT_PATH] = export_path
+            except Exception as exc:
+                feedback.reportError(f"[Netflora] Export failed: {exc}", fatalError=False)
+
+        feedback.pushInfo("[Netflora] Detection pipeline complete (polygons).")
+
+        # categorias a partir dos class_id de cada modelo, sem varrer as camadas
+        classes = [np.unique(boxes.records["cls"]).tolist() for boxes in per_model]
+        if merge:
+            merged = [v for det, ids in zip(detectors, classes) for v in det.category_values(ids, True)]
+            styles = [(results[self.O_SINK], list(dict.fromkeys(merged)))]
+        else:
+            styles = [(layer_id, det.category_values(ids, hasattr(det, "CLASS_INFO")))
+                      for layer_id, det, ids in zip(layer_ids, detectors, classes)]
+        scale_style = self.parameterAsBool(params, self.P_SCALE_STYLE, context)
+        for layer_id, layer_values in styles:
+            try:
+                layer = QgsProcessingUtils.mapLayerFromString(layer_id, context)
+                if layer is not None and layer.isValid():
+                    _apply_detection_style(layer, prefer_field="common_name",
+                                           values=layer_values, scale_dependent=scale_style)
+            except Exception as exc:
+                feedback.reportError(f"[Netflora] Styling skipped: {exc}", fatalError=False)
+
+        return results
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Pampa_Palmeiras(BaseDetectionAlgorithm):
+class DET_Pampa_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Pampa"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:pampa_palmeiras"
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from ..base_detection_algorithm import BaseDetectionAlgorithm
+from ..base_detection_algorithm import PalmDetectionAlgorithm
 
-class DET_Pantanal_Palmeiras(BaseDetectionAlgorithm):
+class DET_Pantanal_Palmeiras(PalmDetectionAlgorithm):
     BIOME = "Pantanal"
     CATEGORY = "Palmeiras"
     ALG_ID = "netflora:pantanal_palmeiras"
@@ -29,6 +29,17 @@ from .detection.pantanal.palmeiras import DET_Pantanal_Palmeiras
 from .detection.pampa.palmeiras import DET_Pampa_Palmeiras
 
 from .detection.custom.custom import DET_Custom 
+from .detection.multi_detection_algorithm import DET_MultiModel
+
+# algoritmos oferecidos na detecção com vários modelos numa passada
+MULTI_MODEL_DETECTORS = [
+    DET_Amazonia_Madeireiros, DET_Amazonia_NaoMadeireiros, DET_Amazonia_Palmeiras,
+    DET_Amazonia_Ecologico, DET_Amazonia_Acai_Touceira, DET_Amazonia_Acai_Solteiro,
+    DET_Amazonia_Castanheira, DET_Amazonia_Invasora, DET_Amazonia_Geral,
+    DET_Cerrado_Carvao, DET_Cerrado_NaoMadeireiros, DET_Cerrado_Palmeiras,
+    DET_MA_Madeireiro, DET_MA_NaoMadeireiro, DET_MA_Palmeiras, DET_MA_Araucaria,
+    DET_Caatinga_Palmeiras, DET_Pantanal_Palmeiras, DET_Pampa_Palmeiras,
+]
 
 
 def _icon_path_png():
@@ -120,6 +131,9 @@ class NetfloraProvider(QgsProcessingProvider):
         # Pampa
         self.addAlgorithm(DET_Pampa_Palmeiras())
 
+        # Vários modelos numa passada pelo raster
+        self.addAlgorithm(DET_MultiModel(MULTI_MODEL_DETECTORS))
+
         #Custom
                 # CUSTOM (import local + proteção)
         try: